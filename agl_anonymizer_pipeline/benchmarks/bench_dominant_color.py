@@ -0,0 +1,103 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from box_operations import extend_boxes_if_needed
+
+'''
+Dominant Color Benchmark
+
+Times extend_boxes_if_needed (five dominant colors per box) with the former
+cv2.kmeans implementation and with the DominantColorEngine methods, on a
+synthetic overlay frame or on a real image.
+
+Run from the agl_anonymizer_pipeline directory:
+
+python benchmarks/bench_dominant_color.py -n 40
+python benchmarks/bench_dominant_color.py -i images/frame.png -n 40
+'''
+
+
+def kmeans_dominant_color(image, box):
+    # The former k-means implementation of get_dominant_color
+    (startX, startY, endX, endY) = box
+    region = image[startY:endY, startX:endX]
+    pixels = np.float32(region.reshape(-1, 3))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 200, 0.1)
+    _, labels, palette = cv2.kmeans(pixels, 1, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+    _, counts = np.unique(labels, return_counts=True)
+    return tuple(map(int, palette[np.argmax(counts)]))
+
+
+def kmeans_extend_boxes(image, boxes, extension_margin=10, color_threshold=30):
+    # The former per-box loop of extend_boxes_if_needed
+    extended_boxes = []
+    for (startX, startY, endX, endY) in boxes:
+        dominant_color = np.array(kmeans_dominant_color(image, (startX, startY, endX, endY)))
+        if startY - extension_margin > 0:
+            color = kmeans_dominant_color(image, (startX, startY - extension_margin, endX, startY))
+            if np.linalg.norm(np.array(color) - dominant_color) > color_threshold:
+                startY = max(startY - extension_margin, 0)
+        if endY + extension_margin < image.shape[0]:
+            color = kmeans_dominant_color(image, (startX, endY, endX, endY + extension_margin))
+            if np.linalg.norm(np.array(color) - dominant_color) > color_threshold:
+                endY = min(endY + extension_margin, image.shape[0])
+        if startX - extension_margin > 0:
+            color = kmeans_dominant_color(image, (startX - extension_margin, startY, startX, endY))
+            if np.linalg.norm(np.array(color) - dominant_color) > color_threshold:
+                startX = max(startX - extension_margin, 0)
+        if endX + extension_margin < image.shape[1]:
+            color = kmeans_dominant_color(image, (endX, startY, endX + extension_margin, endY))
+            if np.linalg.norm(np.array(color) - dominant_color) > color_threshold:
+                endX = min(endX + extension_margin, image.shape[1])
+        extended_boxes.append((startX, startY, endX, endY))
+    return extended_boxes
+
+
+def make_frame(num_boxes, seed=0):
+    rng = np.random.default_rng(seed)
+    image = rng.integers(0, 40, size=(1080, 1920, 3), dtype=np.uint8)
+    boxes = []
+    for _ in range(num_boxes):
+        (x, y) = (int(rng.integers(20, 1700)), int(rng.integers(20, 1020)))
+        (w, h) = (int(rng.integers(60, 200)), int(rng.integers(20, 40)))
+        image[y:y + h, x:x + w] = rng.integers(180, 255, size=3)
+        boxes.append((x + 5, y + 3, x + w - 5, y + h - 3))
+    return image, boxes
+
+
+def time_call(func, repeats, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--image", type=str, default=None, help="optional real image, boxes are still random")
+    ap.add_argument("-n", "--num-boxes", type=int, default=40, help="number of boxes per frame")
+    ap.add_argument("-r", "--repeats", type=int, default=5, help="number of timed repetitions")
+    args = vars(ap.parse_args())
+
+    image, boxes = make_frame(args["num_boxes"])
+    if args["image"]:
+        image = cv2.resize(cv2.imread(args["image"]), (1920, 1080))
+
+    reference = kmeans_extend_boxes(image, boxes)
+    kmeans_time = time_call(kmeans_extend_boxes, args["repeats"], image, boxes)
+    print(f"{len(boxes)} boxes, {image.shape[1]}x{image.shape[0]} frame")
+    print(f"{'cv2.kmeans':<12} {kmeans_time * 1000:9.2f} ms")
+
+    for method in ("mean", "median", "histogram"):
+        method_time = time_call(extend_boxes_if_needed, args["repeats"], image, boxes, 10, 30, method)
+        same = sum(a == b for a, b in zip(extend_boxes_if_needed(image, boxes, method=method), reference))
+        print(f"{method:<12} {method_time * 1000:9.2f} ms  ({kmeans_time / method_time:6.1f}x, {same}/{len(boxes)} boxes identical to k-means)")
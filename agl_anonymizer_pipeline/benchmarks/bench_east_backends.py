@@ -0,0 +1,64 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from east_text_detection import east_text_detection, get_east_net, east_model_path, DNN_BACKENDS, DNN_TARGETS
+from model_registry import registry
+
+'''
+EAST Backend Benchmark
+
+Prints the per-frame EAST detection latency for every combination of OpenCV DNN
+backend, target and thread count. The network is loaded once per backend/target
+combination (load time is printed separately) and warmed up before timing.
+Combinations the local OpenCV build cannot run are reported as unsupported.
+
+Run from the agl_anonymizer_pipeline directory:
+
+python benchmarks/bench_east_backends.py -i images/frame.png -w 1280 -e 704 -t 1,4,0
+'''
+
+
+def parse_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--image", type=str, required=True, help="path to input image")
+    ap.add_argument("-east", "--east", type=str, default=str(east_model_path), help="path to the EAST model")
+    ap.add_argument("-w", "--width", type=int, default=320, help="resized image width (multiple of 32)")
+    ap.add_argument("-e", "--height", type=int, default=320, help="resized image height (multiple of 32)")
+    ap.add_argument("-b", "--backends", type=str, default="default,opencv", help=f"comma separated, any of {list(DNN_BACKENDS)}")
+    ap.add_argument("-g", "--targets", type=str, default="cpu,cpu_fp16", help=f"comma separated, any of {list(DNN_TARGETS)}")
+    ap.add_argument("-t", "--threads", type=str, default="1,0", help="comma separated cv2.setNumThreads values, 0 disables threading")
+    ap.add_argument("-r", "--repeats", type=int, default=10, help="number of timed frames per combination")
+    args = vars(ap.parse_args())
+
+    default_threads = cv2.getNumThreads()
+    print(f"OpenCV {cv2.__version__}, default threads: {default_threads}")
+    print(f"{'backend':<10} {'target':<12} {'threads':>7} {'load ms':>9} {'ms/frame':>9}")
+
+    for backend in parse_list(args["backends"]):
+        for target in parse_list(args["targets"]):
+            registry.clear("east")
+            start = time.perf_counter()
+            get_east_net(args["east"], backend, target)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            for threads in [int(t) for t in parse_list(args["threads"])]:
+                try:
+                    # Warm-up frame, the first forward pass initializes the backend
+                    east_text_detection(args["image"], args["east"], 0.5, args["width"], args["height"], backend, target, threads)
+                    start = time.perf_counter()
+                    for _ in range(args["repeats"]):
+                        east_text_detection(args["image"], args["east"], 0.5, args["width"], args["height"], backend, target, threads)
+                    frame_ms = (time.perf_counter() - start) * 1000 / args["repeats"]
+                    print(f"{backend:<10} {target:<12} {threads:>7} {load_ms:>9.1f} {frame_ms:>9.2f}")
+                except cv2.error as e:
+                    print(f"{backend:<10} {target:<12} {threads:>7} {'unsupported':>19} ({str(e).strip().splitlines()[-1]})")
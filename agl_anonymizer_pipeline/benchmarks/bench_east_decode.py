@@ -0,0 +1,111 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from east_text_detection import decode_predictions
+
+'''
+EAST Decoding Benchmark
+
+Compares the vectorized decode_predictions against the nested row/column loop
+that east_text_detection used before. The score and geometry maps are random,
+with roughly --density of the cells above the confidence threshold, sized like
+the EAST output for the given --width/--height (one cell per 4x4 pixels).
+
+Run from the agl_anonymizer_pipeline directory:
+
+python benchmarks/bench_east_decode.py -w 1280 -e 704
+'''
+
+
+def decode_predictions_loop(scores, geometry, min_confidence=0.5):
+    # Reference implementation, the loop previously inlined in east_text_detection
+    (numRows, numCols) = scores.shape[2:4]
+    rects = []
+    confidences = []
+
+    for y in range(0, numRows):
+        scoresData = scores[0, 0, y]
+        xData0 = geometry[0, 0, y]
+        xData1 = geometry[0, 1, y]
+        xData2 = geometry[0, 2, y]
+        xData3 = geometry[0, 3, y]
+        anglesData = geometry[0, 4, y]
+
+        for x in range(0, numCols):
+            if scoresData[x] < min_confidence:
+                continue
+
+            (offsetX, offsetY) = (x * 4.0, y * 4.0)
+
+            angle = anglesData[x]
+            cos = np.cos(angle)
+            sin = np.sin(angle)
+
+            h = xData0[x] + xData2[x]
+            w = xData1[x] + xData3[x]
+
+            endX = int(offsetX + (cos * xData1[x]) + (sin * xData2[x]))
+            endY = int(offsetY - (sin * xData1[x]) + (cos * xData2[x]))
+            startX = int(endX - w)
+            startY = int(endY - h)
+
+            rects.append((startX, startY, endX, endY))
+            confidences.append(scoresData[x])
+
+    return rects, confidences
+
+
+def make_maps(width, height, density, seed=0):
+    rng = np.random.default_rng(seed)
+    (numRows, numCols) = (height // 4, width // 4)
+    scores = np.zeros((1, 1, numRows, numCols), dtype=np.float32)
+    mask = rng.random((numRows, numCols)) < density
+    scores[0, 0][mask] = rng.uniform(0.5, 1.0, mask.sum())
+    scores[0, 0][~mask] = rng.uniform(0.0, 0.5, (~mask).sum())
+
+    geometry = np.empty((1, 5, numRows, numCols), dtype=np.float32)
+    geometry[0, :4] = rng.uniform(0.0, 40.0, (4, numRows, numCols))
+    geometry[0, 4] = rng.uniform(-np.pi / 8, np.pi / 8, (numRows, numCols))
+    return scores, geometry
+
+
+def time_call(func, repeats, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-w", "--width", type=int, default=1280, help="resized image width (multiple of 32)")
+    ap.add_argument("-e", "--height", type=int, default=704, help="resized image height (multiple of 32)")
+    ap.add_argument("-c", "--min-confidence", type=float, default=0.5, help="minimum probability of a cell")
+    ap.add_argument("--density", type=float, default=0.05, help="fraction of cells above the threshold")
+    ap.add_argument("-r", "--repeats", type=int, default=5, help="number of timed repetitions")
+    args = vars(ap.parse_args())
+
+    scores, geometry = make_maps(args["width"], args["height"], args["density"])
+
+    rects_loop, conf_loop = decode_predictions_loop(scores, geometry, args["min_confidence"])
+    rects_vec, conf_vec = decode_predictions(scores, geometry, args["min_confidence"])
+    max_diff = np.abs(np.array(rects_loop).reshape(-1, 4) - rects_vec).max() if len(rects_vec) else 0
+    assert len(rects_loop) == len(rects_vec), "Decoders returned a different number of rectangles"
+    assert np.allclose(conf_loop, conf_vec), "Decoders returned different confidences"
+
+    loop_time = time_call(decode_predictions_loop, args["repeats"], scores, geometry, args["min_confidence"])
+    vec_time = time_call(decode_predictions, args["repeats"], scores, geometry, args["min_confidence"])
+
+    print(f"Input size: {args['width']}x{args['height']}, score map: {scores.shape[2]}x{scores.shape[3]}, candidates: {len(rects_vec)}")
+    print(f"Max coordinate difference (float rounding): {max_diff} px")
+    print(f"Loop decoder:       {loop_time * 1000:8.2f} ms")
+    print(f"Vectorized decoder: {vec_time * 1000:8.2f} ms")
+    print(f"Speedup:            {loop_time / vec_time:8.1f}x")
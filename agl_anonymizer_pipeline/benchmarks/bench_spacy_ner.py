@@ -0,0 +1,117 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import spacy
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from spacy_NER import SPACY_MODEL_NAME, NER_EXCLUDED_COMPONENTS, person_entities
+
+'''
+spaCy NER Benchmark
+
+Compares the former NER stage, one nlp call of the full de_core_news_md
+pipeline per phrase and per fallback part (split_and_check), with the batched
+stage: the NER-only profile and one nlp.pipe call for all phrases plus one for
+the fallback parts. The person entities of both stages are compared.
+
+The phrases are read from a text file with one OCR phrase per line. Without a
+file a small set of typical overlay phrases is used.
+
+Run from the agl_anonymizer_pipeline directory:
+
+python benchmarks/bench_spacy_ner.py -p phrases.txt -b 64
+'''
+
+SAMPLE_PHRASES = [
+    "Patient: Max Mustermann",
+    "Geb.-Datum 12.03.1961",
+    "Untersucher Dr. Anna Schmidt",
+    "OLYMPUS CV-190",
+    "Koloskopie 14:32:05",
+    "Name: Müller, Hans",
+    "Fallnummer 40081537",
+    "Befund: Polyp im Sigma",
+]
+
+
+def split_parts(phrase):
+    return [phrase[:3], phrase[-3:], phrase[:4] + phrase[-4:], phrase[:5] + phrase[-5:], phrase[:6] + phrase[-6:]]
+
+
+def entities(doc):
+    return [(ent.text, ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
+
+
+def per_phrase(nlp, phrases):
+    results = []
+    for phrase in phrases:
+        found = entities(nlp(phrase))
+        if not found:
+            for part in split_parts(phrase):
+                found = entities(nlp(part))
+                if found:
+                    break
+        results.append(person_entities(found))
+    return results
+
+
+def batched(nlp, phrases, batch_size):
+    found = [entities(doc) for doc in nlp.pipe(phrases, batch_size=batch_size)]
+    retry = [idx for idx, phrase_entities in enumerate(found) if not phrase_entities]
+    parts = [split_parts(phrases[idx]) for idx in retry]
+    part_found = [entities(doc) for doc in nlp.pipe([part for p in parts for part in p], batch_size=batch_size)]
+    for n, idx in enumerate(retry):
+        found[idx] = next((e for e in part_found[n * 5:(n + 1) * 5] if e), [])
+    return [person_entities(phrase_entities) for phrase_entities in found]
+
+
+def time_call(func, repeats, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-p", "--phrases", type=str, default=None, help="text file with one phrase per line")
+    ap.add_argument("-n", "--num-phrases", type=int, default=500, help="number of phrases (the sample phrases are repeated)")
+    ap.add_argument("-b", "--batch-size", type=int, default=64, help="nlp.pipe batch size")
+    ap.add_argument("-r", "--repeats", type=int, default=3, help="number of timed repetitions")
+    args = vars(ap.parse_args())
+
+    if args["phrases"]:
+        phrases = [line.strip() for line in Path(args["phrases"]).read_text(encoding="utf-8").splitlines() if line.strip()]
+    else:
+        phrases = (SAMPLE_PHRASES * (args["num_phrases"] // len(SAMPLE_PHRASES) + 1))[:args["num_phrases"]]
+
+    start = time.perf_counter()
+    full = spacy.load(SPACY_MODEL_NAME)
+    full_load = time.perf_counter() - start
+    start = time.perf_counter()
+    ner_only = spacy.load(SPACY_MODEL_NAME, exclude=NER_EXCLUDED_COMPONENTS)
+    ner_load = time.perf_counter() - start
+
+    print(f"{len(phrases)} phrases")
+    print(f"full pipeline: {full.pipe_names} (load {full_load:.1f} s)")
+    print(f"NER profile:   {ner_only.pipe_names} (load {ner_load:.1f} s)")
+
+    before = per_phrase(full, phrases)
+    after = batched(ner_only, phrases, args["batch_size"])
+    same = sum(a == b for a, b in zip(before, after))
+    print(f"identical person entities: {same}/{len(phrases)}")
+
+    results = [
+        ("full, per phrase", time_call(per_phrase, args["repeats"], full, phrases)),
+        ("full, nlp.pipe", time_call(batched, args["repeats"], full, phrases, args["batch_size"])),
+        ("NER, per phrase", time_call(per_phrase, args["repeats"], ner_only, phrases)),
+        ("NER, nlp.pipe", time_call(batched, args["repeats"], ner_only, phrases, args["batch_size"])),
+    ]
+    baseline = results[0][1]
+    for name, seconds in results:
+        print(f"{name:<18} {seconds * 1000 / len(phrases):7.3f} ms/phrase {baseline / seconds:6.2f}x")
@@ -0,0 +1,86 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytesseract
+from pytesseract import Output
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from tesseract_engine import TesseractCAPI
+
+'''
+Tesseract Engine Benchmark
+
+Compares pytesseract, which starts a tesseract process per call, with the
+in-process libtesseract engine of tesseract_engine.py. Both engines read the
+full page once and then every word crop (padded by 5 px, as in
+tesseract_on_boxes) with image_to_data. The recognized words are compared
+to check that both engines return the same results.
+
+Run from the agl_anonymizer_pipeline directory:
+
+python benchmarks/bench_tesseract_engine.py -i images/frame.png -n 50
+'''
+
+
+def words(data):
+    return [text.strip() for text, conf in zip(data["text"], data["conf"]) if float(conf) > 0 and text.strip()]
+
+
+def word_crops(image, data, count, padding=5):
+    (height, width) = image.shape[:2]
+    crops = []
+    for i, conf in enumerate(data["conf"]):
+        if float(conf) <= 0 or not data["text"][i].strip():
+            continue
+        (x, y, w, h) = (data["left"][i], data["top"][i], data["width"][i], data["height"][i])
+        crops.append(image[max(y - padding, 0):min(y + h + padding, height), max(x - padding, 0):min(x + w + padding, width)])
+        if len(crops) == count:
+            break
+    return crops
+
+
+def time_call(func, repeats, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--image", type=str, required=True, help="path to input image")
+    ap.add_argument("-l", "--lang", type=str, default="eng", help="Tesseract language")
+    ap.add_argument("-n", "--num-crops", type=int, default=50, help="number of word crops")
+    ap.add_argument("-r", "--repeats", type=int, default=3, help="number of timed repetitions")
+    args = vars(ap.parse_args())
+
+    image = cv2.cvtColor(cv2.imread(args["image"]), cv2.COLOR_BGR2RGB)
+    load_start = time.perf_counter()
+    engine = TesseractCAPI(args["lang"])
+    load_ms = (time.perf_counter() - load_start) * 1000
+
+    def run_pytesseract(images):
+        return [pytesseract.image_to_data(img, lang=args["lang"], output_type=Output.DICT) for img in images]
+
+    def run_capi(images):
+        return [engine.image_to_data(img) for img in images]
+
+    page_data = pytesseract.image_to_data(image, lang=args["lang"], output_type=Output.DICT)
+    crops = word_crops(image, page_data, args["num_crops"])
+
+    print(f"Tesseract {engine.version}, engine init {load_ms:.1f} ms, {len(crops)} crops")
+    print(f"{'':<14} {'pytesseract':>12} {'in-process':>12} {'speedup':>8} {'same words':>11}")
+    for name, images in (("full page", [image]), ("word crops", crops)):
+        reference = run_pytesseract(images)
+        results = run_capi(images)
+        same = sum(words(a) == words(b) for a, b in zip(reference, results))
+        py_time = time_call(run_pytesseract, args["repeats"], images)
+        capi_time = time_call(run_capi, args["repeats"], images)
+        print(f"{name:<14} {py_time * 1000:>9.1f} ms {capi_time * 1000:>9.1f} ms {py_time / capi_time:>7.1f}x {same:>5}/{len(images)}")
@@ -0,0 +1,66 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import tesseract_engine
+from ocr import tesseract_on_boxes
+
+'''
+Tesseract Montage Benchmark
+
+Times tesseract_on_boxes in crop mode (Tesseract per box) and in montage mode
+(crops packed into a few images, Tesseract per montage) on the word boxes of a
+real image, and reports how many boxes are read identically in both modes.
+The boxes are the words found by one full-page Tesseract pass.
+
+Run from the agl_anonymizer_pipeline directory:
+
+python benchmarks/bench_tesseract_montage.py -i images/frame.png -n 60
+'''
+
+
+def word_boxes(image_path, count):
+    image = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+    data = tesseract_engine.image_to_data(image)
+    boxes = []
+    for i, text in enumerate(data["text"]):
+        if float(data["conf"][i]) > 0 and str(text).strip():
+            (x, y, w, h) = (data["left"][i], data["top"][i], data["width"][i], data["height"][i])
+            boxes.append((x, y, x + w, y + h))
+    return boxes[:count]
+
+
+def time_call(func, repeats, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--image", type=str, required=True, help="path to input image")
+    ap.add_argument("-n", "--num-boxes", type=int, default=60, help="maximum number of word boxes")
+    ap.add_argument("-r", "--repeats", type=int, default=3, help="number of timed repetitions")
+    args = vars(ap.parse_args())
+
+    boxes = word_boxes(args["image"], args["num_boxes"])
+    crop_results, _ = tesseract_on_boxes(args["image"], boxes, "crop")
+    montage_results, _ = tesseract_on_boxes(args["image"], boxes, "montage")
+    same = sum(a[0] == b[0] for a, b in zip(crop_results, montage_results))
+
+    crop_time = time_call(tesseract_on_boxes, args["repeats"], args["image"], boxes, "crop")
+    montage_time = time_call(tesseract_on_boxes, args["repeats"], args["image"], boxes, "montage")
+
+    engine = "in-process" if tesseract_engine.get_tesseract_engine() is not None else "pytesseract"
+    print(f"{len(boxes)} boxes, {engine} engine")
+    print(f"{'crop':<8} {crop_time * 1000:9.1f} ms  {len(boxes) / crop_time:8.1f} boxes/s")
+    print(f"{'montage':<8} {montage_time * 1000:9.1f} ms  {len(boxes) / montage_time:8.1f} boxes/s  ({crop_time / montage_time:.1f}x)")
+    print(f"{same}/{len(boxes)} boxes read identically")
@@ -0,0 +1,102 @@
+import argparse
+import sys
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+
+import torch
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from ocr import preload_models, _trocr_generate, TROCR_QUANTIZATION_MODES
+
+'''
+TrOCR Quantization Benchmark
+
+Compares the accuracy and CPU latency of TrOCR in every quantization mode
+(none, decoder, full) on a directory of sample crops.
+
+Accuracy is reported against the fp32 model (exact matches and mean character
+similarity) and, if a labels file is given, against the ground truth. The labels
+file has one "filename<TAB>text" line per crop.
+
+Run from the agl_anonymizer_pipeline directory:
+
+python benchmarks/bench_trocr_quantization.py -d images/crops -l images/crops/labels.tsv
+'''
+
+
+def similarity(a, b):
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def load_labels(path):
+    labels = {}
+    if path:
+        for line in Path(path).read_text(encoding="utf-8").splitlines():
+            if "\t" in line:
+                (name, text) = line.split("\t", 1)
+                labels[name] = text
+    return labels
+
+
+def read_crops(processor, model, tokenizer, device, crops, batch_size):
+    texts = []
+    confidences = []
+    for start in range(0, len(crops), batch_size):
+        pixel_values = processor(crops[start:start + batch_size], return_tensors="pt").pixel_values
+        batch_texts, batch_confidences = _trocr_generate(pixel_values, model, tokenizer, device, False)
+        texts += [text.strip() for text in batch_texts]
+        confidences += batch_confidences
+    return texts, confidences
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-d", "--crops", type=str, required=True, help="directory with cropped text images")
+    ap.add_argument("-l", "--labels", type=str, default=None, help="optional filename<TAB>text ground truth")
+    ap.add_argument("-m", "--modes", type=str, default=",".join(TROCR_QUANTIZATION_MODES), help="comma separated quantization modes")
+    ap.add_argument("-b", "--batch-size", type=int, default=16, help="crops per generate call")
+    ap.add_argument("-r", "--repeats", type=int, default=2, help="number of timed repetitions")
+    ap.add_argument("-t", "--threads", type=int, default=None, help="torch.set_num_threads value")
+    args = vars(ap.parse_args())
+
+    if args["threads"]:
+        torch.set_num_threads(args["threads"])
+
+    paths = sorted(p for p in Path(args["crops"]).iterdir() if p.suffix.lower() in (".png", ".jpg", ".jpeg"))
+    crops = [Image.open(p).convert("RGB") for p in paths]
+    labels = load_labels(args["labels"])
+
+    modes = [mode.strip() for mode in args["modes"].split(",") if mode.strip()]
+    if "none" not in modes:
+        modes.insert(0, "none")
+
+    print(f"{len(crops)} crops, {torch.get_num_threads()} threads")
+    print(f"{'mode':<8} {'load s':>7} {'ms/crop':>8} {'speedup':>8} {'exact vs fp32':>14} {'sim vs fp32':>12} {'sim vs labels':>14}")
+
+    reference = None
+    reference_time = None
+    for mode in modes:
+        start = time.perf_counter()
+        processor, model, tokenizer, device = preload_models(mode)
+        load_time = time.perf_counter() - start
+
+        # Warm-up, then time the best of the repetitions
+        texts, _ = read_crops(processor, model, tokenizer, device, crops, args["batch_size"])
+        timings = []
+        for _ in range(args["repeats"]):
+            start = time.perf_counter()
+            read_crops(processor, model, tokenizer, device, crops, args["batch_size"])
+            timings.append(time.perf_counter() - start)
+        crop_ms = min(timings) * 1000 / max(len(crops), 1)
+
+        if reference is None:
+            (reference, reference_time) = (texts, crop_ms)
+        exact = sum(a == b for a, b in zip(texts, reference)) / max(len(crops), 1)
+        sim_fp32 = sum(similarity(a, b) for a, b in zip(texts, reference)) / max(len(crops), 1)
+        labelled = [(text, labels[p.name]) for text, p in zip(texts, paths) if p.name in labels]
+        sim_labels = f"{sum(similarity(a, b) for a, b in labelled) / len(labelled):.3f}" if labelled else "-"
+
+        print(f"{mode:<8} {load_time:>7.1f} {crop_ms:>8.1f} {reference_time / crop_ms:>7.2f}x {exact:>14.1%} {sim_fp32:>12.3f} {sim_labels:>14}")
@@ -1,4 +1,5 @@
 import cv2
+import numpy as np
 import os
 import uuid
 from directory_setup import create_temp_directory, create_blur_directory
@@ -12,10 +13,197 @@ logger = get_logger(__name__)
 
 temp_dir, base_dir, csv_dir = create_temp_directory()
 
+def _group_overlapping(regions):
+    """
+    Group overlapping regions, returning (bounding box, regions) for every group.
+    """
+    groups = [((startX, startY, endX, endY), [(startX, startY, endX, endY)]) for (startX, startY, endX, endY) in regions]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(groups)):
+            for j in range(i + 1, len(groups)):
+                (a, b) = (groups[i][0], groups[j][0])
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    bounds = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                    groups[i] = (bounds, groups[i][1] + groups[j][1])
+                    del groups[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return groups
+
+
+class RedactionCompositor:
+    """
+    Holds one frame in memory and accumulates redactions, which are applied in a single pass.
+
+    Instead of reading, modifying and writing the image once per redacted box, the boxes
+    are collected with add_blur, add_fill and add_patch. render() draws all fill rectangles, blurs every
+    group of overlapping regions once through a combined mask, copies the patches (e.g. rendered
+    pseudonyms) on top and returns the frame. save() renders and encodes the frame once.
+
+    Example:
+        compositor = RedactionCompositor.from_path(image_path)
+        compositor.add_blur(first_name_box, background_color)
+        compositor.add_blur(phrase_box)
+        output_path = compositor.save()
+    """
+
+    def __init__(self, image, source_path=None):
+        self.image = image
+        self.source_path = Path(source_path) if source_path is not None else None
+        self._rectangles = []  # (startX, startY, endX, endY, color) drawn before blurring
+        self._blur_regions = {}  # blur_strength -> list of (startX, startY, endX, endY)
+        self._fills = []  # (startX, startY, endX, endY, color) drawn after blurring
+        self._patches = []  # (startX, startY, patch) drawn last
+
+    @classmethod
+    def from_path(cls, image_path):
+        image = cv2.imread(str(image_path))
+        if image is None:
+            raise ValueError(f"Could not load image at {image_path}")
+        return cls(image, image_path)
+
+    @property
+    def height(self):
+        return self.image.shape[0]
+
+    @property
+    def width(self):
+        return self.image.shape[1]
+
+    def add_blur(self, box, background_color=None, expansion=10, blur_strength=(51, 51), rectangle_scale=0.8):
+        """
+        Redact a box the way blur_function does: a filled rectangle in the background color,
+        blurred together with a slightly expanded region around the box.
+
+        Parameters:
+        box: tuple
+            The bounding box as a tuple of (startX, startY, endX, endY).
+        background_color: tuple
+            The background color to fill the rectangle. Defaults to the dominant color of the box.
+        expansion: int
+            The number of pixels to expand the blur beyond the ROI.
+        blur_strength: tuple
+            The size of the Gaussian kernel to use for blurring.
+        rectangle_scale: float
+            The scale of the rectangle relative to the expanded ROI.
+        """
+        (startX, startY, endX, endY) = box
+
+        # Expand the ROI to include a border around the detected region
+        (startX, startY, endX, endY) = expand_roi(startX, startY, endX, endY, expansion, self.image.shape)
+        if endX <= startX or endY <= startY:
+            logger.debug(f"Skipping empty blur region {box}")
+            return self
+
+        # Use the provided background color or default to the dominant color in the ROI
+        if background_color is not None:
+            dominant_color = background_color
+        else:
+            dominant_color = get_dominant_color(self.image, box)
+
+        # Calculate the dimensions for the smaller rectangle
+        rect_width = int((endX - startX) * rectangle_scale)
+        rect_height = int((endY - startY) * rectangle_scale)
+        rect_startX = startX + (endX - startX - rect_width) // 2
+        rect_startY = startY + (endY - startY - rect_height) // 2
+
+        self._rectangles.append((rect_startX, rect_startY, rect_startX + rect_width, rect_startY + rect_height, dominant_color))
+        self._blur_regions.setdefault(tuple(blur_strength), []).append((startX, startY, endX, endY))
+        return self
+
+    def add_fill(self, box, color):
+        """Cover a box with a solid color, drawn on top of all blurred regions."""
+        (startX, startY, endX, endY) = box
+        self._fills.append((startX, startY, endX, endY, color))
+        return self
+
+    def add_patch(self, box, patch):
+        """
+        Copy a patch (e.g. a rendered pseudonym from names_adder) onto the frame at the top left corner of box.
+
+        The patch is shifted back inside the frame and cropped if it does not fit, like in
+        image_reassembly.reassemble_image. It is not modified, so cached patches can be passed directly.
+        """
+        if patch is None:
+            return self
+        (startX, startY) = (int(box[0]), int(box[1]))
+        startX = max(min(startX, self.width - patch.shape[1]), 0)
+        startY = max(min(startY, self.height - patch.shape[0]), 0)
+        self._patches.append((startX, startY, patch))
+        return self
+
+    def render(self):
+        """
+        Apply all accumulated redactions to a copy of the frame.
+
+        Returns:
+        ndarray
+            The redacted frame.
+        """
+        output = self.image.copy()
+
+        # Draw the rectangles first, they are blurred together with their region like in blur_function
+        for (startX, startY, endX, endY, color) in self._rectangles:
+            cv2.rectangle(output, (startX, startY), (endX, endY), color, -1)
+
+        for blur_strength, regions in self._blur_regions.items():
+            # Blur every group of overlapping regions once, only the pixels inside the regions are replaced
+            for (x0, y0, x1, y1), group in _group_overlapping(regions):
+                window = output[y0:y1, x0:x1]
+                blurred = cv2.GaussianBlur(window, blur_strength, 0)
+                if len(group) == 1:
+                    window[:] = blurred
+                    continue
+                window_mask = np.zeros(window.shape[:2], dtype=bool)
+                for (startX, startY, endX, endY) in group:
+                    window_mask[startY - y0:endY - y0, startX - x0:endX - x0] = True
+                window[window_mask] = blurred[window_mask]
+
+        for (startX, startY, endX, endY, color) in self._fills:
+            cv2.rectangle(output, (startX, startY), (endX - 1, endY - 1), color, -1)
+
+        for (startX, startY, patch) in self._patches:
+            (height, width) = (min(patch.shape[0], self.height - startY), min(patch.shape[1], self.width - startX))
+            output[startY:startY + height, startX:startX + width] = patch[:height, :width]
+
+        return output
+
+    def save(self, output_image_path=None):
+        """
+        Render the frame and encode it once.
+
+        Parameters:
+        output_image_path: str or Path
+            Where to save the image. Defaults to a new PNG file in the blur directory.
+
+        Returns:
+        Path
+            The path to the saved output image.
+        """
+        if output_image_path is None:
+            blur_dir = create_blur_directory()
+            if blur_dir is None:
+                raise ValueError("Blur directory could not be created or accessed")
+            output_image_path = Path(blur_dir) / f"{uuid.uuid4().hex}.png"
+
+        output_image_path = Path(output_image_path)
+        logger.debug(f"Blurred Image will be saved to: {output_image_path.parent}")
+        cv2.imwrite(str(output_image_path), self.render())
+        logger.info(f"Blurred Image saved to {output_image_path.parent}")
+        return output_image_path
+
+
 def blur_function(image_path, box, background_color=None, expansion=10, blur_strength=(51, 51), rectangle_scale=0.8):
     """
     Apply a strong Gaussian blur to the specified ROI in the image and slightly extend the blur outside the ROI.
 
+    This reads and writes one image per call. To redact several boxes of one frame,
+    use a RedactionCompositor and save the result once.
+
     Parameters:
     image_path: str
         The path to the image file on which to apply the blurring.
@@ -35,44 +223,6 @@ def blur_function(image_path, box, background_color=None, expansion=10, blur_str
         The path to the saved output image.
     """ 
     logger.info("Applying blur to the specified region")
-    blur_dir= create_blur_directory()
-    if blur_dir is None:
-        raise ValueError("Blur directory could not be created or accessed")
-    image_path = Path(image_path)
-    image = cv2.imread(str(image_path))
-    (startX, startY, endX, endY) = box
-
-    # Expand the ROI to include a border around the detected region
-    (startX, startY, endX, endY) = expand_roi(startX, startY, endX, endY, expansion, image.shape)
-
-    # Extract the expanded ROI from the image
-    roi = image[startY:endY, startX:endX]
-    
-    # Use the provided background color or default to the dominant color in the ROI
-    if background_color is not None:
-        dominant_color = background_color
-    else:
-        dominant_color = get_dominant_color(image, box)
-
-    # Calculate the dimensions for the smaller rectangle
-    rect_width = int((endX - startX) * rectangle_scale)
-    rect_height = int((endY - startY) * rectangle_scale)
-    rect_startX = startX + (endX - startX - rect_width) // 2
-    rect_startY = startY + (endY - startY - rect_height) // 2
-
-    # Draw the rectangle on the blurred image
-    cv2.rectangle(image, (rect_startX, rect_startY), (rect_startX + rect_width, rect_startY + rect_height), dominant_color, -1)
-
-    # Apply a strong Gaussian blur to the ROI
-    blurred_roi = cv2.GaussianBlur(roi, blur_strength, 0)
-
-    # Replace the original image's ROI with the blurred one
-    image[startY:endY, startX:endX] = blurred_roi
-
-    # Save the modified image to a file
-    output_image_path = Path(blur_dir)/ f"{uuid.uuid4().hex}.png"
-    logger.debug(f"Blurred Image will be saved to: {blur_dir}")
-    cv2.imwrite(str(output_image_path), image)
-    logger.info(f"Blurred Image saved to {blur_dir}")
-
-    return output_image_path
\ No newline at end of file
+    compositor = RedactionCompositor.from_path(image_path)
+    compositor.add_blur(box, background_color, expansion, blur_strength, rectangle_scale)
+    return compositor.save()
@@ -1,6 +1,8 @@
 import numpy as np
 import cv2
 from custom_logger import get_logger
+from pipeline_config import DOMINANT_COLOR_METHOD, BOX_FUSION_IOU_THRESHOLD
+from box_set import BoxSet
 
 logger = get_logger(__name__)
 
@@ -8,33 +10,226 @@ logger = get_logger(__name__)
 Box Operations
 
 The functions in this script define operations on coordinate 
-bounding boxes in images.
+bounding boxes in images. Boxes can be passed as a sequence of
+(startX, startY, endX, endY) tuples or as a BoxSet (see box_set.py).
 
 
 '''
 
-def get_dominant_color(image, box):
+def non_max_suppression(boxes, scores=None, iou_threshold=None, overlap_threshold=0.3, use_cv2=False):
+    """
+    Greedy non-maximum suppression on an (N, 4) array of boxes.
+
+    Boxes are visited from the highest to the lowest score. Every remaining box that
+    overlaps the kept box by more than the thresholds is suppressed. Two criteria are
+    supported and can be combined:
+
+    - overlap_threshold: intersection divided by the area of the suppressed box,
+      the criterion of imutils.object_detection.non_max_suppression.
+    - iou_threshold: intersection over union of both boxes.
+
+    Coordinates are treated as inclusive pixel positions, like imutils does.
+
+    Args:
+        boxes (array_like or BoxSet): (N, 4) array of (startX, startY, endX, endY) boxes.
+        scores (array_like, optional): (N,) scores. Defaults to the scores of a BoxSet,
+            otherwise boxes with a larger endY are kept first.
+        iou_threshold (float, optional): Suppress boxes with an IoU above this value.
+        overlap_threshold (float, optional): Suppress boxes covered by more than this fraction. Defaults to 0.3.
+        use_cv2 (bool, optional): Use cv2.dnn.NMSBoxes instead. It only supports IoU, so
+            iou_threshold (or overlap_threshold if no IoU threshold is given) is used as its IoU threshold.
+
+    Returns:
+        ndarray: Indices of the kept boxes into the input arrays, highest score first.
+    """
+    if isinstance(boxes, BoxSet):
+        if scores is None:
+            scores = boxes.scores
+        boxes = boxes.boxes
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.intp)
+
+    (x1, y1, x2, y2) = boxes.T
+    scores = y2 if scores is None else np.asarray(scores, dtype=np.float64).reshape(-1)
+
+    if use_cv2:
+        threshold = iou_threshold if iou_threshold is not None else overlap_threshold
+        rects = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).tolist()
+        # NMSBoxes drops scores at or below a non-negative threshold, shifting keeps every box and the order
+        shifted_scores = (scores - scores.min() + 1.0).tolist()
+        keep = cv2.dnn.NMSBoxes(rects, shifted_scores, 0.0, float(threshold))
+        return np.asarray(keep, dtype=np.intp).reshape(-1)
+
+    areas = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = np.argsort(scores, kind="stable")[::-1]
+    keep = []
+
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        # Intersection of the kept box with all remaining boxes
+        w = np.maximum(0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]) + 1)
+        h = np.maximum(0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]) + 1)
+        intersection = w * h
+
+        suppress = np.zeros(rest.shape, dtype=bool)
+        if overlap_threshold is not None:
+            suppress |= intersection / areas[rest] > overlap_threshold
+        if iou_threshold is not None:
+            suppress |= intersection / (areas[i] + areas[rest] - intersection) > iou_threshold
+
+        order = rest[~suppress]
+
+    return np.asarray(keep, dtype=np.intp)
+
+def _union_find_labels(count, pairs):
+    """Connected component label for each of count nodes, given an (M, 2) array of linked pairs."""
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        (root_i, root_j) = (find(i), find(j))
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    return np.array([find(i) for i in range(count)], dtype=np.intp)
+
+def fuse_boxes(*box_sets, iou_threshold=BOX_FUSION_IOU_THRESHOLD):
+    """
+    Fuse overlapping detections of several detectors into one box per text region.
+
+    All boxes are clustered by overlap: two boxes belong to the same cluster if their
+    IoU is above the threshold, directly or through other boxes of the cluster. Every
+    cluster is replaced by its union box with the highest score of its members, and the
+    source flags of the members are combined, so the fused box records which detectors found it.
+
+    Args:
+        *box_sets (BoxSet or list): Detections to fuse, e.g. the EAST and the Tesseract boxes.
+        iou_threshold (float, optional): Minimum IoU of linked boxes. Defaults to BOX_FUSION_IOU_THRESHOLD.
+            None disables fusion and only concatenates the boxes.
+
+    Returns:
+        BoxSet: The fused boxes, sorted by line.
+    """
+    boxes = BoxSet.concatenate(box_sets)
+    if iou_threshold is None or len(boxes) < 2:
+        return boxes.sort_by_line()
+
+    overlaps = np.triu(boxes.iou() > iou_threshold, k=1)
+    labels = _union_find_labels(len(boxes), np.argwhere(overlaps))
+    fused = boxes.merge(labels).sort_by_line()
+
+    logger.debug(f"Fused {len(boxes)} boxes into {len(fused)} text regions")
+    return fused
+
+def _clip_boxes(boxes, image_shape):
+    """Clip an (N, 4) array of boxes to the image and make empty boxes zero-sized."""
+    return BoxSet(boxes).clip(image_shape).boxes.astype(np.int64)
+
+def _region_color(region, method="mean", bins=8):
+    """Dominant color of a single (h, w, 3) region as a float array."""
+    if region.size == 0:
+        return np.zeros(3)
+
+    if method == "median":
+        return np.median(region.reshape(-1, 3), axis=0)
+
+    if method == "histogram":
+        pixels = region.reshape(-1, 3)
+        # Most frequent bin of a quantized color histogram, refined to the mean color of its pixels
+        quantized = pixels.astype(np.int64) * bins // 256
+        codes = (quantized[:, 0] * bins + quantized[:, 1]) * bins + quantized[:, 2]
+        mode = np.argmax(np.bincount(codes))
+        return pixels[codes == mode].mean(axis=0)
+
+    # cv2.mean works on the region view directly, without copying or converting the pixels
+    return np.array(cv2.mean(region)[:3])
+
+class DominantColorEngine:
+    """
+    Computes the dominant colors of many regions of one image.
+
+    Methods:
+    - "mean": The mean color. K-means with a single cluster converges to the mean, so this
+      matches the former cv2.kmeans result. With use_integral=True the means are read from an
+      integral image in O(1) per region, which pays off for thousands of regions per image.
+    - "median": The per-channel median of the region.
+    - "histogram": The most frequent bin of a quantized color histogram with `bins` levels per channel.
+
+    Regions are clipped to the image. Regions without pixels get the color (0, 0, 0).
+    """
+
+    def __init__(self, image, method=None, bins=8, use_integral=False):
+        self.image = image
+        self.method = method or DOMINANT_COLOR_METHOD
+        self.bins = bins
+        self.use_integral = use_integral
+        self._integral = None
+
+    def _integral_image(self):
+        if self._integral is None:
+            # float64 sums cannot overflow, even for large frames
+            self._integral = cv2.integral(self.image, sdepth=cv2.CV_64F).reshape(
+                self.image.shape[0] + 1, self.image.shape[1] + 1, -1
+            )
+        return self._integral
+
+    def colors(self, boxes):
+        """
+        Args:
+            boxes (array_like): (N, 4) array of (startX, startY, endX, endY) boxes.
+
+        Returns:
+            ndarray: (N, 3) int array of (B, G, R) colors.
+        """
+        boxes = _clip_boxes(boxes, self.image.shape)
+        if len(boxes) == 0:
+            return np.empty((0, 3), dtype=np.int64)
+
+        if self.method == "mean" and self.use_integral:
+            integral = self._integral_image()
+            (x0, y0, x1, y1) = boxes.T
+            sums = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+            areas = ((x1 - x0) * (y1 - y0))[:, None]
+            colors = np.divide(sums, areas, out=np.zeros_like(sums), where=areas > 0)
+        elif self.method == "mean":
+            colors = np.array([
+                cv2.mean(self.image[y0:y1, x0:x1])[:3] if x1 > x0 and y1 > y0 else (0.0, 0.0, 0.0)
+                for (x0, y0, x1, y1) in boxes.tolist()
+            ])
+        else:
+            colors = np.array([
+                _region_color(self.image[y0:y1, x0:x1], self.method, self.bins)
+                for (x0, y0, x1, y1) in boxes
+            ])
+
+        return np.trunc(colors).astype(np.int64)
+
+    def color(self, box):
+        return tuple(int(c) for c in self.colors([box])[0])
+
+def get_dominant_color(image, box, method=None):
     """
     Get the dominant color in a given box region of the image.
     :param image: The input image
     :param box: The bounding box (startX, startY, endX, endY)
+    :param method: "mean", "median" or "histogram", defaults to DOMINANT_COLOR_METHOD
     :return: The dominant color as a tuple (B, G, R)
     """
-    (startX, startY, endX, endY) = box
+    (startX, startY, endX, endY) = _clip_boxes([box], image.shape)[0]
     region = image[startY:endY, startX:endX]
-    pixels = np.float32(region.reshape(-1, 3))
-    
-    n_colors = 1
-    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 200, 0.1)
-    flags = cv2.KMEANS_RANDOM_CENTERS
-    
-    _, labels, palette = cv2.kmeans(pixels, n_colors, None, criteria, 10, flags)
-    _, counts = np.unique(labels, return_counts=True)
-    
-    dominant = palette[np.argmax(counts)]
-    
+    dominant = _region_color(region, method or DOMINANT_COLOR_METHOD)
+
     logger.debug(f"Found dominant color: {dominant}")
-    return tuple(map(int, dominant))
+    return tuple(int(c) for c in np.trunc(dominant))
 
 def make_box_from_name(image, name, padding=10):
     """
@@ -82,54 +277,53 @@ def make_box_from_device_list(x,y,w,h):
     logger.debug(f"Created bounding box from device list: ({startX}, {startY}, {endX}, {endY})")
     return startX, startY, endX, endY
 
-def extend_boxes_if_needed(image, boxes, extension_margin=10, color_threshold=30):
+def extend_boxes_if_needed(image, boxes, extension_margin=10, color_threshold=30, method=None):
     """
     Extends the Box in one direction or the other. This ensures, that the Box coordinates fit over the names.
+
+    The dominant colors of all boxes and of the strips around them are computed at once
+    with a DominantColorEngine, instead of one k-means run per region.
     
     Args:
         image (_type_): NumPy Array representing the image (as used in cv2)
-        boxes (_type_): Array of the Box Coordinates, that were detected in the image
+        boxes (_type_): Array of the Box Coordinates, that were detected in the image, or a BoxSet
         extension_margin (int, optional): _description_. Length, that will be added to the side of the box. Defaults to 10.
         color_threshold (int, optional): _description_. The extension is decided based on if the name extends out of the side. This value decides, at what differentiation from the dominant color an extension will happen. Defaults to 30.
+        method (str, optional): Dominant color method of the DominantColorEngine. Defaults to DOMINANT_COLOR_METHOD.
 
     Returns:
-        _type_: _description_
+        BoxSet or list: The possibly extended boxes. A BoxSet keeps its scores and sources,
+        other input is returned as a list of (startX, startY, endX, endY) tuples.
     """
     logger.debug(f"Starting box extension to make room for names.")
-    extended_boxes = []
-    for box in boxes:
-        (startX, startY, endX, endY) = box
-
-        # Get the dominant color of the current box
-        dominant_color = get_dominant_color(image, box)
-
-        # Check the color signal around the box and decide if extension is needed
-        # Check above the box
-        if startY - extension_margin > 0:
-            upper_region_color = get_dominant_color(image, (startX, startY - extension_margin, endX, startY))
-            if np.linalg.norm(np.array(upper_region_color) - np.array(dominant_color)) > color_threshold:
-                startY = max(startY - extension_margin, 0)
-
-        # Check below the box
-        if endY + extension_margin < image.shape[0]:
-            lower_region_color = get_dominant_color(image, (startX, endY, endX, endY + extension_margin))
-            if np.linalg.norm(np.array(lower_region_color) - np.array(dominant_color)) > color_threshold:
-                endY = min(endY + extension_margin, image.shape[0])
-
-        # Check left of the box
-        if startX - extension_margin > 0:
-            left_region_color = get_dominant_color(image, (startX - extension_margin, startY, startX, endY))
-            if np.linalg.norm(np.array(left_region_color) - np.array(dominant_color)) > color_threshold:
-                startX = max(startX - extension_margin, 0)
-
-        # Check right of the box
-        if endX + extension_margin < image.shape[1]:
-            right_region_color = get_dominant_color(image, (endX, startY, endX + extension_margin, endY))
-            if np.linalg.norm(np.array(right_region_color) - np.array(dominant_color)) > color_threshold:
-                endX = min(endX + extension_margin, image.shape[1])
-
-        # Add the possibly extended box to the list
-        extended_boxes.append((startX, startY, endX, endY))
+    box_set = BoxSet.from_tuples(boxes)
+    if len(box_set) == 0:
+        return box_set if isinstance(boxes, BoxSet) else []
+
+    engine = DominantColorEngine(image, method)
+    (height, width) = image.shape[:2]
+    (startX, startY, endX, endY) = box_set.boxes.astype(np.int64).T
+
+    def differs(region_boxes, reference_colors):
+        region_colors = engine.colors(np.stack(region_boxes, axis=1))
+        return np.linalg.norm(region_colors - reference_colors, axis=1) > color_threshold
+
+    # Get the dominant color of the current boxes
+    dominant_colors = engine.colors(np.stack([startX, startY, endX, endY], axis=1))
+
+    # Check the color signal above and below the boxes and decide if extension is needed
+    extend_up = (startY - extension_margin > 0) & differs((startX, startY - extension_margin, endX, startY), dominant_colors)
+    extend_down = (endY + extension_margin < height) & differs((startX, endY, endX, endY + extension_margin), dominant_colors)
+    startY = np.where(extend_up, np.maximum(startY - extension_margin, 0), startY)
+    endY = np.where(extend_down, np.minimum(endY + extension_margin, height), endY)
+
+    # Check left and right of the boxes, using the vertically extended boxes
+    extend_left = (startX - extension_margin > 0) & differs((startX - extension_margin, startY, startX, endY), dominant_colors)
+    extend_right = (endX + extension_margin < width) & differs((endX, startY, endX + extension_margin, endY), dominant_colors)
+    startX = np.where(extend_left, np.maximum(startX - extension_margin, 0), startX)
+    endX = np.where(extend_right, np.minimum(endX + extension_margin, width), endX)
+
+    extended_boxes = box_set.with_boxes(np.stack([startX, startY, endX, endY], axis=1))
 
     logger.debug(f"Extended boxes to make rrom for names.")
-    return extended_boxes
+    return extended_boxes if isinstance(boxes, BoxSet) else extended_boxes.tolist()
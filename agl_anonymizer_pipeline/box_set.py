@@ -0,0 +1,273 @@
+import numpy as np
+from custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+'''
+Box Set
+
+The BoxSet in this script stores the bounding boxes of one image as an
+(N, 4) int32 array of (startX, startY, endX, endY) coordinates, together with
+a parallel score array and a source array.
+
+The source of a box is a bit flag, so boxes merged from several detectors
+keep the information where they came from:
+
+- SOURCE_EAST: detected by the EAST text detector
+- SOURCE_TESSERACT: detected by the Tesseract layout analysis
+- SOURCE_DEVICE: read from the device configuration
+
+Operations like expand, clip, scale and sort_by_line work on the whole array
+at once and return a new BoxSet. Iterating a BoxSet yields plain int tuples,
+so it can be passed to code that expects a list of boxes.
+'''
+
+SOURCE_NONE = 0
+SOURCE_EAST = 1
+SOURCE_TESSERACT = 2
+SOURCE_DEVICE = 4
+
+SOURCE_NAMES = {
+    SOURCE_EAST: "east",
+    SOURCE_TESSERACT: "tesseract",
+    SOURCE_DEVICE: "device",
+}
+
+
+class BoxSet:
+    def __init__(self, boxes=None, scores=None, sources=None):
+        """
+        Args:
+            boxes (array_like, optional): (N, 4) boxes as (startX, startY, endX, endY).
+            scores (array_like, optional): (N,) scores. Defaults to zeros.
+            sources (array_like or int, optional): (N,) source flags, or one flag for all boxes. Defaults to SOURCE_NONE.
+        """
+        self.boxes = np.asarray(boxes if boxes is not None else [], dtype=np.int32).reshape(-1, 4)
+        count = len(self.boxes)
+
+        if scores is None:
+            self.scores = np.zeros(count, dtype=np.float32)
+        else:
+            self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+
+        if sources is None:
+            sources = SOURCE_NONE
+        if np.isscalar(sources):
+            self.sources = np.full(count, sources, dtype=np.uint8)
+        else:
+            self.sources = np.asarray(sources, dtype=np.uint8).reshape(-1)
+
+        if len(self.scores) != count or len(self.sources) != count:
+            raise ValueError(f"BoxSet needs one score and source per box, got {count} boxes, "
+                             f"{len(self.scores)} scores and {len(self.sources)} sources")
+
+    @classmethod
+    def from_tuples(cls, boxes, scores=None, source=SOURCE_NONE):
+        """
+        Create a BoxSet from a sequence of (startX, startY, endX, endY) tuples.
+        A BoxSet is returned unchanged.
+        """
+        if isinstance(boxes, cls):
+            return boxes
+        return cls(list(boxes), scores, source)
+
+    @classmethod
+    def concatenate(cls, box_sets):
+        box_sets = [cls.from_tuples(box_set) for box_set in box_sets]
+        if not box_sets:
+            return cls()
+        return cls(
+            np.concatenate([box_set.boxes for box_set in box_sets]),
+            np.concatenate([box_set.scores for box_set in box_sets]),
+            np.concatenate([box_set.sources for box_set in box_sets]),
+        )
+
+    def _take(self, index):
+        return BoxSet(self.boxes[index], self.scores[index], self.sources[index])
+
+    def with_boxes(self, boxes):
+        """A BoxSet with new coordinates and the scores and sources of this one."""
+        return BoxSet(boxes, self.scores.copy(), self.sources.copy())
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return tuple(int(v) for v in self.boxes[index])
+        return self._take(index)
+
+    def __add__(self, other):
+        return BoxSet.concatenate([self, other])
+
+    def __radd__(self, other):
+        return BoxSet.concatenate([other, self])
+
+    def __repr__(self):
+        return f"BoxSet({self.tolist()})"
+
+    def tolist(self):
+        return [tuple(box) for box in self.boxes.tolist()]
+
+    @property
+    def startX(self):
+        return self.boxes[:, 0]
+
+    @property
+    def startY(self):
+        return self.boxes[:, 1]
+
+    @property
+    def endX(self):
+        return self.boxes[:, 2]
+
+    @property
+    def endY(self):
+        return self.boxes[:, 3]
+
+    @property
+    def widths(self):
+        return self.boxes[:, 2] - self.boxes[:, 0]
+
+    @property
+    def heights(self):
+        return self.boxes[:, 3] - self.boxes[:, 1]
+
+    @property
+    def areas(self):
+        return np.maximum(self.widths, 0).astype(np.int64) * np.maximum(self.heights, 0)
+
+    def source_names(self, index):
+        """Names of all sources a box came from, e.g. ['east', 'tesseract']."""
+        flags = int(self.sources[index])
+        return [name for flag, name in SOURCE_NAMES.items() if flags & flag]
+
+    def clip(self, image_shape):
+        """
+        Clip the boxes to the image. Boxes outside of the image become zero-sized.
+        """
+        boxes = self.boxes.copy()
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, image_shape[1])
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, image_shape[0])
+        boxes[:, 2] = np.maximum(boxes[:, 2], boxes[:, 0])
+        boxes[:, 3] = np.maximum(boxes[:, 3], boxes[:, 1])
+        return self.with_boxes(boxes)
+
+    def expand(self, expansion, image_shape=None):
+        """
+        Expand every box by a number of pixels in all directions, like region_detector.expand_roi.
+
+        Args:
+            expansion (int): Pixels added on every side.
+            image_shape (tuple, optional): Clip the expanded boxes to this image shape.
+        """
+        boxes = self.boxes + np.array([-expansion, -expansion, expansion, expansion], dtype=np.int32)
+        if image_shape is None:
+            return self.with_boxes(boxes)
+        boxes[:, :2] = np.maximum(boxes[:, :2], 0)
+        boxes[:, 2] = np.minimum(boxes[:, 2], image_shape[1])
+        boxes[:, 3] = np.minimum(boxes[:, 3], image_shape[0])
+        return self.with_boxes(boxes)
+
+    def scale(self, ratio_x, ratio_y):
+        """
+        Scale the coordinates, e.g. from the detector input size back to the original image.
+        Coordinates are truncated like int(x * ratio).
+        """
+        ratios = np.array([ratio_x, ratio_y, ratio_x, ratio_y])
+        return self.with_boxes(np.trunc(self.boxes * ratios))
+
+    def line_order(self, vertical_threshold=10):
+        """
+        Indices that sort the boxes in reading order: by line (startY rounded to
+        vertical_threshold), then by startX.
+        """
+        lines = np.round(self.boxes[:, 1] / vertical_threshold)
+        return np.lexsort((self.boxes[:, 0], lines))
+
+    def sort_by_line(self, vertical_threshold=10):
+        return self._take(self.line_order(vertical_threshold))
+
+    def intersection(self, other=None):
+        """
+        Returns:
+            ndarray: (N, M) intersection areas with the boxes of other (defaults to this set).
+        """
+        other = self if other is None else BoxSet.from_tuples(other)
+        a = self.boxes.astype(np.int64)
+        b = other.boxes.astype(np.int64)
+
+        w = np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0])
+        h = np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1])
+        return np.maximum(w, 0) * np.maximum(h, 0)
+
+    def iou(self, other=None):
+        """
+        Pairwise intersection over union.
+
+        Args:
+            other (BoxSet, optional): Boxes to compare with. Defaults to the boxes of this set.
+
+        Returns:
+            ndarray: (N, M) IoU matrix.
+        """
+        other = self if other is None else BoxSet.from_tuples(other)
+        intersection = self.intersection(other)
+        union = self.areas[:, None] + other.areas[None, :] - intersection
+        return np.divide(intersection, union, out=np.zeros(intersection.shape), where=union > 0)
+
+    def coverage(self, other):
+        """
+        Share of every box of other that is covered by every box of this set.
+
+        Returns:
+            ndarray: (N, M) matrix, 1.0 where box j of other lies completely inside box i.
+        """
+        other = BoxSet.from_tuples(other)
+        intersection = self.intersection(other)
+        areas = other.areas[None, :]
+        return np.divide(intersection, areas, out=np.zeros(intersection.shape), where=areas > 0)
+
+    def merge(self, labels):
+        """
+        Merge boxes with the same label into their union box.
+
+        Scores of a group are reduced to their maximum and sources are combined,
+        so a merged box remembers every detector that found it.
+
+        Args:
+            labels (array_like): (N,) group label per box, e.g. from clustering.
+
+        Returns:
+            BoxSet: One box per label, ordered by the first box of each group.
+        """
+        labels = np.asarray(labels).reshape(-1)
+        if len(labels) != len(self):
+            raise ValueError(f"Expected {len(self)} labels, got {len(labels)}")
+        if len(self) == 0:
+            return BoxSet()
+
+        _, first_index, inverse = np.unique(labels, return_index=True, return_inverse=True)
+        # Number the groups in the order they first appear
+        group_order = np.argsort(first_index)
+        group_of = np.empty_like(group_order)
+        group_of[group_order] = np.arange(len(group_order))
+        groups = group_of[inverse]
+        count = len(group_order)
+
+        boxes = np.empty((count, 4), dtype=np.int32)
+        boxes[:, :2] = np.iinfo(np.int32).max
+        boxes[:, 2:] = np.iinfo(np.int32).min
+        np.minimum.at(boxes[:, 0], groups, self.boxes[:, 0])
+        np.minimum.at(boxes[:, 1], groups, self.boxes[:, 1])
+        np.maximum.at(boxes[:, 2], groups, self.boxes[:, 2])
+        np.maximum.at(boxes[:, 3], groups, self.boxes[:, 3])
+
+        scores = np.full(count, -np.inf, dtype=np.float32)
+        np.maximum.at(scores, groups, self.scores)
+        sources = np.zeros(count, dtype=np.uint8)
+        np.bitwise_or.at(sources, groups, self.sources)
+        return BoxSet(boxes, scores, sources)
@@ -1,12 +1,17 @@
 # import the necessary packages
-from imutils.object_detection import non_max_suppression
 import numpy as np
 import time
 import cv2
 import json
-from box_operations import extend_boxes_if_needed
+from box_operations import extend_boxes_if_needed, non_max_suppression
+from box_set import BoxSet, SOURCE_EAST
 from directory_setup import create_temp_directory, create_model_directory
 from custom_logger import get_logger
+from model_registry import registry
+from pipeline_config import (
+    EAST_BATCH_SIZE, EAST_DNN_BACKEND, EAST_DNN_TARGET, OPENCV_NUM_THREADS,
+    EAST_NMS_IOU_THRESHOLD, EAST_NMS_OVERLAP_THRESHOLD, EAST_NMS_USE_CV2
+)
 from pathlib import Path
 import certifi
 import urllib.request
@@ -49,7 +54,123 @@ if not east_model_path.exists():
         raiselogger = get_logger(__name__)
 
 
-def east_text_detection(image_path, east_path=None, min_confidence=0.5, width=320, height=320):
+# OpenCV DNN backends and targets selectable through the pipeline configuration
+DNN_BACKENDS = {
+    "default": "DNN_BACKEND_DEFAULT",
+    "opencv": "DNN_BACKEND_OPENCV",
+    "openvino": "DNN_BACKEND_INFERENCE_ENGINE",
+    "cuda": "DNN_BACKEND_CUDA",
+}
+
+DNN_TARGETS = {
+    "cpu": "DNN_TARGET_CPU",
+    "cpu_fp16": "DNN_TARGET_CPU_FP16",
+    "opencl": "DNN_TARGET_OPENCL",
+    "opencl_fp16": "DNN_TARGET_OPENCL_FP16",
+    "cuda": "DNN_TARGET_CUDA",
+    "cuda_fp16": "DNN_TARGET_CUDA_FP16",
+}
+
+_applied_num_threads = None
+
+def _resolve_dnn_constant(options, name, default):
+    # Not every OpenCV build exposes every constant (e.g. DNN_TARGET_CPU_FP16 needs OpenCV >= 4.8)
+    constant = getattr(cv2.dnn, options.get(name, ""), None)
+    if constant is None:
+        logger.warning(f"OpenCV DNN option '{name}' is not available in this build, using '{default}'.")
+        constant = getattr(cv2.dnn, options[default])
+    return constant
+
+def configure_opencv_threads(num_threads=None):
+    """
+    Set the number of OpenCV threads, once per distinct value.
+
+    Args:
+        num_threads (int, optional): Value for cv2.setNumThreads. None keeps the current setting.
+    """
+    global _applied_num_threads
+    if num_threads is None or num_threads == _applied_num_threads:
+        return
+    cv2.setNumThreads(num_threads)
+    _applied_num_threads = num_threads
+    logger.info(f"OpenCV threads set to {num_threads} (effective: {cv2.getNumThreads()})")
+
+def _load_east_net(east_path, backend="default", target="cpu"):
+    net = cv2.dnn.readNet(east_path)
+    net.setPreferableBackend(_resolve_dnn_constant(DNN_BACKENDS, backend, "default"))
+    net.setPreferableTarget(_resolve_dnn_constant(DNN_TARGETS, target, "cpu"))
+    return net
+
+registry.register("east", _load_east_net)
+
+def get_east_net(east_path, backend=None, target=None):
+    """
+    Return the EAST network for east_path, read from disk once per process.
+
+    One network is cached per model path, backend and target. Backend and target
+    default to EAST_DNN_BACKEND and EAST_DNN_TARGET from the pipeline configuration.
+    """
+    backend = backend or EAST_DNN_BACKEND
+    target = target or EAST_DNN_TARGET
+    return registry.get("east", str(east_path), backend, target)
+
+
+def decode_predictions(scores, geometry, min_confidence=0.5):
+    """
+    Decode the EAST score and geometry maps into axis-aligned rectangles.
+
+    Every cell of the score map at or above min_confidence is decoded at once
+    with array operations instead of looping over rows and columns.
+
+    Parameters:
+    scores: ndarray
+        The score map of shape (1, 1, numRows, numCols).
+    geometry: ndarray
+        The geometry map of shape (1, 5, numRows, numCols).
+    min_confidence: float
+        The minimum probability required to keep a cell.
+
+    Returns:
+    tuple
+        An (N, 4) int array of (startX, startY, endX, endY) rectangles in the
+        resized image and an (N,) array of their probabilities.
+    """
+    # Find the cells above the minimum confidence, in row-major order
+    scores_map = scores[0, 0]
+    (ys, xs) = np.nonzero(scores_map >= min_confidence)
+    confidences = scores_map[ys, xs]
+
+    # Gather the distances to the four box edges and the rotation angle of every cell
+    (xData0, xData1, xData2, xData3, anglesData) = geometry[0, :, ys, xs].T
+    cos = np.cos(anglesData)
+    sin = np.sin(anglesData)
+
+    # Use the geometry to derive the width and height of the bounding boxes
+    h = xData0 + xData2
+    w = xData1 + xData3
+
+    # Compute the starting and ending (x, y)-coordinates, each feature map cell covers 4x4 pixels
+    offsetX = xs * 4.0
+    offsetY = ys * 4.0
+    endX = np.trunc(offsetX + (cos * xData1) + (sin * xData2))
+    endY = np.trunc(offsetY - (sin * xData1) + (cos * xData2))
+    startX = np.trunc(endX - w)
+    startY = np.trunc(endY - h)
+
+    rects = np.stack([startX, startY, endX, endY], axis=1).astype(int)
+    return rects, confidences
+
+
+# The two output layer names for the EAST detector model that we are interested in
+EAST_LAYER_NAMES = [
+    "feature_fusion/Conv_7/Sigmoid",
+    "feature_fusion/concat_3"
+]
+
+# Mean values subtracted from the RGB channels, as used when the EAST model was trained
+EAST_MEAN = (123.68, 116.78, 103.94)
+
+def _resolve_east_path(east_path):
     if east_path is None:
         east_path = str(east_model_path)  # Convert to string for cv2
         
@@ -58,27 +179,6 @@ def east_text_detection(image_path, east_path=None, min_confidence=0.5, width=32
         
     logger.debug(f"Using EAST model at: {east_path} (size: {Path(east_path).stat().st_size} bytes)")
 
-    # Load the input image and grab the image dimensions
-    orig = cv2.imread(image_path)
-    if orig is None:
-        raise FileNotFoundError(f"Image file not found: {image_path}")
-    (origH, origW) = orig.shape[:2]
-
-    # Set the new width and height and then determine the ratio in change for both the width and height
-    (newW, newH) = (width, height)
-    rW = origW / float(newW)
-    rH = origH / float(newH)
-
-    # Resize the image and grab the new image dimensions
-    image = cv2.resize(orig, (newW, newH))
-    (H, W) = image.shape[:2]
-
-    # Define the two output layer names for the EAST detector model that we are interested in
-    layerNames = [
-        "feature_fusion/Conv_7/Sigmoid",
-        "feature_fusion/concat_3"
-    ]
-
     # Load the pre-trained EAST text detector
     logger.debug("[INFO] Loading EAST text detector...")
     if east_model_path.exists():
@@ -86,101 +186,111 @@ def east_text_detection(image_path, east_path=None, min_confidence=0.5, width=32
     else:
         logger.debug(f"EAST model not found at {east_model_path}")
         raise FileNotFoundError(f"EAST model not found at {east_model_path}")
-    net = cv2.dnn.readNet(east_path)
+    return east_path
 
-    blob = cv2.dnn.blobFromImage(image, 1.0, (W, H),
-                                 (123.68, 116.78, 103.94), swapRB=True, crop=False)
-    
-    #start = time.time()
-    
-    net.setInput(blob)
-    (scores, geometry) = net.forward(layerNames)
-    
-    #end = time.time()
-
-    # Grab the number of rows and columns from the scores volume
-    (numRows, numCols) = scores.shape[2:4]
-    rects = []
-    confidences = []
-
-    # Loop over the rows
-    for y in range(0, numRows):
-        scoresData = scores[0, 0, y]
-        xData0 = geometry[0, 0, y]
-        xData1 = geometry[0, 1, y]
-        xData2 = geometry[0, 2, y]
-        xData3 = geometry[0, 3, y]
-        anglesData = geometry[0, 4, y]
-
-        # Loop over the columns
-        for x in range(0, numCols):
-            # Check if the score is above the minimum confidence
-            if scoresData[x] < min_confidence:
-                continue
-
-            # Compute the offset
-            (offsetX, offsetY) = (x * 4.0, y * 4.0)
-
-            # Extract the rotation angle
-            angle = anglesData[x]
-            cos = np.cos(angle)
-            sin = np.sin(angle)
-
-            # Use the geometry to derive the width and height of the bounding box
-            h = xData0[x] + xData2[x]
-            w = xData1[x] + xData3[x]
-
-            # Compute the starting and ending (x, y)-coordinates
-            endX = int(offsetX + (cos * xData1[x]) + (sin * xData2[x]))
-            endY = int(offsetY - (sin * xData1[x]) + (cos * xData2[x]))
-            startX = int(endX - w)
-            startY = int(endY - h)
-
-            # Add the bounding box coordinates and probability score to the lists
-            rects.append((startX, startY, endX, endY))
-            confidences.append(scoresData[x])
-
-    # Apply non-maxima suppression to suppress weak, overlapping bounding boxes
-    boxes = non_max_suppression(np.array(rects), probs=confidences)
-
-    output_boxes = []
-    output_confidences = []
-
-    # Loop over the bounding boxes and scale them
-    for i, (startX, startY, endX, endY) in enumerate(boxes):
-        # Scale the bounding box coordinates based on the respective ratios
-        startX = int(startX * rW)
-        startY = int(startY * rH)
-        endX = int(endX * rW)
-        endY = int(endY * rH)
-
-        # Draw the bounding box on the original image (optional)
-        # cv2.rectangle(orig, (startX, startY), (endX, endY), (0, 255, 0), 2)
-
-        # Append the scaled bounding box to the list of output boxes
-        output_boxes.append((startX, startY, endX, endY))
-
-        # Append the confidence score to the list of output confidences
-        output_confidences.append({
-            "startX": startX,
-            "startY": startY,
-            "endX": endX,
-            "endY": endY,
-            "confidence": float(confidences[i])
-        })
+def _read_image(image):
+    # Accept both image paths and already decoded frames (e.g. from a video)
+    if isinstance(image, np.ndarray):
+        return image
+    orig = cv2.imread(str(image))
+    if orig is None:
+        raise FileNotFoundError(f"Image file not found: {image}")
+    return orig
+
+def _postprocess_detections(scores, geometry, orig, min_confidence, width, height):
+    """
+    Turn the EAST output maps of one image into scaled boxes and JSON confidences.
+    """
+    # Determine the ratio in change for both the width and height
+    (origH, origW) = orig.shape[:2]
+    rW = origW / float(width)
+    rH = origH / float(height)
+
+    # Decode the score and geometry maps into rectangles and their probabilities
+    rects, confidences = decode_predictions(scores, geometry, min_confidence)
+
+    # Apply non-maxima suppression to suppress weak, overlapping bounding boxes,
+    # the kept indices keep the confidences aligned with their boxes
+    keep = non_max_suppression(
+        rects, confidences,
+        iou_threshold=EAST_NMS_IOU_THRESHOLD,
+        overlap_threshold=EAST_NMS_OVERLAP_THRESHOLD,
+        use_cv2=EAST_NMS_USE_CV2
+    )
+    # Scale the bounding box coordinates based on the respective ratios
+    output_boxes = BoxSet(rects[keep], confidences[keep], SOURCE_EAST).scale(rW, rH)
+
+    output_confidences = [
+        {"startX": startX, "startY": startY, "endX": endX, "endY": endY, "confidence": float(confidence)}
+        for (startX, startY, endX, endY), confidence in zip(output_boxes, output_boxes.scores)
+    ]
 
     # Sort and extend boxes if needed
-    output_boxes = sort_boxes(output_boxes)
-    output_boxes = extend_boxes_if_needed(orig, output_boxes)
+    output_boxes = extend_boxes_if_needed(orig, output_boxes.sort_by_line())
 
     # Return both the scaled bounding boxes and the confidence scores in JSON format
     return output_boxes, json.dumps(output_confidences)
 
-def sort_boxes(boxes):
-    # Define a threshold to consider boxes on the same line
-    vertical_threshold = 10
-
-    # Sort boxes by y-coordinate, then by x-coordinate if y-coordinates are similar
-    boxes.sort(key=lambda b: (round(b[1] / vertical_threshold), b[0]))
+def east_text_detection(image_path, east_path=None, min_confidence=0.5, width=320, height=320, backend=None, target=None, num_threads=None):
+    """
+    Detect text regions in a single image with EAST.
+
+    Returns:
+    tuple
+        A BoxSet of (startX, startY, endX, endY) boxes with their EAST confidences as scores,
+        and the confidences in JSON format.
+    """
+    return east_text_detection_batch([image_path], east_path, min_confidence, width, height, 1, backend, target, num_threads)[0]
+
+def east_text_detection_batch(images, east_path=None, min_confidence=0.5, width=320, height=320, batch_size=None, backend=None, target=None, num_threads=None):
+    """
+    Detect text regions in several images, e.g. all pages of a PDF or a chunk of video frames.
+
+    The images are resized to width x height, stacked with cv2.dnn.blobFromImages and
+    passed through the network in one forward pass per batch.
+
+    Parameters:
+    images: list
+        Image paths or BGR frames as numpy arrays.
+    east_path: str
+        The path to the EAST model. Defaults to the downloaded model.
+    min_confidence: float
+        The minimum probability required to inspect a region.
+    width, height: int
+        The network input size (should be multiples of 32).
+    batch_size: int
+        The number of images per forward pass. Defaults to EAST_BATCH_SIZE.
+
+    Returns:
+    list
+        One (boxes, confidences_json) tuple per input image, in the format of east_text_detection.
+    """
+    configure_opencv_threads(num_threads if num_threads is not None else OPENCV_NUM_THREADS)
+    east_path = _resolve_east_path(east_path)
+    net = get_east_net(east_path, backend, target)
+
+    if batch_size is None or batch_size < 1:
+        batch_size = EAST_BATCH_SIZE
+
+    results = []
+    for batch_start in range(0, len(images), batch_size):
+        # Load the input images and resize them to the network input size
+        originals = [_read_image(image) for image in images[batch_start:batch_start + batch_size]]
+        resized = [cv2.resize(orig, (width, height)) for orig in originals]
+
+        blob = cv2.dnn.blobFromImages(resized, 1.0, (width, height), EAST_MEAN, swapRB=True, crop=False)
+        net.setInput(blob)
+        (scores, geometry) = net.forward(EAST_LAYER_NAMES)
+
+        for i, orig in enumerate(originals):
+            results.append(_postprocess_detections(
+                scores[i:i + 1], geometry[i:i + 1], orig, min_confidence, width, height
+            ))
+
+        logger.debug(f"EAST processed images {batch_start + 1}-{batch_start + len(originals)}/{len(images)}")
+
+    return results
 
-    return boxes
\ No newline at end of file
+def sort_boxes(boxes):
+    # Sort boxes by line (y-coordinates within 10 px), then by x-coordinate
+    return BoxSet.from_tuples(boxes).sort_by_line(vertical_threshold=10).tolist()
\ No newline at end of file
@@ -0,0 +1,100 @@
+import string
+from functools import lru_cache
+import cv2
+from custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+'''
+Font Metrics
+
+The class in this script measures text drawn with the OpenCV Hershey fonts
+without calling cv2.getTextSize for every text. It replaces the hand-written
+letter size table of names_adder.py.
+
+For every font scale a table of the printable ASCII characters is built once
+from cv2.getTextSize: the advance of a character (how far the next one starts)
+and the width of the character on its own. The width of a text is the sum of
+the advances of all characters but the last, plus the width of the last one,
+which matches cv2.getTextSize exactly. Texts with other characters (which the
+Hershey fonts cannot draw) are measured with cv2.getTextSize.
+
+The height of a Hershey text only depends on the font and scale, so the
+largest font scale fitting a box height is found by a binary search over the
+scale grid (e.g. 1.0, 0.9, ..., 0.1).
+'''
+
+CHARACTERS = [c for c in string.printable if c not in "\t\n\r\x0b\x0c"]
+
+
+class FontMetrics:
+    def __init__(self, font, thickness):
+        """
+        Parameters:
+        font: int
+            OpenCV font face, e.g. cv2.FONT_HERSHEY_SIMPLEX.
+        thickness: int
+            Line thickness the text is drawn with.
+        """
+        self.font = font
+        self.thickness = thickness
+        self._tables = {}
+        self._heights = {}
+
+    def _table(self, scale):
+        # Scales are rounded, so 0.7 and 0.7000000000000001 share one table
+        key = round(scale, 6)
+        table = self._tables.get(key)
+        if table is None:
+            table = {}
+            for c in CHARACTERS:
+                width = cv2.getTextSize(c, self.font, scale, self.thickness)[0][0]
+                double_width = cv2.getTextSize(c * 2, self.font, scale, self.thickness)[0][0]
+                table[c] = (double_width - width, width)
+            self._tables[key] = table
+        return table
+
+    def height(self, scale):
+        """Height of any text at a font scale, as reported by cv2.getTextSize."""
+        key = round(scale, 6)
+        if key not in self._heights:
+            self._heights[key] = cv2.getTextSize("X", self.font, scale, self.thickness)[0][1]
+        return self._heights[key]
+
+    def text_size(self, text, scale):
+        """
+        Returns:
+        tuple
+            (width, height) of text at a font scale, equal to cv2.getTextSize(text, font, scale, thickness)[0].
+        """
+        if not text:
+            return cv2.getTextSize(text, self.font, scale, self.thickness)[0]
+        table = self._table(scale)
+        try:
+            width = sum(table[c][0] for c in text[:-1]) + table[text[-1]][1]
+        except KeyError:
+            return cv2.getTextSize(text, self.font, scale, self.thickness)[0]
+        return width, self.height(scale)
+
+    def fit_scale(self, box_height, max_scale=1.0, step=0.1, min_scale=0.1):
+        """
+        Return the largest font scale on the grid max_scale, max_scale - step, ..., min_scale
+        whose text height fits box_height, or min_scale if none fits.
+        """
+        count = int(round((max_scale - min_scale) / step)) + 1
+        scales = [round(max_scale - i * step, 6) for i in range(count)]
+        # Heights shrink along the grid, find the first scale that fits
+        (low, high) = (0, count)
+        while low < high:
+            middle = (low + high) // 2
+            if self.height(scales[middle]) <= box_height:
+                high = middle
+            else:
+                low = middle + 1
+        return scales[low] if low < count else scales[-1]
+
+
+@lru_cache(maxsize=None)
+def get_font_metrics(font, thickness):
+    """Return the shared FontMetrics of a font and thickness."""
+    return FontMetrics(font, thickness)
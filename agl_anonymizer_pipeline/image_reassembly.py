@@ -1,4 +1,5 @@
 import cv2
+import numpy as np
 from pathlib import Path
 import uuid
 from custom_logger import get_logger
@@ -12,7 +13,8 @@ def reassemble_image(modified_images_map, output_dir, id, original_image_path=No
 
     Args:
         modified_images_map (dict): A dictionary mapping tuple keys representing bounding box coordinates 
-                                    and original image path to the corresponding modified image paths.
+                                    and original image path to the corresponding modified image paths
+                                    or patches (ndarray).
         output_dir (str or Path): The directory where the reassembled image will be saved.
         id (str): An identifier used in the naming of the reassembled image file.
         original_image_path (str or Path): The path to the original image that will be reassembled.
@@ -34,8 +36,13 @@ def reassemble_image(modified_images_map, output_dir, id, original_image_path=No
 
     # Iterate through the modified images and overlay them onto the original image
     for ((box_key, original_image_path), modified_image_path) in modified_images_map.items():
-        logger.info(f"Processing box {box_key} with modified image {str(modified_image_path)}.")
-        modified_image = cv2.imread(str(modified_image_path))
+        if isinstance(modified_image_path, np.ndarray):
+            # Patches rendered in memory by names_adder
+            logger.info(f"Processing box {box_key} with a rendered patch.")
+            modified_image = modified_image_path
+        else:
+            logger.info(f"Processing box {box_key} with modified image {str(modified_image_path)}.")
+            modified_image = cv2.imread(str(modified_image_path))
         if modified_image is None:
             logger.warning(f"Could not load modified image from {str(modified_image_path)}. Skipping this modification.")
             continue
@@ -0,0 +1,155 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+'''
+LRU Store
+
+The class in this script is a bounded key-value cache shared by the caches of
+the pipeline (e.g. the OCR crop cache in ocr_cache.py).
+
+Entries are kept in memory in least recently used order. When the store holds
+max_entries entries, the least recently used one is evicted.
+
+If a path is given, every entry is also written to an SQLite table. Lookups
+that miss the memory tier fall back to the disk tier and move the entry back
+into memory, so results survive restarts and are shared between processes
+using the same file. Values must be JSON serializable.
+
+    store = LRUStore(max_entries=1024, path="cache.sqlite")
+    store.put("key", ["text", 0.9])
+    store.get("key")  # ["text", 0.9]
+'''
+
+
+class LRUStore:
+    def __init__(self, max_entries=1024, path=None, table="entries"):
+        """
+        Parameters:
+        max_entries: int
+            Maximum number of entries held in memory.
+        path: str or Path
+            Optional SQLite file of the disk tier. The file is opened on first use.
+        table: str
+            Table name in the SQLite file, so several stores can share one file.
+        """
+        self.max_entries = max(int(max_entries), 1)
+        self.path = Path(path) if path else None
+        self.table = table
+        self._entries = OrderedDict()
+        self._connection = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _db(self):
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT)")
+            self._connection.commit()
+        return self._connection
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key, default=None, count_miss=True):
+        """
+        Return the value of key from memory or disk, or default if it is not cached.
+
+        With count_miss=False a miss is not counted, e.g. when the caller looks further
+        and counts the outcome itself with record_miss.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+
+            if self.path is not None:
+                try:
+                    row = self._db().execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not read {self.path}: {e}")
+                    row = None
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            if count_miss:
+                self.misses += 1
+            return default
+
+    def record_miss(self):
+        """Count a miss of a lookup made with count_miss=False."""
+        with self._lock:
+            self.misses += 1
+
+    def put(self, key, value):
+        """
+        Store value under key in memory and, if configured, on disk.
+        """
+        with self._lock:
+            self._remember(key, value)
+            if self.path is not None:
+                try:
+                    self._db().execute(
+                        f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", (key, json.dumps(value))
+                    )
+                    self._db().commit()
+                except sqlite3.Error as e:
+                    logger.warning(f"Could not write {self.path}: {e}")
+
+    def keys(self):
+        """Keys held in memory, least recently used first."""
+        with self._lock:
+            return list(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hits (including disk hits), disk hits, misses, hit rate and the number of entries in memory.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(self._entries),
+        }
+
+    def clear(self, disk=False):
+        """
+        Drop the memory tier and reset the counters, and also the disk tier if disk is True.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+            if disk and self.path is not None:
+                self._db().execute(f"DELETE FROM {self.table}")
+                self._db().commit()
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
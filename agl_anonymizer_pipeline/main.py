@@ -199,7 +199,9 @@ def process_image(image_path: Path, east_path, device, min_confidence, width, he
             image_path, east_path, device, min_confidence, width, height
         )
         logger.info("Images processed")
-        logger.debug(f"Modified Images Map: {modified_images_map}")
+        # The values are rendered patches, log their shapes instead of the pixels
+        patch_shapes = {key: getattr(value, 'shape', value) for key, value in modified_images_map.items()}
+        logger.debug(f"Modified Images Map: {patch_shapes}")
 
         reassembled_image_path = reassemble_image(modified_images_map, results_dir, id, image_path)
         return reassembled_image_path, result
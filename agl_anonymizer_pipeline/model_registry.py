@@ -0,0 +1,109 @@
+import threading
+import time
+from custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+'''
+Model Registry
+
+The registry in this script loads every model of the pipeline once per process,
+on first use, and hands out the cached instance afterwards.
+
+Modules register a loader under a name when they are imported:
+
+    registry.register("trocr", _load_trocr_models)
+
+and request the model where it is needed:
+
+    processor, model, tokenizer, device = registry.get("trocr")
+
+Positional arguments passed to get() are forwarded to the loader and become part
+of the cache key, so e.g. one EAST network is cached per model path.
+
+Loading is thread-safe. Concurrent requests for the same model wait for a single
+load, while different models can be loaded in parallel.
+'''
+
+
+class ModelRegistry:
+    def __init__(self):
+        self._loaders = {}
+        self._instances = {}
+        self._load_times = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader):
+        """
+        Register a loader function for a model name.
+
+        Args:
+            name (str): The name the model is requested by.
+            loader (callable): Function that loads and returns the model.
+        """
+        with self._lock:
+            self._loaders[name] = loader
+
+    def get(self, name, *args):
+        """
+        Return the cached model for name and args, loading it on first use.
+
+        Args:
+            name (str): The registered model name.
+            *args: Hashable arguments forwarded to the loader.
+
+        Returns:
+            The object returned by the loader.
+        """
+        key = (name, args)
+        if key in self._instances:
+            return self._instances[key]
+
+        with self._lock:
+            if name not in self._loaders:
+                raise KeyError(f"No loader registered for model '{name}'")
+            loader = self._loaders[name]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have finished loading while we were waiting
+            if key in self._instances:
+                return self._instances[key]
+
+            logger.info(f"Loading model '{name}'{args if args else ''}...")
+            start = time.perf_counter()
+            instance = loader(*args)
+            load_time = time.perf_counter() - start
+
+            self._instances[key] = instance
+            self._load_times[key] = load_time
+            logger.info(f"Loaded model '{name}'{args if args else ''} in {load_time:.2f} s")
+            return instance
+
+    def is_loaded(self, name, *args):
+        return (name, args) in self._instances
+
+    def load_times(self):
+        """
+        Returns:
+            dict: Load time in seconds for every loaded model, keyed by "name" or "name(args)".
+        """
+        return {
+            (name if not args else f"{name}{args}"): load_time
+            for (name, args), load_time in self._load_times.items()
+        }
+
+    def clear(self, name=None):
+        """
+        Drop cached models, either all of them or every instance of one name.
+        """
+        with self._lock:
+            for key in list(self._instances):
+                if name is None or key[0] == name:
+                    del self._instances[key]
+                    self._load_times.pop(key, None)
+
+
+# Process-wide registry shared by all modules of the pipeline
+registry = ModelRegistry()
@@ -0,0 +1,207 @@
+import re
+import unicodedata
+from pathlib import Path
+from custom_logger import get_logger
+from model_registry import registry
+from pipeline_config import NAME_GAZETTEER_EXTRA, NAME_GAZETTEER_MAX_DISTANCE
+
+logger = get_logger(__name__)
+
+'''
+Name Gazetteer
+
+The gazetteer in this script matches OCR phrases against the first and last
+names shipped in names_dict (plus an optional extra list, one name per line,
+from NAME_GAZETTEER_EXTRA). It runs in microseconds per phrase and is used
+ahead of spaCy in ocr_pipeline_manager.split_and_check_batch:
+
+- as a prefilter: phrases without a plausible name token (numbers, dates,
+  times, device strings) skip spaCy entirely. Capitals with OCR confused
+  digits (M0LLER) are still names, device codes (CV190) are not.
+- as a fallback (off by default): capitalized names spaCy misses are still
+  reported as PER entities. The fallback only uses exact matches.
+
+Tokens are folded before matching: lower case, diacritics removed (ä -> a,
+ß -> ss) and characters OCR confuses with letters mapped to them (0 -> o,
+1 -> l, 5 -> s, ...). Folded tokens of at least FUZZY_MIN_LENGTH characters
+also match names at an edit distance of one (one character deleted, inserted
+or substituted), using a symmetric delete index: every name is stored with
+all its one-character deletes, so a lookup is a few set lookups instead of a
+comparison with every name. The candidates of the index are checked for an
+edit distance of one, since deleting a different character on both sides
+(e.g. sigma and simba share sima) is two substitutions.
+'''
+
+NAMES_DICT_DIR = Path(__file__).resolve().parent / 'names_dict'
+
+# Characters OCR confuses with letters, mapped to the letter
+CONFUSABLES = str.maketrans({'0': 'o', '1': 'l', '|': 'l', '!': 'l', '5': 's', '$': 's', '8': 'b', '@': 'a'})
+
+# Shorter folded tokens are only matched exactly, too many short words are one edit away from a name
+FUZZY_MIN_LENGTH = 5
+
+TOKEN_PATTERN = re.compile(r"[^\s,;:/()\[\]{}<>\"]+")
+
+
+def fold_token(token):
+    """Fold a token for matching: lower case, no diacritics, OCR confusables replaced, only letters kept."""
+    token = token.casefold().replace('ß', 'ss').translate(CONFUSABLES)
+    token = unicodedata.normalize('NFKD', token)
+    return ''.join(c for c in token if c.isalpha() and not unicodedata.combining(c))
+
+
+def is_word_shaped(token, gazetteer=None):
+    """
+    Return True if a token looks like a word that could be a name.
+
+    At least two letters and at least three quarters of the characters letters,
+    counting OCR confusables (0, 1, 5, ...) as letters. Capitals mixed with digits
+    look like device codes (e.g. CV190) and are only word shaped if the gazetteer
+    matches them, or if every digit is an OCR confusable, the token has at least two
+    real letters and the folded token at least three (e.g. M0LLER, SCHM1DT).
+    """
+    unconfused = token.translate(CONFUSABLES)
+    letters = [c for c in unconfused if c.isalpha()]
+    if len(letters) < 2 or len(letters) < 0.75 * len(token):
+        return False
+    real_letters = [c for c in token if c.isalpha()]
+    if not (any(c.isdigit() for c in token) and all(c.isupper() for c in real_letters)):
+        return True
+    if gazetteer is not None and gazetteer.match(token) is not None:
+        return True
+    return not any(c.isdigit() for c in unconfused) and len(real_letters) >= 2 and len(fold_token(token)) >= 3
+
+
+def _deletes(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+def _one_edit(a, b):
+    """Return True if a and b differ by at most one deleted, inserted or substituted character."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) > len(b):
+        (a, b) = (b, a)
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:]
+    return a[i:] == b[i + 1:]
+
+
+class NameGazetteer:
+    def __init__(self, names, max_distance=NAME_GAZETTEER_MAX_DISTANCE):
+        """
+        Parameters:
+        names: iterable
+            Names or full names, every whitespace or hyphen separated part is indexed.
+        max_distance: int
+            0 for exact matches only, 1 to also match at an edit distance of one.
+        """
+        self.max_distance = max_distance
+        self.names = set()
+        for name in names:
+            for token in name.split():
+                parts = [token] + (token.split('-') if '-' in token else [])
+                for part in parts:
+                    folded = fold_token(part)
+                    if len(folded) >= 2:
+                        self.names.add(folded)
+
+        # Symmetric delete index: one-character deletes of every long enough name
+        self._deletes = {}
+        if max_distance:
+            for name in self.names:
+                if len(name) >= FUZZY_MIN_LENGTH:
+                    for deleted in _deletes(name):
+                        self._deletes.setdefault(deleted, set()).add(name)
+
+    @classmethod
+    def from_files(cls, paths, max_distance=NAME_GAZETTEER_MAX_DISTANCE):
+        names = []
+        for path in paths:
+            with open(path, 'r', encoding='utf-8') as file:
+                names.extend(line.strip() for line in file if line.strip())
+        return cls(names, max_distance)
+
+    def __len__(self):
+        return len(self.names)
+
+    def match(self, token, fuzzy=True):
+        """
+        Return the name a token matches, or None.
+
+        With fuzzy=False only exact (folded) names match, even if max_distance is 1.
+        """
+        folded = fold_token(token)
+        if len(folded) < 2:
+            return None
+        if folded in self.names:
+            return folded
+        if not fuzzy or not self.max_distance or len(folded) < FUZZY_MIN_LENGTH:
+            return None
+
+        # A character missing in the token
+        candidates = set(self._deletes.get(folded, ()))
+        for deleted in _deletes(folded):
+            # An extra character in the token
+            if deleted in self.names:
+                candidates.add(deleted)
+            # A substituted character
+            candidates.update(self._deletes.get(deleted, ()))
+        matches = sorted(name for name in candidates if _one_edit(folded, name))
+        return matches[0] if matches else None
+
+    def find_names(self, phrase, fuzzy=True):
+        """
+        Return the (token, start, end) tuples of all tokens of a phrase matching a name.
+        """
+        found = []
+        for token_match in TOKEN_PATTERN.finditer(phrase):
+            token = token_match.group().strip(".-'")
+            if token and is_word_shaped(token, self) and self.match(token, fuzzy):
+                start = token_match.start() + token_match.group().index(token)
+                found.append((token, start, start + len(token)))
+        return found
+
+    def has_name(self, phrase):
+        return bool(self.find_names(phrase))
+
+    def person_span(self, phrase):
+        """
+        Return the text from the first to the last capitalized name token of a phrase, or None.
+
+        Only capitalized tokens are used, so common words that are also names
+        (e.g. Koch, Wolf) do not turn a sentence into a person entity. Tokens
+        are only matched exactly: German capitalizes every noun, and many are
+        one edit away from a name (Magen - Hagen, Leber - Weber).
+        """
+        found = [(start, end) for (token, start, end) in self.find_names(phrase, fuzzy=False) if token[0].isupper()]
+        if not found:
+            return None
+        return phrase[found[0][0]:found[-1][1]]
+
+
+def has_word_token(phrase, gazetteer=None):
+    """Return True if any token of a phrase is word shaped (see is_word_shaped)."""
+    return any(is_word_shaped(token.strip(".-'"), gazetteer) for token in TOKEN_PATTERN.findall(phrase))
+
+
+def _load_gazetteer(extra_path=None):
+    paths = sorted(NAMES_DICT_DIR.glob('*.txt'))
+    if extra_path:
+        if Path(extra_path).exists():
+            paths.append(Path(extra_path))
+        else:
+            logger.warning(f"Extra name list {extra_path} not found, using names_dict only")
+    gazetteer = NameGazetteer.from_files(paths)
+    logger.info(f"Name gazetteer built from {len(paths)} files with {len(gazetteer)} names")
+    return gazetteer
+
+registry.register("name_gazetteer", _load_gazetteer)
+
+
+def get_gazetteer(extra_path=None):
+    """Return the process-wide gazetteer of names_dict and the extra name list."""
+    return registry.get("name_gazetteer", extra_path or NAME_GAZETTEER_EXTRA)
@@ -8,12 +8,49 @@ from device_reader import read_device, read_text_formatting
 from directory_setup import create_temp_directory
 from box_operations import make_box_from_device_list, make_box_from_name, extend_boxes_if_needed
 from custom_logger import get_logger
+from font_metrics import get_font_metrics
+from lru_store import LRUStore
+from pipeline_config import TEXT_PATCH_CACHE_SIZE
 
 logger = get_logger(__name__)
 
 # Create or read temporary directory
 temp_dir, base_dir, csv_dir = create_temp_directory()
 
+# Rendered pseudonym patches, keyed by the text, font, scale, box size and colors
+name_patches = LRUStore(max_entries=TEXT_PATCH_CACHE_SIZE)
+
+def _cached_patch(key, draw):
+    """
+    Return the patch of key from name_patches, drawing it with draw() on a miss.
+
+    Cached patches are shared by all callers and read-only, copy a patch before drawing on it.
+    """
+    if TEXT_PATCH_CACHE_SIZE <= 0:
+        return draw()
+    key = "|".join(str(part) for part in key)
+    patch = name_patches.get(key)
+    if patch is None:
+        patch = draw()
+        if patch is None:
+            return None
+        patch.flags.writeable = False
+        name_patches.put(key, patch)
+    return patch
+
+def _box_size(box):
+    (startX, startY, endX, endY) = box
+    return (endX - startX, endY - startY)
+
+def save_patch(text_img, gender_par):
+    """Write a rendered patch to a new PNG file in the temporary directory and return its path."""
+    unique_id = str(uuid.uuid4())[:8]
+    output_filename = f"{gender_par}_{int(time.time())}_{unique_id}.png"
+    output_image_path = Path(temp_dir) / output_filename
+    cv2.imwrite(str(output_image_path), text_img)
+    logger.debug(f"Name image saved to {output_image_path}")
+    return output_image_path
+
 
 def format_name(name, format_string):
     names = name.split()
@@ -110,8 +147,14 @@ def draw_free_text(text, font, font_scale, font_color, font_thickness, backgroun
 
     return text_img
 
-def add_device_name_to_image(name, gender_par, device=None, font=None, font_size=100, background_color=(0, 0, 0), font_color=(255, 255, 255), text_formatting=None, line_spacing=40, font_scale=1, font_thickness=2):
-    
+def render_device_name(name, device=None, font=None, font_size=100, background_color=(0, 0, 0), font_color=(255, 255, 255), text_formatting=None, line_spacing=40, font_scale=1, font_thickness=2):
+    """
+    Render a name with the text formatting and name boxes of a device.
+
+    Returns:
+    ndarray
+        The read-only patch, shared with every other call for the same name, style and box sizes.
+    """
     try:
         device_config = read_device(device)
         if device_config is None:
@@ -140,19 +183,20 @@ def add_device_name_to_image(name, gender_par, device=None, font=None, font_size
         font = cv2.FONT_HERSHEY_SIMPLEX
 
     formatted_name = format_name(name, text_formatting)
-    if "\n" in formatted_name:
-        text_img = draw_text_with_line_break(formatted_name, font, font_scale, font_color, font_thickness, background_color, first_name_coords, last_name_coords, line_spacing)
-    else:
-        text_img = draw_text_without_line_break(formatted_name, font, font_scale, font_color, font_thickness, background_color, first_name_coords, last_name_coords, line_spacing)
+    draw = draw_text_with_line_break if "\n" in formatted_name else draw_text_without_line_break
+    key = ("device", formatted_name, font, font_scale, font_thickness, first_name_coords[2:], last_name_coords[2:], line_spacing, font_color, background_color)
+    return _cached_patch(key, lambda: draw(formatted_name, font, font_scale, font_color, font_thickness, background_color, first_name_coords, last_name_coords, line_spacing))
 
-    unique_id = str(uuid.uuid4())[:8]
-    output_filename = f"{gender_par}_{int(time.time())}_{unique_id}.png"
-    output_image_path = Path(temp_dir) / output_filename
-    cv2.imwrite(str(output_image_path), text_img)
+def add_device_name_to_image(name, gender_par, device=None, font=None, font_size=100, background_color=(0, 0, 0), font_color=(255, 255, 255), text_formatting=None, line_spacing=40, font_scale=1, font_thickness=2):
+    text_img = render_device_name(name, device, font, font_size, background_color, font_color, text_formatting, line_spacing, font_scale, font_thickness)
+    output_image_path = save_patch(text_img, gender_par)
     logger.debug(f"Temporary name image from device config saved to {output_image_path}")
-
     return output_image_path
 
+def fit_font_scale(font, box_height, font_thickness, max_scale=1.0):
+    """Return the largest font scale (in 0.1 steps, at least 0.1) whose text height fits box_height."""
+    return get_font_metrics(font, font_thickness).fit_scale(box_height, max_scale)
+
 def draw_text_to_fit(text, font, box, font_color, font_thickness, background_color):
     (startX, startY, endX, endY) = box
     box_width = endX - startX
@@ -162,13 +206,8 @@ def draw_text_to_fit(text, font, box, font_color, font_thickness, background_col
     text_img = np.full((box_height, box_width + 20, 3), background_color, dtype=np.uint8)
     
     # Find the maximum font scale that fits the text height inside the box
-    font_scale = 1.0
-    text_size = cv2.getTextSize(text, font, font_scale, font_thickness)[0]
-    while text_size[1] > box_height:
-        font_scale -= 0.1
-        text_size = cv2.getTextSize(text, font, font_scale, font_thickness)[0]
-        if font_scale <= 0.1:  # Prevent font_scale from becoming too small
-            break
+    font_scale = fit_font_scale(font, box_height, font_thickness)
+    text_size = get_font_metrics(font, font_thickness).text_size(text, font_scale)
 
     # Calculate the position to start the text
     text_x = 0  # Start at the beginning of the box (left side)
@@ -183,37 +222,8 @@ def draw_text_to_fit(text, font, box, font_color, font_thickness, background_col
     return text_img
 
 
-# Define letter size table
-LETTER_SIZE_TABLE = {
-    'a': (10, 20), 'b': (10, 20), 'c': (10, 20), 'd': (10, 20), 'e': (10, 20),
-    'f': (5, 20), 'g': (10, 20), 'h': (10, 20), 'i': (5, 20), 'j': (5, 20),
-    'k': (10, 20), 'l': (5, 20), 'm': (15, 20), 'n': (10, 20), 'o': (10, 20),
-    'p': (10, 20), 'q': (10, 20), 'r': (10, 20), 's': (10, 20), 't': (5, 20),
-    'u': (10, 20), 'v': (10, 20), 'w': (15, 20), 'x': (10, 20), 'y': (10, 20),
-    'z': (10, 20), 'A': (10, 20), 'B': (10, 20), 'C': (10, 20), 'D': (10, 20),
-    'E': (10, 20), 'F': (10, 20), 'G': (10, 20), 'H': (10, 20), 'I': (5, 20),
-    'J': (5, 20), 'K': (10, 20), 'L': (10, 20), 'M': (15, 20), 'N': (10, 20),
-    'O': (10, 20), 'P': (10, 20), 'Q': (10, 20), 'R': (10, 20), 'S': (10, 20),
-    'T': (10, 20), 'U': (10, 20), 'V': (10, 20), 'W': (15, 20), 'X': (10, 20),
-    'Y': (10, 20), 'Z': (10, 20), ' ': (5, 20), '0': (10, 20), '1': (5, 20),
-    '2': (10, 20), '3': (10, 20), '4': (10, 20), '5': (10, 20), '6': (10, 20),
-    '7': (10, 20), '8': (10, 20), '9': (10, 20)
-}
-
-
-def calculate_text_size(text, font_scale, font_thickness):
-    width = 0
-    height = 0
-    font_scale=font_scale
-    for char in text:
-        if char in LETTER_SIZE_TABLE:
-            char_width, char_height = LETTER_SIZE_TABLE[char]
-            width += int(char_width * font_scale)
-            height = max(height, int(char_height * font_scale))
-        else:
-            size = cv2.getTextSize(char, cv2.FONT_HERSHEY_SIMPLEX, font_scale, font_thickness)[0]
-            width += size[0]
-            height = max(height, size[1])
+def calculate_text_size(text, font_scale, font_thickness, font=cv2.FONT_HERSHEY_SIMPLEX):
+    width, height = get_font_metrics(font, font_thickness).text_size(text, font_scale)
     logger.debug(f"Text size calculated by calculate_text_size: ({width}, {height})")
     return width, height
 
@@ -236,7 +246,7 @@ def enlarge_box(box, required_width, required_height, padding=10):
 
 def draw_text_centered(text, font, font_scale, font_color, font_thickness, background_color, box, padding=10):
     # Calculate required text size
-    text_width, text_height = calculate_text_size(text, font_scale, font_thickness)
+    text_width, text_height = calculate_text_size(text, font_scale, font_thickness, font)
 
     # Enlarge box if necessary
     startX, startY, endX, endY = enlarge_box(box, text_width, text_height, padding)
@@ -258,8 +268,15 @@ def draw_text_centered(text, font, font_scale, font_color, font_thickness, backg
     return text_img
 
 
-def add_name_to_image(first_name, last_name, gender_par, first_name_box, last_name_box, device=None, font=None, font_size=100, background_color="(255, 255, 255)", font_color="(0, 0, 0)", text_formatting="first_name last_name", line_spacing=40, font_scale=1, font_thickness=2):
-    
+def render_name(first_name, last_name, first_name_box, last_name_box, device=None, font=None, font_size=100, background_color="(255, 255, 255)", font_color="(0, 0, 0)", text_formatting="first_name last_name", line_spacing=40, font_scale=1, font_thickness=2):
+    """
+    Render a first and last name fitted to their boxes, side by side.
+
+    Returns:
+    ndarray
+        The read-only patch, shared with every other call for the same names, style and box sizes,
+        or None without boxes.
+    """
     logger.info(f"Adding name to image: {first_name} {last_name}")
     try:
         config = read_text_formatting(device)
@@ -298,21 +315,24 @@ def add_name_to_image(first_name, last_name, gender_par, first_name_box, last_na
     #print(f"First name coords: {first_name_coords[0]}, {first_name_coords[1]}, {first_name_coords[2]}, {first_name_coords[3]}")
     #print(f"Last name coords: {last_name_coords[0]}, {last_name_coords[1]}, {last_name_coords[2]}, {last_name_coords[3]}")
 
-    # Draw the text on the image    
-    text_img_fn = draw_text_to_fit(first_name, font, first_name_box, font_color, font_thickness, background_color)
-    text_img_ln = draw_text_to_fit(last_name, font, last_name_box, font_color, font_thickness, background_color)
-    
-    # Concatenate with spacing to avoid overlapping
-    spacing = 0  # Add spacing between the two images
-    text_img = hconcat_resize_min_with_spacing([text_img_fn, text_img_ln], spacing=spacing)
+    def draw():
+        # Draw the text on the image    
+        text_img_fn = draw_text_to_fit(first_name, font, first_name_box, font_color, font_thickness, background_color)
+        text_img_ln = draw_text_to_fit(last_name, font, last_name_box, font_color, font_thickness, background_color)
+        
+        # Concatenate with spacing to avoid overlapping
+        spacing = 0  # Add spacing between the two images
+        return hconcat_resize_min_with_spacing([text_img_fn, text_img_ln], spacing=spacing)
 
-    unique_id = str(uuid.uuid4())
-    output_filename = f"{gender_par}_{int(time.time())}_{unique_id}.png"
-    output_image_path = Path(temp_dir) / output_filename
-    cv2.imwrite(str(output_image_path), text_img)
-    logger.debug(f"Name added to image. Image saved to {output_image_path}")
-    logger.info(f"Image saved to {output_image_path}")
+    key = ("separate", first_name, last_name, font, font_thickness, _box_size(first_name_box), _box_size(last_name_box), font_color, background_color)
+    return _cached_patch(key, draw)
 
+def add_name_to_image(first_name, last_name, gender_par, first_name_box, last_name_box, device=None, font=None, font_size=100, background_color="(255, 255, 255)", font_color="(0, 0, 0)", text_formatting="first_name last_name", line_spacing=40, font_scale=1, font_thickness=2):
+    text_img = render_name(first_name, last_name, first_name_box, last_name_box, device, font, font_size, background_color, font_color, text_formatting, line_spacing, font_scale, font_thickness)
+    if text_img is None:
+        return None
+    output_image_path = save_patch(text_img, gender_par)
+    logger.info(f"Image saved to {output_image_path}")
     return output_image_path
 
 def hconcat_resize_min_with_spacing(im_list, spacing=10, interpolation=cv2.INTER_CUBIC):
@@ -332,29 +352,38 @@ def hconcat_resize_min_with_spacing(im_list, spacing=10, interpolation=cv2.INTER
     return result_image
 
 
-def add_full_name_to_image(name, gender_par, box, font=None, font_size=100, background_color=(0, 0, 0), font_color=(255, 255, 255), font_scale=1, font_thickness=2):
+def render_full_name(name, box, font=None, font_size=100, background_color=(0, 0, 0), font_color=(255, 255, 255), font_scale=1, font_thickness=2):
+    """
+    Render a full name fitted to the height of a box, widened if the name overflows the box.
 
+    Returns:
+    ndarray
+        The read-only patch, shared with every other call for the same name, style and box size.
+    """
     StartX, StartY, EndX, EndY = box
     box_width = EndX - StartX
     if font is None:
         font = cv2.FONT_HERSHEY_SIMPLEX
 
-    text_img, font_scale = draw_text_to_fit(name, font, box, font_color, font_thickness, background_color)
+    def draw():
+        font_scale = fit_font_scale(font, EndY - StartY, font_thickness)
+        text_img = draw_text_to_fit(name, font, box, font_color, font_thickness, background_color)
 
-    # If the text overflows the box width, we create a larger canvas
-    text_size = cv2.getTextSize(name, font, font_scale, font_thickness)[0]
-    if text_size[0] > box_width:
-        # Create a new image with the same height but wider width to fit the text
-        new_width = text_size[0] + 20  # Add some padding
-        larger_text_img = np.full((text_img.shape[0], new_width, 3), background_color, dtype=np.uint8)
-        larger_text_img[:, :text_img.shape[1]] = text_img  # Copy the text image to the left side
-        text_img = larger_text_img
+        # If the text overflows the box width, we create a larger canvas
+        text_size = get_font_metrics(font, font_thickness).text_size(name, font_scale)
+        if text_size[0] > box_width:
+            # Create a new image with the same height but wider width to fit the text
+            new_width = text_size[0] + 20  # Add some padding
+            larger_text_img = np.full((text_img.shape[0], new_width, 3), background_color, dtype=np.uint8)
+            larger_text_img[:, :text_img.shape[1]] = text_img  # Copy the text image to the left side
+            text_img = larger_text_img
+        return text_img
 
-    # Generate the output filename and save the image
-    unique_id = str(uuid.uuid4())[:8]
-    output_filename = f"{gender_par}_{int(time.time())}_{unique_id}.png"
-    output_image_path = Path(temp_dir) / output_filename
-    cv2.imwrite(str(output_image_path), text_img)
-    logger.info(f"Image saved to {output_image_path}")
+    key = ("full", name, font, font_thickness, _box_size(box), font_color, background_color)
+    return _cached_patch(key, draw)
 
+def add_full_name_to_image(name, gender_par, box, font=None, font_size=100, background_color=(0, 0, 0), font_color=(255, 255, 255), font_scale=1, font_thickness=2):
+    text_img = render_full_name(name, box, font, font_size, background_color, font_color, font_scale, font_thickness)
+    output_image_path = save_patch(text_img, gender_par)
+    logger.info(f"Image saved to {output_image_path}")
     return output_image_path
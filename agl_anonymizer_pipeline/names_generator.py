@@ -1,9 +1,12 @@
 import random
+from functools import lru_cache
 import gender_guesser.detector as gender
 import os
-from names_adder import add_name_to_image, add_full_name_to_image, add_device_name_to_image
+from names_adder import render_name, render_full_name, render_device_name
 from directory_setup import create_temp_directory 
 from custom_logger import get_logger
+from model_registry import registry
+from pseudonym_mapping import pseudonyms
 from pathlib import Path
 
 
@@ -30,11 +33,13 @@ male_last_names_file = Path(names_dict_dir) / 'last_names_male_ascii.txt'
 
 # Load names from files
 def load_names(file_path):
-    with open(file_path, 'r') as file:
-        return [line.strip() for line in file]
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return tuple(name for name in (line.strip() for line in file) if name)
 
+# Immutable pseudonym pools, loaded once at import. Drawing a name is a random index into a tuple.
 female_names = load_names(female_names_file)
 male_names = load_names(male_names_file)
+neutral_names = female_names + male_names
 neutral_first_names = load_names(neutral_first_names_file)
 neutral_last_names = load_names(neutral_last_names_file)
 female_first_names = load_names(female_first_names_file)
@@ -42,74 +47,98 @@ female_last_names = load_names(female_last_names_file)
 male_first_names = load_names(male_first_names_file)
 male_last_names = load_names(male_last_names_file)
 
-def getindex(file):
-    # Only usable on opened file objects
-    file_length = len(file.readlines())
-    file.seek(0)  # Reset file pointer to the beginning
-    index = random.randint(0, file_length - 1)
-    return index
+# Full names and (first names, last names) per gender category
+FULL_NAME_POOLS = {
+    "male": male_names,
+    "female": female_names,
+    "neutral": neutral_names,
+}
+NAME_POOLS = {
+    "male": (male_first_names, male_last_names),
+    "female": (female_first_names, female_last_names),
+    "neutral": (neutral_first_names, neutral_last_names),
+}
+
+def _load_gender_detector():
+    # Parses the gender_guesser name dictionary, which takes a while, so it is only done once per process
+    return gender.Detector()
+
+registry.register("gender_detector", _load_gender_detector)
+
+@lru_cache(maxsize=4096)
+def guess_gender(first_name):
+    """
+    Return the gender_guesser result (male, mostly_male, female, mostly_female, andy or unknown) of a first name.
+
+    The detector is shared by the whole process and the results are cached per name.
+    """
+    return registry.get("gender_detector").get_gender(first_name)
+
+def gender_category(gender_guess):
+    """Map a gender_guesser result to the pseudonym pool: male, female or neutral (for unknown and andy)."""
+    if gender_guess in ['male', 'mostly_male']:
+        return "male"
+    if gender_guess in ['female', 'mostly_female']:
+        return "female"
+    return "neutral"
+
+def draw_name(category, real_name=None):
+    """
+    Return a (first name, last name) pair of a gender category.
+
+    With a real name, the pair is the stable pseudonym of that name (see pseudonym_mapping.py),
+    otherwise or in the random scope it is drawn at random.
+    """
+    (first_names, last_names) = NAME_POOLS[category]
+    if real_name is None or pseudonyms.is_random:
+        return random.choice(first_names), random.choice(last_names)
+    return (pseudonyms.choose(real_name, first_names, f"{category}_first"),
+            pseudonyms.choose(real_name, last_names, f"{category}_last"))
+
+def draw_full_name(category, real_name=None):
+    """Return a full name of a gender category, the stable pseudonym of real_name if given."""
+    if real_name is None or pseudonyms.is_random:
+        return random.choice(FULL_NAME_POOLS[category])
+    return pseudonyms.choose(real_name, FULL_NAME_POOLS[category], f"{category}_full")
+
+def _real_name(words):
+    return words if isinstance(words, str) else " ".join(words)
+
+def _first_name(words):
+    # Entities are passed as the detected text, older callers pass a list of words
+    if isinstance(words, str):
+        parts = words.split()
+        return parts[0] if parts else words
+    return words[0]
 
 def gender_and_handle_full_names(words, box, image_path, device="olympus_cv_1500"):
     logger.info("Finding out Gender and Name of full Name")
-    first_name = words[0]
+    first_name = _first_name(words)
 
-    d = gender.Detector()
-    gender_guess = d.get_gender(first_name)
+    gender_guess = guess_gender(first_name)
     box_to_image_map = {}
 
-    if gender_guess in ['male', 'mostly_male']:
-        name = random.choice(male_names)
-        output_image_path = add_full_name_to_image(name, "male", box, device)
-    elif gender_guess in ['female', 'mostly_female']:
-        name = random.choice(female_names)
-        output_image_path = add_full_name_to_image(name, "female", box, device)
-    else:  # 'unknown' or 'andy'
-        name = random.choice(female_names + male_names)
-        output_image_path = add_full_name_to_image(name, "neutral", box, device)
+    category = gender_category(gender_guess)
+    name = draw_full_name(category, _real_name(words))
+    # The rendered patch is cached in names_adder, a repeated pseudonym is not drawn again
+    patch = render_full_name(name, box)
 
     # Create a string key for the box to ensure it's hashable
     box_key = f"{box[0]},{box[1]},{box[2]},{box[3]}"
-    box_to_image_map[(box_key, image_path)] = output_image_path
+    box_to_image_map[(box_key, image_path)] = patch
     return box_to_image_map, gender_guess
 
 def gender_and_handle_separate_names(words, first_name_box, last_name_box, image_path, device):
     logger.info("Finding out gender and name of separate names")
-    first_name = words[0]
+    first_name = _first_name(words)
 
-    d = gender.Detector()
-    gender_guess = d.get_gender(first_name)
+    gender_guess = guess_gender(first_name)
     box_to_image_map = {}
 
-    if gender_guess in ['male', 'mostly_male']:
-        logger.info("Male gender")
-        with open(male_first_names_file, 'r') as file:
-            index = getindex(file)
-            male_first_name = male_first_names[index]
-        with open(male_last_names_file, 'r') as file:
-            index = getindex(file)
-            male_last_name = male_last_names[index]
-        name = f"{male_first_name} {male_last_name}"
-        output_image_path = add_name_to_image(male_first_name, male_last_name, "male", first_name_box, last_name_box, device)
-    elif gender_guess in ['female', 'mostly_female']:
-        logger.info("Female gender")
-        with open(female_first_names_file, 'r') as file:
-            index = getindex(file)
-            female_first_name = female_first_names[index]
-        with open(female_last_names_file, 'r') as file:
-            index = getindex(file)
-            female_last_name = female_last_names[index]
-        name = f"{female_first_name} {female_last_name}"
-        output_image_path = add_name_to_image(male_last_name, female_last_name, "female", first_name_box, last_name_box, device)
-    else:  # 'unknown' or 'andy'
-        logger.infont("Neutral or unknown gender")
-        with open(neutral_first_names_file, 'r') as file:
-            index = getindex(file)
-            neutral_first_name = neutral_first_names[index]
-        with open(neutral_last_names_file, 'r') as file:
-            index = getindex(file)
-            neutral_last_name = neutral_last_names[index]
-        name = f"{neutral_first_name} {neutral_last_name}"
-        output_image_path = add_name_to_image(neutral_first_name, neutral_last_name, "neutral", first_name_box, last_name_box, device)
+    category = gender_category(gender_guess)
+    logger.info(f"{category.capitalize()} gender")
+    (pseudonym_first_name, pseudonym_last_name) = draw_name(category, _real_name(words))
+    patch = render_name(pseudonym_first_name, pseudonym_last_name, first_name_box, last_name_box, device)
     
     startX_f, startY_f, endX_f, endY_f = first_name_box
     startX_l, startY_l, endX_l, endY_l = last_name_box
@@ -117,49 +146,23 @@ def gender_and_handle_separate_names(words, first_name_box, last_name_box, image
     
     # Create a string key for the box to ensure it's hashable
     box_key = f"{box[0]},{box[1]},{box[2]},{box[3]}"
-    box_to_image_map[(box_key, image_path)] = output_image_path
+    box_to_image_map[(box_key, image_path)] = patch
     return box_to_image_map, gender_guess
 
 def gender_and_handle_device_names(words, box, image_path, device="olympus_cv_1500"):
     logger.info("Finding out gender and name of device specified patient names")
-    first_name = words[0]
+    first_name = _first_name(words)
 
-    d = gender.Detector()
-    gender_guess = d.get_gender(first_name)
+    gender_guess = guess_gender(first_name)
     box_to_image_map = {}
 
-    if gender_guess in ['male', 'mostly_male']:
-        logger.info("Male gender")
-        with open(male_first_names_file, 'r') as file:
-            index = getindex(file)
-            male_first_name = male_first_names[index]
-        with open(male_last_names_file, 'r') as file:
-            index = getindex(file)
-            male_last_name = male_last_names[index]
-        name = f"{male_first_name} {male_last_name}"
-        output_image_path = add_device_name_to_image(name, "male", device)
-    elif gender_guess in ['female', 'mostly_female']:
-        logger.info("Female gender")
-        with open(female_first_names_file, 'r') as file:
-            index = getindex(file)
-            female_first_name = female_first_names[index]
-        with open(female_last_names_file, 'r') as file:
-            index = getindex(file)
-            female_last_name = female_last_names[index]
-        name = f"{female_first_name} {female_last_name}"
-        output_image_path = add_device_name_to_image(name, "female", device)
-    else:  # 'unknown' or 'andy'
-        logger.info("Neutral or unknown gender")
-        with open(neutral_first_names_file, 'r') as file:
-            index = getindex(file)
-            neutral_first_name = neutral_first_names[index]
-        with open(neutral_last_names_file, 'r') as file:
-            index = getindex(file)
-            neutral_last_name = neutral_last_names[index]
-        name = f"{neutral_first_name} {neutral_last_name}"
-        output_image_path = add_device_name_to_image(name, "neutral", device)
+    category = gender_category(gender_guess)
+    logger.info(f"{category.capitalize()} gender")
+    (pseudonym_first_name, pseudonym_last_name) = draw_name(category, _real_name(words))
+    name = f"{pseudonym_first_name} {pseudonym_last_name}"
+    patch = render_device_name(name, device)
 
     # Create a string key for the box to ensure it's hashable
     box_key = f"{box[0]},{box[1]},{box[2]},{box[3]}"
-    box_to_image_map[(box_key, image_path)] = output_image_path
+    box_to_image_map[(box_key, image_path)] = patch
     return box_to_image_map, gender_guess
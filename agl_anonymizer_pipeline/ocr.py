@@ -1,4 +1,5 @@
-from region_detector import expand_roi  # Ensure this module is correctly referenced
+from contextlib import nullcontext
+from box_set import BoxSet
 from PIL import Image
 from transformers import (
     ViTImageProcessor,
@@ -7,9 +8,13 @@ from transformers import (
     pipeline
 )
 import torch
-import pytesseract
+import tesseract_engine
 import numpy as np
+import cv2
 from custom_logger import get_logger
+from pipeline_config import TROCR_BATCH_SIZE, TROCR_QUANTIZATION, TROCR_BACKEND, TESSERACT_LANG, TESSERACT_BOX_MODE, TESSERACT_MONTAGE_GUTTER, TESSERACT_MONTAGE_MAX_HEIGHT
+from model_registry import registry
+from ocr_cache import ocr_cache
 
 logger = get_logger(__name__)
 # At the start of your script
@@ -18,9 +23,41 @@ if torch.cuda.is_available():
     logger.info(f"GPU Device: {torch.cuda.get_device_name(0)}")
     logger.info(f"Number of GPUs: {torch.cuda.device_count()}")
 
-def preload_models():
-    global processor, model, tokenizer, device
-
+# Parts of the TrOCR model quantized to int8 in each quantization mode
+TROCR_QUANTIZATION_MODES = {
+    "none": (),
+    "decoder": ("decoder",),
+    "full": ("decoder", "encoder"),
+}
+
+def quantize_trocr(model, quantization):
+    """
+    Apply PyTorch dynamic int8 quantization to the linear layers of the TrOCR model.
+
+    Weights are stored as int8 and activations are quantized on the fly, which only
+    runs on the CPU.
+
+    Parameters:
+    model: VisionEncoderDecoderModel
+        The fp32 TrOCR model on the CPU.
+    quantization: str
+        "none", "decoder" or "full" (decoder and encoder).
+
+    Returns:
+    VisionEncoderDecoderModel
+        The model with its quantized parts replaced.
+    """
+    if quantization not in TROCR_QUANTIZATION_MODES:
+        raise ValueError(f"Unknown TrOCR quantization '{quantization}', use one of {list(TROCR_QUANTIZATION_MODES)}")
+
+    model.eval()
+    for part in TROCR_QUANTIZATION_MODES[quantization]:
+        quantized = torch.ao.quantization.quantize_dynamic(getattr(model, part), {torch.nn.Linear}, dtype=torch.qint8)
+        setattr(model, part, quantized)
+        logger.info(f"Quantized TrOCR {part} linear layers to int8")
+    return model
+
+def _load_trocr_models(quantization="none"):
     logger.info("Preloading models...")
 
     # More explicit CUDA availability check
@@ -32,8 +69,8 @@ def preload_models():
         device = torch.device('cpu')
         logger.warning("CUDA not available, using CPU")
 
-    # Load models with CUDA memory optimization
-    with torch.cuda.device(device):
+    # Load models with CUDA memory optimization, torch.cuda.device only accepts CUDA devices
+    with torch.cuda.device(device) if device.type == 'cuda' else nullcontext():
         processor = ViTImageProcessor.from_pretrained('microsoft/trocr-base-str')
         model = VisionEncoderDecoderModel.from_pretrained('microsoft/trocr-base-str')
         tokenizer = AutoTokenizer.from_pretrained('microsoft/trocr-base-str')
@@ -45,6 +82,12 @@ def preload_models():
 
     model.to(device)
 
+    if quantization != "none":
+        if device.type == "cuda":
+            logger.warning(f"TrOCR quantization '{quantization}' is CPU only, keeping the model in its CUDA precision")
+        else:
+            model = quantize_trocr(model, quantization)
+
     # Optionally, set up the pipeline if you intend to use it
     # However, using both the pipeline and direct model calls can lead to confusion
     # It's recommended to choose one method. Below is commented out to avoid conflicts.
@@ -59,6 +102,17 @@ def preload_models():
     logger.info("Models preloaded successfully.")
     return processor, model, tokenizer, device
 
+registry.register("trocr", _load_trocr_models)
+
+def preload_models(quantization=None):
+    """
+    Return the TrOCR processor, model, tokenizer and device.
+
+    The models are loaded once per process on first use and cached in the model registry,
+    one model per quantization mode. The quantization defaults to TROCR_QUANTIZATION.
+    """
+    return registry.get("trocr", quantization or TROCR_QUANTIZATION)
+
 def cleanup_gpu():
     """Clean up GPU memory"""
     if torch.cuda.is_available():
@@ -74,88 +128,171 @@ def print_gpu_info():
         cudasupport = False
         return cudasupport
 
-def trocr_on_boxes(image_path, boxes):
+def _sequence_confidences(outputs, eos_token_id=None):
+    """
+    Compute one confidence score per generated sequence.
+
+    The score is the softmax probability of the token chosen at the last real
+    generation step of each sequence. In a batch, sequences that finished early
+    are padded afterwards, so the step where the EOS token was emitted is used
+    instead of the overall last step.
+    """
+    batch_size = outputs.sequences.shape[0]
+    scores = outputs.scores  # List of logits for each generation step
+    if not scores:
+        return [0.0] * batch_size  # Default confidence if scores are unavailable
+
+    # (batch, steps) probability of the most likely token at every step
+    step_probs = torch.stack(
+        [torch.nn.functional.softmax(step.float(), dim=-1).max(dim=-1).values for step in scores],
+        dim=1
+    )
+    last_step = torch.full((batch_size,), len(scores) - 1, dtype=torch.long, device=step_probs.device)
+
+    if eos_token_id is not None:
+        eos_ids = torch.tensor(
+            eos_token_id if isinstance(eos_token_id, (list, tuple)) else [eos_token_id],
+            device=outputs.sequences.device
+        )
+        generated = outputs.sequences[:, -len(scores):]
+        is_eos = torch.isin(generated, eos_ids)
+        first_eos = is_eos.int().argmax(dim=1).to(step_probs.device)
+        last_step = torch.where(is_eos.any(dim=1).to(step_probs.device), first_eos, last_step)
+
+    return step_probs.gather(1, last_step.unsqueeze(1)).squeeze(1).tolist()
+
+def _trocr_generate(pixel_values, model, tokenizer, device, cudasupport):
+    """
+    Decode a batch of preprocessed crops with a single generate call.
+
+    Returns the decoded texts and one confidence score per crop.
+    """
+    pixel_values = pixel_values.to(device)
+    # No autograd bookkeeping is needed for inference
+    with torch.inference_mode():
+        if cudasupport:
+            with torch.cuda.amp.autocast():  # Enable automatic mixed precision
+                outputs = model.generate(
+                    pixel_values,
+                    output_scores=True,
+                    return_dict_in_generate=True,
+                    max_new_tokens=50,
+                    use_cache=True  # Enable CUDA caching
+                )
+        else:
+            outputs = model.generate(
+                pixel_values,
+                output_scores=True,
+                return_dict_in_generate=True,
+                max_new_tokens=50
+            )
+
+    # Decode the output tokens into readable text
+    generated_texts = tokenizer.batch_decode(outputs.sequences, skip_special_tokens=True)
+    confidences = _sequence_confidences(outputs, model.generation_config.eos_token_id)
+    return generated_texts, confidences
+
+def trocr_on_boxes(image_path, boxes, batch_size=None, quantization=None, backend=None):
+    """
+    Run TrOCR on all boxes of an image.
+
+    All crops of the image are preprocessed into one padded tensor and decoded
+    in chunks of batch_size crops per generate call. Crops found in the OCR cache
+    are not decoded again.
+
+    Parameters:
+    image_path: str
+        The path to the image the boxes were detected in.
+    boxes: list
+        The bounding boxes as tuples of (startX, startY, endX, endY).
+    batch_size: int
+        The number of crops per generate call. Defaults to TROCR_BATCH_SIZE.
+    quantization: str
+        The TrOCR quantization mode ("none", "decoder" or "full"). Defaults to TROCR_QUANTIZATION.
+    backend: str
+        "torch" or "onnx" (see trocr_onnx.py). Defaults to TROCR_BACKEND.
+
+    Returns:
+    tuple
+        A list of (text, expanded_box) tuples and a list of confidence scores,
+        both in the order of the input boxes.
+    """
+    if batch_size is None or batch_size < 1:
+        batch_size = TROCR_BATCH_SIZE
+    backend = backend or TROCR_BACKEND
+
     try:
         image = Image.open(image_path).convert("RGB")
-        extracted_text_with_boxes = []
-        confidences = []
+        extracted_text_with_boxes = [("", box) for box in boxes]
+        confidences = [0.0] * len(boxes)
 
-        # Ensure models are loaded
-        processor, model, tokenizer, device = preload_models()
+        cache_config = f"{backend}|{quantization or TROCR_QUANTIZATION}"
 
         logger.debug("Processing image with TrOCR")
 
-        for idx, box in enumerate(boxes):
-            cudasupport = print_gpu_info()
-            try:
-                (startX, startY, endX, endY) = box
-
-                # Expand the region of interest
-                image_np = np.asarray(image)
-                image_shape = image_np.shape
-                expanded_box = expand_roi(startX, startY, endX, endY, 5, image_shape)
-                (startX_exp, startY_exp, endX_exp, endY_exp) = expanded_box
-
-                # Crop the image to the expanded box
-                cropped_image = image.crop((startX_exp, startY_exp, endX_exp, endY_exp))
-
-                # Process the cropped image using the processor
-                pixel_values = processor(
-                    cropped_image, 
-                    return_tensors="pt"
-                ).pixel_values
-                if cudasupport==True:
-                    # Move pixel_values to the same device as the model
-                    pixel_values = pixel_values.to(device)
-                    with torch.cuda.amp.autocast():  # Enable automatic mixed precision
-                        pixel_values = processor(
-                            cropped_image, 
-                            return_tensors="pt"
-                        ).pixel_values.to(device)
-
-                        # Generate text with CUDA optimizations
-                        outputs = model.generate(
-                            pixel_values, 
-                            output_scores=True, 
-                            return_dict_in_generate=True, 
-                            max_new_tokens=50,
-                            use_cache=True  # Enable CUDA caching
-                        )
-                else:
-                    continue
-                # Generate text predictions using the model
-                outputs = model.generate(
-                    pixel_values, 
-                    output_scores=True, 
-                    return_dict_in_generate=True, 
-                    max_new_tokens=50
-                )
+        # Expand all regions of interest at once
+        expanded = BoxSet.from_tuples(boxes).expand(5, (image.height, image.width))
 
-                # Decode the output tokens into readable text
-                generated_text = tokenizer.batch_decode(
-                    outputs.sequences, 
-                    skip_special_tokens=True
-                )[0]
-
-                # Calculate confidence score from the last token's scores
-                scores = outputs.scores  # List of logits for each generation step
-                if scores:
-                    # Take the scores from the last generation step
-                    last_scores = scores[-1]
-                    confidence_score = torch.nn.functional.softmax(last_scores, dim=-1).max().item()
-                else:
-                    confidence_score = 0.0  # Default confidence if scores are unavailable
+        # Crop every box of the image first, so they can be preprocessed together
+        crops = []
+        crop_indices = []
+        cache_keys = []
+        expanded_boxes = {}
+        for idx, (box, expanded_box) in enumerate(zip(boxes, expanded)):
+            (startX_exp, startY_exp, endX_exp, endY_exp) = expanded_box
+            if endX_exp <= startX_exp or endY_exp <= startY_exp:
+                logger.info(f"Skipping empty box {idx + 1}/{len(boxes)}: {box}")
+                continue
 
-                # Append results to the lists
-                extracted_text_with_boxes.append((generated_text.strip(), expanded_box))
-                confidences.append(confidence_score)
+            # Crop the image to the expanded box
+            crop = image.crop((startX_exp, startY_exp, endX_exp, endY_exp))
+            cache_key = ocr_cache.crop_key("trocr", cache_config, crop)
+            cached = ocr_cache.get(cache_key)
+            if cached is not None:
+                extracted_text_with_boxes[idx] = (cached[0], expanded_box)
+                confidences[idx] = cached[1]
+                continue
+
+            crops.append(crop)
+            crop_indices.append(idx)
+            cache_keys.append(cache_key)
+            expanded_boxes[idx] = expanded_box
+
+        if not crops:
+            logger.debug(f"All {len(boxes)} boxes were read from the OCR cache")
+            return extracted_text_with_boxes, confidences
 
-                logger.info(f"Processed box {idx + 1}/{len(boxes)}: '{generated_text.strip()}' with confidence {confidence_score:.4f}")
+        # Ensure models are loaded
+        if backend == "onnx":
+            from trocr_onnx import get_trocr_onnx
+            processor, onnx_model, tokenizer = get_trocr_onnx()
+        else:
+            processor, model, tokenizer, device = preload_models(quantization)
+            cudasupport = print_gpu_info()
+
+        # The processor resizes every crop to the model input size, so all crops share one tensor
+        pixel_values = processor(crops, return_tensors="np" if backend == "onnx" else "pt").pixel_values
 
+        for batch_start in range(0, len(crops), batch_size):
+            batch_indices = crop_indices[batch_start:batch_start + batch_size]
+            try:
+                batch_pixel_values = pixel_values[batch_start:batch_start + batch_size]
+                if backend == "onnx":
+                    generated_texts, batch_confidences = onnx_model.generate(batch_pixel_values, tokenizer)
+                else:
+                    generated_texts, batch_confidences = _trocr_generate(
+                        batch_pixel_values, model, tokenizer, device, cudasupport
+                    )
             except Exception as e:
-                logger.info(f"Error processing box {idx + 1}/{len(boxes)}: {e}")
-                extracted_text_with_boxes.append(("", box))
-                confidences.append(0.0)
+                logger.info(f"Error processing boxes {batch_start + 1}-{batch_start + len(batch_indices)}/{len(crops)}: {e}")
+                continue
+
+            batch_keys = cache_keys[batch_start:batch_start + batch_size]
+            for idx, cache_key, generated_text, confidence_score in zip(batch_indices, batch_keys, generated_texts, batch_confidences):
+                extracted_text_with_boxes[idx] = (generated_text.strip(), expanded_boxes[idx])
+                confidences[idx] = confidence_score
+                ocr_cache.put(cache_key, generated_text.strip(), confidence_score)
+                logger.info(f"Processed box {idx + 1}/{len(boxes)}: '{generated_text.strip()}' with confidence {confidence_score:.4f}")
 
         logger.debug("TrOCR processing complete")
         return extracted_text_with_boxes, confidences
@@ -165,35 +302,168 @@ def trocr_on_boxes(image_path, boxes):
     finally:
         cleanup_gpu()
 
-def tesseract_on_boxes(image_path, boxes):
+def _tesseract_montage(crops, gutter=None, max_height=None):
+    """
+    Read many crops with one Tesseract call per montage.
+
+    Used by tesseract_on_boxes in montage mode, which the pipeline itself does not call.
+
+    The crops are stacked vertically into montage images of at most max_height pixels.
+    Every crop is padded on all sides by gutter pixels replicating its border, so the
+    separators look like the background of the crop instead of adding edges. The
+    recognized words are mapped back to the crop whose rows contain their vertical center.
+
+    Parameters:
+    crops: list
+        RGB crops as numpy arrays.
+    gutter: int
+        Padding around every crop. Defaults to TESSERACT_MONTAGE_GUTTER.
+    max_height: int
+        Maximum height of a montage. Defaults to TESSERACT_MONTAGE_MAX_HEIGHT.
+
+    Returns:
+    tuple
+        A list of texts (lines joined by newlines) and a list of mean word confidences, one per crop.
+    """
+    gutter = TESSERACT_MONTAGE_GUTTER if gutter is None else gutter
+    max_height = TESSERACT_MONTAGE_MAX_HEIGHT if max_height is None else max_height
+
+    padded = [cv2.copyMakeBorder(crop, gutter, gutter, gutter, gutter, cv2.BORDER_REPLICATE) for crop in crops]
+    texts = [""] * len(crops)
+    confidences = [0.0] * len(crops)
+
+    # Split the crops into montages of at most max_height pixels, each with at least one crop
+    montages = []
+    current, current_height = [], 0
+    for idx, crop in enumerate(padded):
+        if current and current_height + crop.shape[0] > max_height:
+            montages.append(current)
+            current, current_height = [], 0
+        current.append(idx)
+        current_height += crop.shape[0]
+    if current:
+        montages.append(current)
+
+    for indices in montages:
+        width = max(padded[idx].shape[1] for idx in indices)
+        # Widen every crop to the montage width by replicating its right border
+        rows = [cv2.copyMakeBorder(padded[idx], 0, 0, 0, width - padded[idx].shape[1], cv2.BORDER_REPLICATE) for idx in indices]
+        row_ends = np.cumsum([row.shape[0] for row in rows])
+        montage = np.vstack(rows)
+
+        details = tesseract_engine.image_to_data(montage, config='--psm 6')
+
+        # Collect the words of every crop, grouped by line in reading order
+        crop_lines = {}
+        crop_confidences = {}
+        for i, word in enumerate(details['text']):
+            confidence = float(details['conf'][i])
+            word = str(word).strip()
+            if confidence < 0 or not word:
+                continue
+            center_y = details['top'][i] + details['height'][i] / 2
+            crop_index = indices[min(int(np.searchsorted(row_ends, center_y, side='right')), len(indices) - 1)]
+            line_key = (details['block_num'][i], details['par_num'][i], details['line_num'][i])
+            crop_lines.setdefault(crop_index, {}).setdefault(line_key, []).append(word)
+            crop_confidences.setdefault(crop_index, []).append(confidence)
+
+        for crop_index, lines in crop_lines.items():
+            texts[crop_index] = "\n".join(" ".join(words) for words in lines.values())
+            confidences[crop_index] = sum(crop_confidences[crop_index]) / len(crop_confidences[crop_index])
+
+    logger.debug(f"Read {len(crops)} crops with {len(montages)} Tesseract montage calls")
+    return texts, confidences
+
+def tesseract_on_boxes(image_path, boxes, mode=None):
+    """
+    Perform OCR with Tesseract on the specified bounding boxes.
+
+    Public API for callers that already have boxes to read, and used by the
+    benchmarks. process_images_with_OCR_and_NER does not call it, the pipeline
+    reads Tesseract text from one tesseract_page_ocr pass per page instead.
+
+    Parameters:
+    image_path: str
+        The path to the image file.
+    boxes: list
+        The bounding boxes as tuples of (startX, startY, endX, endY).
+    mode: str
+        "crop" runs Tesseract on every crop, "montage" packs the crops into a few
+        montage images and runs Tesseract once per montage. Defaults to TESSERACT_BOX_MODE.
+
+    Returns:
+    tuple
+        A list of (text, expanded_box) tuples and a list of confidence scores,
+        both in the order of the input boxes.
+    """
+    mode = mode or TESSERACT_BOX_MODE
+    cache_config = f"{mode}|{TESSERACT_LANG}"
     image = Image.open(image_path).convert("RGB")
     extracted_text_with_boxes = []
     confidences = []
 
-    logger.debug("Processing image with Tesseract OCR")
+    logger.debug(f"Processing image with Tesseract OCR ({mode} mode)")
+
+    # Expand all regions of interest at once
+    expanded = BoxSet.from_tuples(boxes).expand(5, (image.height, image.width))
+
+    if mode == "montage":
+        image_np = np.asarray(image)
+        valid = [idx for idx, (startX, startY, endX, endY) in enumerate(expanded) if endX > startX and endY > startY]
+        extracted_text_with_boxes = [("", box) for box in boxes]
+        confidences = [0.0] * len(boxes)
+
+        # Only crops missing from the OCR cache go into the montages
+        crops, missing, cache_keys = [], [], []
+        for idx in valid:
+            (startX, startY, endX, endY) = expanded[idx]
+            crop = image_np[startY:endY, startX:endX]
+            cache_key = ocr_cache.crop_key("tesseract", cache_config, crop)
+            cached = ocr_cache.get(cache_key)
+            if cached is not None:
+                extracted_text_with_boxes[idx] = (cached[0], expanded[idx])
+                confidences[idx] = cached[1]
+                continue
+            crops.append(crop)
+            missing.append(idx)
+            cache_keys.append(cache_key)
 
-    for idx, box in enumerate(boxes):
         try:
-            (startX, startY, endX, endY) = box
+            texts, crop_confidences = _tesseract_montage(crops) if crops else ([], [])
+        except Exception as e:
+            logger.info(f"Error processing montage of {len(crops)} boxes: {e}")
+            return extracted_text_with_boxes, confidences
 
-            # Expand the region of interest
-            image_np = np.asarray(image)
-            image_shape = image_np.shape
-            expanded_box = expand_roi(startX, startY, endX, endY, 5, image_shape)
+        for idx, cache_key, text, confidence_score in zip(missing, cache_keys, texts, crop_confidences):
+            extracted_text_with_boxes[idx] = (text.strip(), expanded[idx])
+            confidences[idx] = confidence_score
+            ocr_cache.put(cache_key, text.strip(), confidence_score)
+            logger.debug(f"Processed box {idx + 1}/{len(boxes)}: '{text.strip()}' with confidence {confidence_score:.2f}")
+
+        logger.info("Tesseract OCR processing complete")
+        return extracted_text_with_boxes, confidences
+
+    for idx, (box, expanded_box) in enumerate(zip(boxes, expanded)):
+        try:
             (startX_exp, startY_exp, endX_exp, endY_exp) = expanded_box
 
             # Crop the image to the expanded box
             cropped_image = image.crop((startX_exp, startY_exp, endX_exp, endY_exp))
 
-            # Use pytesseract to perform OCR on the cropped image
-            ocr_result = pytesseract.image_to_string(cropped_image, config='--psm 6')
+            cache_key = ocr_cache.crop_key("tesseract", cache_config, cropped_image)
+            cached = ocr_cache.get(cache_key)
+            if cached is not None:
+                extracted_text_with_boxes.append((cached[0], expanded_box))
+                confidences.append(cached[1])
+                continue
+
+            # Use Tesseract to perform OCR on the cropped image
+            ocr_result = tesseract_engine.image_to_string(cropped_image, config='--psm 6')
 
-            # Get confidence scores from pytesseract
-            details = pytesseract.image_to_data(cropped_image, output_type=pytesseract.Output.DICT)
-            text_confidences = [
-                int(conf) for conf in details['conf'] 
-                if isinstance(conf, (int, str)) and str(conf).isdigit()
-            ]
+            # Get confidence scores from Tesseract
+            details = tesseract_engine.image_to_data(cropped_image)
+            # Entries that are not words have a confidence of -1, Tesseract 5 reports decimal confidences
+            text_confidences = [float(conf) for conf in details['conf'] if float(conf) >= 0]
 
             # Calculate the average confidence score
             confidence_score = sum(text_confidences) / len(text_confidences) if text_confidences else 0.0
@@ -201,6 +471,7 @@ def tesseract_on_boxes(image_path, boxes):
             # Append results to the lists
             extracted_text_with_boxes.append((ocr_result.strip(), expanded_box))
             confidences.append(confidence_score)
+            ocr_cache.put(cache_key, ocr_result.strip(), confidence_score)
 
             logger.debug(f"Processed box {idx + 1}/{len(boxes)}: '{ocr_result.strip()}' with confidence {confidence_score:.2f}")
 
@@ -0,0 +1,149 @@
+import hashlib
+import cv2
+import numpy as np
+from custom_logger import get_logger
+from lru_store import LRUStore
+from pipeline_config import OCR_CACHE, OCR_CACHE_SIZE, OCR_CACHE_HASH, OCR_CACHE_TOLERANCE, OCR_CACHE_PATH
+
+logger = get_logger(__name__)
+
+'''
+OCR Crop Cache
+
+The cache in this script sits in front of the per-box OCR in ocr.py:
+trocr_on_boxes and tesseract_on_boxes. Endoscopy overlays repeat the same text
+regions (patient name, device labels, dates) over thousands of frames and
+reports, so a crop that was read before skips the OCR engine.
+
+In the pipeline (ocr_pipeline_manager) only TrOCR reads boxes, Tesseract reads
+every page once with tesseract_page_ocr, which is not cached. So the pipeline
+only saves TrOCR calls, the Tesseract entries are used by direct callers of
+tesseract_on_boxes.
+
+Entries are keyed by the engine, its configuration (e.g. backend and
+quantization of TrOCR, box mode of Tesseract) and a hash of the crop pixels:
+
+- exact: blake2b of the pixels and shape. Only identical crops hit.
+- perceptual: a difference hash (dHash) of the grayscale crop, plus the exact
+  crop size. Every pair of neighbouring cells of a 33 x 8 grid sets a rising
+  and a falling edge bit if their gray levels differ by more than HASH_MARGIN,
+  so flat background does not flip bits under noise. Crops of the same size
+  whose hashes differ in at most tolerance bits hit, which absorbs compression
+  noise and small shifts of the text. Near matches are only searched in the
+  memory tier, the disk tier is exact.
+
+The perceptual mode trades safety for hits: two names of the same length in
+the same overlay field (e.g. Muller and Mullar) can be near-identical crops,
+so one crop may get the text of another, i.e. the wrong name is pseudonymized
+or a name is missed. It is therefore off by default (OCR_CACHE_HASH=exact)
+and should only be used where the overlay text repeats exactly.
+
+The value is the recognized text and confidence. The cache is an LRUStore,
+bounded in memory and optionally backed by an SQLite file (OCR_CACHE_PATH).
+'''
+
+# dHash grid: 32 x 8 comparisons, wide because text crops are wide
+HASH_WIDTH = 32
+HASH_HEIGHT = 8
+HASH_MARGIN = 8
+HASH_BITS = 2 * HASH_WIDTH * HASH_HEIGHT
+
+
+def exact_hash(crop):
+    crop = np.ascontiguousarray(crop)
+    digest = hashlib.blake2b(crop.tobytes(), digest_size=16)
+    digest.update(str(crop.shape).encode())
+    return digest.hexdigest()
+
+
+def perceptual_hash(crop):
+    """Difference hash of a crop as an integer of HASH_BITS bits."""
+    crop = np.asarray(crop)
+    gray = cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY) if crop.ndim == 3 else crop
+    small = cv2.resize(gray, (HASH_WIDTH + 1, HASH_HEIGHT), interpolation=cv2.INTER_AREA)
+    difference = small[:, 1:].astype(np.int16) - small[:, :-1]
+    bits = np.concatenate([difference > HASH_MARGIN, difference < -HASH_MARGIN])
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class OCRCache:
+    def __init__(self, max_entries=OCR_CACHE_SIZE, path=OCR_CACHE_PATH, hash_mode=OCR_CACHE_HASH,
+                 tolerance=OCR_CACHE_TOLERANCE, enabled=OCR_CACHE):
+        """
+        Parameters:
+        max_entries: int
+            Maximum number of crops held in memory.
+        path: str or Path
+            Optional SQLite file of the disk tier.
+        hash_mode: str
+            exact or perceptual.
+        tolerance: int
+            Maximum number of differing perceptual hash bits for a hit.
+        enabled: bool
+            A disabled cache never hits and stores nothing.
+        """
+        if hash_mode not in ("exact", "perceptual"):
+            raise ValueError(f"Unknown OCR cache hash '{hash_mode}', use exact or perceptual")
+        if hash_mode == "perceptual" and enabled:
+            logger.warning("Perceptual OCR cache enabled, near-identical crops of different names can share a result")
+        self.hash_mode = hash_mode
+        self.tolerance = max(int(tolerance or 0), 0)
+        self.enabled = enabled
+        self.store = LRUStore(max_entries, path, table="ocr")
+
+    def crop_key(self, engine, config, crop):
+        """
+        Return the cache key of a crop read by engine with config, or None if the crop cannot be cached.
+        """
+        crop = np.asarray(crop)
+        if not self.enabled or crop.size == 0:
+            return None
+        if self.hash_mode == "exact":
+            return f"{engine}|{config}|{exact_hash(crop)}"
+        # Near matches are only searched among crops of the same size
+        size = f"{crop.shape[1]}x{crop.shape[0]}"
+        return f"{engine}|{config}|{size}|{perceptual_hash(crop):0{HASH_BITS // 4}x}"
+
+    def _nearest(self, key):
+        prefix, _, digest = key.rpartition("|")
+        target = int(digest, 16)
+        best, best_distance = None, self.tolerance + 1
+        for candidate in self.store.keys():
+            if not candidate.startswith(prefix + "|"):
+                continue
+            distance = (int(candidate.rpartition("|")[2], 16) ^ target).bit_count()
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    def get(self, key):
+        """
+        Returns:
+            tuple: The cached (text, confidence) of key, or None on a miss.
+        """
+        if key is None:
+            return None
+        fuzzy = self.hash_mode == "perceptual" and self.tolerance
+        # A fuzzy lookup counts one hit or one miss, not a miss of the exact key first
+        value = self.store.get(key, count_miss=not fuzzy)
+        if value is None and fuzzy:
+            nearest = self._nearest(key)
+            if nearest is not None:
+                value = self.store.get(nearest, count_miss=False)
+            if value is None:
+                self.store.record_miss()
+        return (value[0], value[1]) if value is not None else None
+
+    def put(self, key, text, confidence):
+        if key is not None:
+            self.store.put(key, [text, float(confidence)])
+
+    def stats(self):
+        return self.store.stats()
+
+    def clear(self, disk=False):
+        self.store.clear(disk)
+
+
+# Process-wide cache shared by the OCR engines
+ocr_cache = OCRCache()
@@ -1,13 +1,21 @@
-from ocr import trocr_on_boxes, tesseract_on_boxes
-from agl_anonymizer_pipeline.spacy_NER import NER_German
+from ocr import trocr_on_boxes
+from spacy_NER import NER_German_batch, person_entities, ner_memo
+from name_gazetteer import get_gazetteer, has_word_token
 from names_generator import gender_and_handle_full_names, gender_and_handle_separate_names, gender_and_handle_device_names
-from east_text_detection import east_text_detection
+from east_text_detection import east_text_detection_batch
 import re
 from pdf_operations import convert_pdf_to_images
-from blur import blur_function
+from blur import RedactionCompositor
 from device_reader import read_name_boxes, read_background_color
-from tesseract_text_detection import tesseract_text_detection
+from tesseract_text_detection import tesseract_page_ocr
+from pipeline_config import TESSERACT_LEVEL, OCR_MODE, OCR_RECONCILE, RECONCILE_MIN_OVERLAP, CASCADE_MIN_CONFIDENCE, CASCADE_MIN_PLAUSIBLE_RATIO, NAME_PREFILTER, NAME_GAZETTEER_FALLBACK
+from ocr_reconciliation import reconcile_ocr_results, match_tesseract_results
+from box_set import BoxSet
+from box_operations import fuse_boxes
+from ocr_cache import ocr_cache
+from pseudonym_mapping import pseudonyms
 import cv2
+import numpy as np
 import json
 from pathlib import Path
 import uuid
@@ -24,13 +32,13 @@ logger = get_logger(__name__)
 
 def find_or_create_close_box(phrase_box, boxes, image_width, offset=60):
     (startX, startY, endX, endY) = phrase_box
-    same_line_boxes = [box for box in boxes if abs(box[1] - startY) <= 10]
+    boxes = BoxSet.from_tuples(boxes)
 
-    if same_line_boxes:
-        same_line_boxes.sort(key=lambda box: box[0])
-        for box in same_line_boxes:
-            if box[0] > endX:
-                return box
+    # The closest box to the right of the phrase on the same line
+    same_line_right = (np.abs(boxes.startY - startY) <= 10) & (boxes.startX > endX)
+    if same_line_right.any():
+        candidates = np.flatnonzero(same_line_right)
+        return boxes[int(candidates[np.argmin(boxes.startX[candidates])])]
 
     new_startX = min(endX + offset, image_width)
     new_endX = new_startX + (endX - startX)
@@ -41,35 +49,105 @@ def combine_boxes(text_with_boxes):
     if not text_with_boxes:
         return text_with_boxes
 
-    text_with_boxes = sorted(text_with_boxes, key=lambda x: (x[1][1], x[1][0]))
+    texts = [text for text, _ in text_with_boxes]
+    boxes = BoxSet.from_tuples([box for _, box in text_with_boxes])
 
-    merged_text_with_boxes = [text_with_boxes[0]]
+    # Sort by startY, then startX
+    order = np.lexsort((boxes.startX, boxes.startY))
+    boxes = boxes[order]
+    texts = [texts[i] for i in order]
 
-    for current in text_with_boxes[1:]:
-        last = merged_text_with_boxes[-1]
-
-        current_text, current_box = current
-        last_text, last_box = last
-
-        (last_startX, last_startY, last_endX, last_endY) = last_box
+    # A box continues the previous one if it starts on the same line within 10 px of its end
+    merged_text_with_boxes = [(texts[0], boxes[0])]
+    for current_text, current_box in zip(texts[1:], boxes.tolist()[1:]):
+        last_text, (last_startX, last_startY, last_endX, last_endY) = merged_text_with_boxes[-1]
         (current_startX, current_startY, current_endX, current_endY) = current_box
 
         if last_startY == current_startY and (current_startX - last_endX) <= 10:
             merged_box = (min(last_startX, current_startX), last_startY, max(last_endX, current_endX), last_endY)
-            merged_text = last_text + ' ' + current_text
-            merged_text_with_boxes[-1] = (merged_text, merged_box)
+            merged_text_with_boxes[-1] = (last_text + ' ' + current_text, merged_box)
         else:
-            merged_text_with_boxes.append(current)
+            merged_text_with_boxes.append((current_text, current_box))
 
     return merged_text_with_boxes
 
+# Characters expected in overlay text, anything else hints at a misread
+PLAUSIBLE_CHARACTERS = re.compile(r"[\w\s.,:;\-/()'+&]")
+
+def is_plausible_text(text, min_ratio=CASCADE_MIN_PLAUSIBLE_RATIO):
+    """
+    Cheap check whether an OCR result looks like real overlay text.
+
+    The text needs at least one letter or digit, a share of expected characters of
+    at least min_ratio and no character repeated more than four times in a row.
+    """
+    text = text.strip()
+    if not any(char.isalnum() for char in text):
+        return False
+    if re.search(r"(.)\1{4,}", text):
+        return False
+    plausible = len(PLAUSIBLE_CHARACTERS.findall(text))
+    return plausible / len(text) >= min_ratio
+
+def cascade_ocr_on_boxes(image_path, boxes, tesseract_results, tesseract_confidences, min_confidence=CASCADE_MIN_CONFIDENCE,
+                         min_plausible_ratio=CASCADE_MIN_PLAUSIBLE_RATIO, min_overlap=RECONCILE_MIN_OVERLAP):
+    """
+    Read the boxes from the Tesseract page pass and escalate only uncertain boxes to TrOCR.
+
+    The words of the page pass are matched to the boxes like in reconcile_ocr_results, so
+    Tesseract is not run again per box. A box is escalated when no word matched it, its
+    mean Tesseract confidence (0-100) is below min_confidence or its text fails
+    is_plausible_text. TrOCR results replace the Tesseract results of the escalated
+    boxes, unless TrOCR returns no text. Every box keeps its fused geometry whichever
+    engine won. Words no box matched are kept as their own results.
+
+    Returns:
+    tuple
+        A list of (text, box) tuples, a list of confidences (0-1) and the number of escalated boxes.
+    """
+    boxes = BoxSet.from_tuples(boxes).tolist()
+    (matched_texts, unmatched) = match_tesseract_results(boxes, tesseract_results, tesseract_confidences, min_overlap)
+
+    results = []
+    confidences = []
+    escalate = []
+    for idx, (box, matched) in enumerate(zip(boxes, matched_texts)):
+        (text, confidence) = matched if matched is not None else ("", 0.0)
+        # Tesseract reports 0-100, TrOCR 0-1
+        results.append((text, box))
+        confidences.append(confidence / 100.0)
+        if confidence < min_confidence or not is_plausible_text(text, min_plausible_ratio):
+            escalate.append(idx)
+
+    if escalate:
+        trocr_results, trocr_confidences = trocr_on_boxes(image_path, [boxes[idx] for idx in escalate])
+        # Keep the fused box, trocr_on_boxes returns expanded boxes, so the redaction does not depend on the engine
+        for idx, (text, _), confidence in zip(escalate, trocr_results, trocr_confidences):
+            if text:
+                results[idx] = (text, boxes[idx])
+                confidences[idx] = confidence
+
+    for tesseract_index in unmatched:
+        results.append(tesseract_results[tesseract_index])
+        confidences.append(float(tesseract_confidences[tesseract_index]) / 100.0)
+
+    rate = len(escalate) / len(boxes) if boxes else 0.0
+    logger.info(f"OCR cascade escalated {len(escalate)}/{len(boxes)} boxes to TrOCR ({rate:.0%})")
+    return results, confidences, len(escalate)
+
 def process_images_with_OCR_and_NER(file_path, east_path='frozen_east_text_detection.pb', device="default", min_confidence=0.5, width=320, height=320):
     temp_dir, base_dir, csv_dir = create_temp_directory()
     logger.info(f"Processing file: {file_path}")
+    # Every name of the file keeps one pseudonym in the document scope
+    pseudonyms.begin_document(file_path)
     modified_images_map = {}
     combined_results = []
     names_detected = []
     gender_pars = []
+    ocr_alternatives = []
+    stats = {'boxes_detected': 0, 'boxes_fused': 0, 'ocr_calls_saved': 0, 'tesseract_calls': 0, 'trocr_boxes': 0}
+    cache_start = ocr_cache.stats()
+    memo_start = ner_memo.stats()
 
     try:
         file_extension = file_path.suffix.lower().lstrip('.')  # lstrip removes the leading '.'        
@@ -110,9 +188,14 @@ def process_images_with_OCR_and_NER(file_path, east_path='frozen_east_text_detec
             logger.error(error_message)
             raise RuntimeError(error_message)
 
-        blurred_image_path = image_paths[0]
-        for img_path in image_paths:
+        # Run EAST on all pages at once, one forward pass per batch of pages
+        east_detections = east_text_detection_batch(image_paths, east_path, min_confidence, width, height)
+
+        blurred_image_path = None
+        for page_index, img_path in enumerate(image_paths):
             logger.info(f"Processing image: {img_path}")
+            # Keep the page in memory and collect all redactions, the image is encoded once per page
+            compositor = RedactionCompositor.from_path(img_path)
             try:
                 first_name_box, last_name_box = read_name_boxes(device)
                 background_color = read_background_color(device)
@@ -122,29 +205,79 @@ def process_images_with_OCR_and_NER(file_path, east_path='frozen_east_text_detec
                 background_color = (0, 0, 0)
 
             if first_name_box and last_name_box:
-                blurred_image_path = blur_function(blurred_image_path, first_name_box, background_color)
-                blurred_image_path = blur_function(blurred_image_path, last_name_box, background_color)
-
-            east_boxes, east_confidences_json = east_text_detection(img_path, east_path, min_confidence, width, height)
-            tesseract_boxes, tesseract_confidences = tesseract_text_detection(img_path, min_confidence, width, height)
-            combined_boxes = east_boxes + tesseract_boxes
+                compositor.add_blur(first_name_box, background_color)
+                compositor.add_blur(last_name_box, background_color)
+
+            east_boxes, east_confidences_json = east_detections[page_index]
+            # One Tesseract call per page returns the boxes together with their text and confidence
+            tesseract_boxes, tesseract_results, tess_confidences = tesseract_page_ocr(img_path, min_confidence, TESSERACT_LEVEL)
+            stats['tesseract_calls'] += 1
+            # Fuse overlapping EAST and Tesseract detections, so every text region is only OCR'd once
+            combined_boxes = fuse_boxes(east_boxes, tesseract_boxes)
+            detected = len(east_boxes) + len(tesseract_boxes)
+            # Every removed duplicate saves one TrOCR call, Tesseract already read the whole page
+            ocr_calls_saved = detected - len(combined_boxes)
+            stats['boxes_detected'] += detected
+            stats['boxes_fused'] += len(combined_boxes)
+            stats['ocr_calls_saved'] += ocr_calls_saved
+            logger.info(f"Fused {len(east_boxes)} EAST and {len(tesseract_boxes)} Tesseract boxes into {len(combined_boxes)} text regions, saving {ocr_calls_saved} OCR calls")
 
             logger.info("Running OCR on boxes")
-            trocr_results, trocr_confidences = trocr_on_boxes(img_path, combined_boxes)
-            tesseract_results, tess_confidences = tesseract_on_boxes(img_path, combined_boxes)
-
-            all_ocr_results = trocr_results + tesseract_results
-            all_ocr_confidences = trocr_confidences + tess_confidences
-
-            for (phrase, phrase_box), ocr_confidence in zip(all_ocr_results, all_ocr_confidences):
-                blurred_image_path, modified_images_map, combined_results, genders = process_ocr_results(
-                    blurred_image_path, phrase, phrase_box, ocr_confidence,
+            if OCR_MODE == "cascade":
+                # One text per box from the page pass, TrOCR only where Tesseract is uncertain
+                all_ocr_results, all_ocr_confidences, escalated = cascade_ocr_on_boxes(
+                    img_path, combined_boxes, tesseract_results, tess_confidences
+                )
+                stats['trocr_boxes'] += escalated
+            else:
+                trocr_results, trocr_confidences = trocr_on_boxes(img_path, combined_boxes)
+                stats['trocr_boxes'] += len(combined_boxes)
+
+                if OCR_RECONCILE:
+                    # Only the best text of every box is processed, the other engine's text is kept as metadata
+                    all_ocr_results, all_ocr_confidences, reconciled = reconcile_ocr_results(
+                        trocr_results, trocr_confidences, tesseract_results, tess_confidences
+                    )
+                    ocr_alternatives.extend(reconciled)
+                else:
+                    all_ocr_results = trocr_results + tesseract_results
+                    all_ocr_confidences = trocr_confidences + tess_confidences
+
+            # Run NER on all phrases of the page at once
+            page_entities = split_and_check_batch([process_text(phrase) for phrase, _ in all_ocr_results])
+
+            for ((phrase, phrase_box), ocr_confidence), entities in zip(zip(all_ocr_results, all_ocr_confidences), page_entities):
+                modified_images_map, combined_results, genders = process_ocr_results(
+                    compositor, phrase, phrase_box, ocr_confidence,
                     combined_results, names_detected, device,
                     modified_images_map, combined_boxes,
-                    first_name_box, last_name_box
+                    first_name_box, last_name_box, entities
                 )
                 gender_pars.extend(genders)  # Assuming 'genders' is a list
 
+            blur_dir = create_blur_directory()
+            blurred_image_path = compositor.save(Path(blur_dir) / f"blurred_image_{uuid.uuid4()}.jpg")
+            logger.info(f"Final blurred image saved to: {blurred_image_path}")
+
+        # OCR cache hits and misses of this file
+        cache_end = ocr_cache.stats()
+        stats['ocr_cache_hits'] = cache_end['hits'] - cache_start['hits']
+        stats['ocr_cache_misses'] = cache_end['misses'] - cache_start['misses']
+        if stats['ocr_cache_hits']:
+            logger.info(f"OCR cache answered {stats['ocr_cache_hits']}/{stats['ocr_cache_hits'] + stats['ocr_cache_misses']} crops of the file")
+
+        # NER memo hits and misses of this file
+        memo_end = ner_memo.stats()
+        stats['ner_memo_hits'] = memo_end['hits'] - memo_start['hits']
+        stats['ner_memo_misses'] = memo_end['misses'] - memo_start['misses']
+        memo_lookups = stats['ner_memo_hits'] + stats['ner_memo_misses']
+        stats['ner_memo_hit_rate'] = stats['ner_memo_hits'] / memo_lookups if memo_lookups else 0.0
+        if memo_lookups:
+            logger.info(f"NER memo answered {stats['ner_memo_hits']}/{memo_lookups} phrases of the file ({stats['ner_memo_hit_rate']:.0%})")
+
+        if OCR_MODE == "cascade" and stats['boxes_fused']:
+            logger.info(f"OCR cascade escalated {stats['trocr_boxes']}/{stats['boxes_fused']} boxes of the file to TrOCR ({stats['trocr_boxes'] / stats['boxes_fused']:.0%})")
+
         # Prepare CSV writing
         csv_path = csv_dir / f"name_anonymization_data_i{Path(file_path).stem}{uuid.uuid4()}.csv"
         with open(csv_path, mode='w', newline='', encoding='utf-8') as csv_file:
@@ -177,17 +310,11 @@ def process_images_with_OCR_and_NER(file_path, east_path='frozen_east_text_detec
             'names_detected': names_detected,
             'combined_results': combined_results,
             'modified_images_map': modified_images_map,
-            'gender_pars': gender_pars  # Consistent key name
+            'gender_pars': gender_pars,  # Consistent key name
+            'ocr_alternatives': ocr_alternatives,
+            'stats': stats
         }
 
-        if blurred_image_path is not None:
-            output_filename = f"blurred_image_{uuid.uuid4()}.jpg"
-            blur_dir = create_blur_directory()
-            output_path = Path(blur_dir) / output_filename
-            final_image = cv2.imread(str(blurred_image_path))
-            cv2.imwrite(str(output_path), final_image)
-            logger.info(f"Final blurred image saved to: {output_path}")
-
         logger.info(f"Processing completed: {combined_results}")
         return modified_images_map, result
     except Exception as e:
@@ -205,7 +332,7 @@ def process_text(extracted_text):
 from typing import List, Tuple, Dict
 
 def process_ocr_results(
-    image_path: str,
+    compositor: RedactionCompositor,
     phrase: str,
     phrase_box: Tuple[int, int, int, int],
     ocr_confidence: float,
@@ -215,61 +342,115 @@ def process_ocr_results(
     modified_images_map: Dict[Tuple[str, str], str],
     combined_boxes: List[Tuple[int, int, int, int]],
     first_name_box: Tuple[int, int, int, int] = None,
-    last_name_box: Tuple[int, int, int, int] = None
-) -> Tuple[str, Dict[Tuple[str, str], str], List[Tuple[str, Tuple[int, int, int, int], float, List[Tuple[str, str]]]], List[str]]:
-    processed_text = process_text(phrase)
-    entities = split_and_check(processed_text)
+    last_name_box: Tuple[int, int, int, int] = None,
+    entities: List[Tuple[str, str]] = None
+) -> Tuple[Dict[Tuple[str, str], str], List[Tuple[str, Tuple[int, int, int, int], float, List[Tuple[str, str]]]], List[str]]:
+    if entities is None:
+        entities = split_and_check(process_text(phrase))
     logger.info(f"Entities detected: {entities}")
     
     box_to_image_map = {}
     gender_pars = []  # Changed from {} to []
-    new_image_path = image_path  # Keep track of the current image path being manipulated
+    image_path = str(compositor.source_path)  # Redactions are collected in the compositor, the source path identifies the page
 
     for entity in entities:
         name = entity[0]
         if first_name_box and last_name_box:
             if close_to_box(first_name_box, phrase_box) or close_to_box(last_name_box, phrase_box):
-                box_to_image_map, gender_par = gender_and_handle_device_names(name, phrase_box, new_image_path, device)
+                box_to_image_map, gender_par = gender_and_handle_device_names(name, phrase_box, image_path, device)
             else:
-                new_image_path, last_name_box = modify_image_for_name(new_image_path, phrase_box, combined_boxes)
-                box_to_image_map, gender_par = gender_and_handle_separate_names(name, phrase_box, last_name_box, new_image_path, device)
+                last_name_box = modify_image_for_name(compositor, phrase_box, combined_boxes)
+                box_to_image_map, gender_par = gender_and_handle_separate_names(name, phrase_box, last_name_box, image_path, device)
         else:
-            new_image_path, last_name_box = modify_image_for_name(new_image_path, phrase_box, combined_boxes)
-            box_to_image_map, gender_par = gender_and_handle_separate_names(name, phrase_box, last_name_box, new_image_path, device)
+            last_name_box = modify_image_for_name(compositor, phrase_box, combined_boxes)
+            box_to_image_map, gender_par = gender_and_handle_separate_names(name, phrase_box, last_name_box, image_path, device)
 
         names_detected.append(name)
         gender_pars.append(gender_par)  # Now valid since gender_pars is a list
-        for box_key, modified_image_path in box_to_image_map.items():
-            modified_images_map[(box_key, new_image_path)] = modified_image_path
+        for box_key, patch in box_to_image_map.items():
+            # The cached patch is drawn in memory with the other redactions, without writing it to disk
+            compositor.add_patch(tuple(map(int, box_key[0].split(','))), patch)
+            modified_images_map[(box_key, image_path)] = patch
 
     combined_results.append((phrase, phrase_box, ocr_confidence, entities))
-    return new_image_path, modified_images_map, combined_results, gender_pars  # Always return the last modified path
+    return modified_images_map, combined_results, gender_pars
 
 def close_to_box(name_box, phrase_box):
     (startX, startY, _, _) = phrase_box
     return abs(name_box[0] - startX) <= 10 and abs(name_box[1] - startY) <= 10
 
-def modify_image_for_name(image_path, phrase_box, combined_boxes):
-    image = cv2.imread(str(image_path))
-    image_height, image_width, _ = image.shape  
-    last_name_box = find_or_create_close_box(phrase_box, combined_boxes, image_width)
-    
-    temp_dir, base_dir, csv_dir = create_temp_directory()
-    temp_image_path = Path(temp_dir) / f"{uuid.uuid4()}.jpg"
-    cv2.imwrite(str(temp_image_path), image)
-    
-    return blur_function(temp_image_path, phrase_box), last_name_box
+def modify_image_for_name(compositor, phrase_box, combined_boxes):
+    last_name_box = find_or_create_close_box(phrase_box, combined_boxes, compositor.width)
+    compositor.add_blur(phrase_box)
+    return last_name_box
+
+def _split_parts(phrase):
+    return [phrase[:3], phrase[-3:], phrase[:4] + phrase[-4:], phrase[:5] + phrase[-5:], phrase[:6] + phrase[-6:]]
 
 def split_and_check(phrase):
-    entities = NER_German(phrase)
-    if entities:
-        return [(entity.text, entity.tag) for entity in entities if entity.tag == 'PER']
-    parts = [phrase[:3], phrase[-3:], phrase[:4] + phrase[-4:], phrase[:5] + phrase[-5:], phrase[:6] + phrase[-6:]]
-    for part in parts:
-        entities = NER_German(part)
-        if entities:
-            return [(entity.text, entity.tag) for entity in entities if entity.tag == 'PER']
-    return []
+    return split_and_check_batch([phrase])[0]
+
+def _needs_ner(phrase, prefilter, gazetteer):
+    if prefilter == "gazetteer":
+        return gazetteer.has_name(phrase)
+    if prefilter == "shape":
+        return has_word_token(phrase, gazetteer)
+    return True
+
+def split_and_check_batch(phrases, prefilter=NAME_PREFILTER, gazetteer_fallback=NAME_GAZETTEER_FALLBACK):
+    """
+    Find the person entities of every phrase, with at most two nlp.pipe calls in total.
+
+    Phrases rejected by the name prefilter (see name_gazetteer.py) skip spaCy. If spaCy
+    finds no person in a phrase and gazetteer_fallback is set, the capitalized, exactly matching
+    names of the gazetteer in it are used.
+    Phrases still without any entity are checked again on their parts (the first and last
+    characters), all parts of all phrases in one batch. The first part with entities
+    decides, as if the parts were checked one after another.
+
+    Parameters:
+    phrases: list
+        The processed OCR phrases of a page.
+    prefilter: str
+        "shape", "gazetteer" or "off". Defaults to NAME_PREFILTER.
+    gazetteer_fallback: bool
+        Use gazetteer names when spaCy finds no person. Defaults to NAME_GAZETTEER_FALLBACK.
+
+    Returns:
+    list
+        One list of (text, label) tuples of person entities per phrase.
+    """
+    gazetteer = get_gazetteer() if prefilter in ("gazetteer", "shape") or gazetteer_fallback else None
+    person_results = [[] for _ in phrases]
+    candidates = [idx for idx, phrase in enumerate(phrases) if _needs_ner(phrase, prefilter, gazetteer)]
+    logger.debug(f"Name prefilter passed {len(candidates)}/{len(phrases)} phrases to NER")
+    if not candidates:
+        return person_results
+
+    results = NER_German_batch([phrases[idx] for idx in candidates])
+    if results is None:
+        return person_results
+
+    retry = []
+    for idx, entities in zip(candidates, results):
+        persons = person_entities(entities)
+        if not persons and gazetteer_fallback:
+            span = gazetteer.person_span(phrases[idx])
+            if span:
+                persons = [(span, 'PER')]
+        person_results[idx] = persons
+        if not persons and not entities:
+            retry.append(idx)
+
+    if retry:
+        parts = [_split_parts(phrases[idx]) for idx in retry]
+        part_results = NER_German_batch([part for phrase_parts in parts for part in phrase_parts]) or []
+        offset = 0
+        for idx, phrase_parts in zip(retry, parts):
+            checked = part_results[offset:offset + len(phrase_parts)]
+            offset += len(phrase_parts)
+            person_results[idx] = next((person_entities(entities) for entities in checked if entities), [])
+    return person_results
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+from difflib import SequenceMatcher
+import numpy as np
+from box_set import BoxSet
+from custom_logger import get_logger
+from pipeline_config import RECONCILE_MIN_OVERLAP, RECONCILE_AGREEMENT_BONUS
+
+logger = get_logger(__name__)
+
+'''
+OCR Reconciliation
+
+The function in this script merges the results of the OCR engines into one
+text per box, so every text region is processed only once by NER, the
+pseudonym generator and the blur.
+
+TrOCR reads the fused boxes, while the Tesseract page pass returns its own
+word or line boxes. Every Tesseract result is matched to the TrOCR box that
+covers the largest share of it. The Tesseract results matched to one box are
+joined in reading order into one hypothesis.
+
+The hypotheses of a box are scored by their confidence (Tesseract reports
+0-100, which is normalized to 0-1 like TrOCR). Hypotheses that agree with each
+other get a bonus of RECONCILE_AGREEMENT_BONUS times their text similarity.
+The best hypothesis wins, the others are kept as alternatives.
+'''
+
+
+def text_similarity(a, b):
+    """Similarity of two texts between 0 and 1, ignoring case and surrounding whitespace."""
+    (a, b) = (a.strip().casefold(), b.strip().casefold())
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def _pick(hypotheses, agreement_bonus):
+    """Score the hypotheses of one box and return them best first."""
+    for hypothesis in hypotheses:
+        if not hypothesis["text"]:
+            hypothesis["score"] = float("-inf")
+            continue
+        agreement = max(
+            (text_similarity(hypothesis["text"], other["text"]) for other in hypotheses if other is not hypothesis),
+            default=0.0
+        )
+        hypothesis["score"] = hypothesis["confidence"] + agreement_bonus * agreement
+    return sorted(hypotheses, key=lambda hypothesis: hypothesis["score"], reverse=True)
+
+
+def match_tesseract_results(boxes, tesseract_results, tesseract_confidences, min_overlap=RECONCILE_MIN_OVERLAP):
+    """
+    Assign every Tesseract result to the box covering the largest share of it.
+
+    Parameters:
+    boxes: list
+        The boxes to read, e.g. the fused boxes.
+    tesseract_results: list
+        (text, box) tuples of Tesseract, e.g. from tesseract_page_ocr.
+    tesseract_confidences: list
+        Tesseract confidences (0-100).
+    min_overlap: float
+        Minimum share of a Tesseract box covered by a box to match them.
+
+    Returns:
+    tuple
+        Per box the (text, confidence) of its matched results, joined in reading order
+        with their mean confidence (0-100), or None without a match, and the indices of
+        the Tesseract results no box matched.
+    """
+    boxes = BoxSet.from_tuples(boxes)
+    tesseract_boxes = BoxSet.from_tuples([box for _, box in tesseract_results])
+
+    matches = [[] for _ in range(len(boxes))]
+    unmatched = []
+    if len(boxes) and len(tesseract_boxes):
+        coverage = boxes.coverage(tesseract_boxes)
+        best = coverage.argmax(axis=0)
+        for tesseract_index, box_index in enumerate(best):
+            if coverage[box_index, tesseract_index] >= min_overlap:
+                matches[box_index].append(tesseract_index)
+            else:
+                unmatched.append(tesseract_index)
+    else:
+        unmatched = list(range(len(tesseract_results)))
+
+    matched_texts = []
+    for matched in matches:
+        if not matched:
+            matched_texts.append(None)
+            continue
+        # Join the matched words or lines in reading order
+        order = tesseract_boxes[np.array(matched)].line_order()
+        matched = [matched[i] for i in order]
+        matched_texts.append((
+            " ".join(tesseract_results[i][0] for i in matched if tesseract_results[i][0]),
+            float(np.mean([tesseract_confidences[i] for i in matched])),
+        ))
+    return matched_texts, unmatched
+
+
+def reconcile_ocr_results(trocr_results, trocr_confidences, tesseract_results, tesseract_confidences,
+                          min_overlap=RECONCILE_MIN_OVERLAP, agreement_bonus=RECONCILE_AGREEMENT_BONUS):
+    """
+    Merge TrOCR and Tesseract results into one best text per box.
+
+    Parameters:
+    trocr_results: list
+        (text, box) tuples of TrOCR, one per fused box.
+    trocr_confidences: list
+        TrOCR confidences (0-1).
+    tesseract_results: list
+        (text, box) tuples of Tesseract, e.g. from tesseract_page_ocr.
+    tesseract_confidences: list
+        Tesseract confidences (0-100).
+    min_overlap: float
+        Minimum share of a Tesseract box covered by a TrOCR box to match them.
+    agreement_bonus: float
+        Score bonus for a hypothesis that agrees with the other engine.
+
+    Returns:
+    tuple
+        A list of (text, box) tuples, a list of confidences (0-1) and a list of
+        dicts with the winning engine and all hypotheses of every box.
+    """
+    (matched_texts, unmatched) = match_tesseract_results(
+        [box for _, box in trocr_results], tesseract_results, tesseract_confidences, min_overlap
+    )
+
+    results = []
+    confidences = []
+    metadata = []
+
+    def add(box, hypotheses):
+        ranked = _pick(hypotheses, agreement_bonus)
+        winner = ranked[0]
+        results.append((winner["text"], box))
+        confidences.append(winner["confidence"])
+        metadata.append({
+            "box": box,
+            "engine": winner["engine"],
+            "text": winner["text"],
+            "confidence": winner["confidence"],
+            "alternatives": ranked[1:],
+        })
+
+    for trocr_index, ((text, box), confidence) in enumerate(zip(trocr_results, trocr_confidences)):
+        hypotheses = [{"engine": "trocr", "text": text, "confidence": float(confidence)}]
+        if matched_texts[trocr_index] is not None:
+            (tesseract_text, tesseract_confidence) = matched_texts[trocr_index]
+            hypotheses.append({"engine": "tesseract", "text": tesseract_text, "confidence": tesseract_confidence / 100.0})
+        add(box, hypotheses)
+
+    for tesseract_index in unmatched:
+        (text, box) = tesseract_results[tesseract_index]
+        add(box, [{"engine": "tesseract", "text": text, "confidence": float(tesseract_confidences[tesseract_index]) / 100.0}])
+
+    processed = len(trocr_results) + len(tesseract_results)
+    logger.info(f"Reconciled {processed} OCR results into {len(results)} texts")
+    return results, confidences, metadata
@@ -0,0 +1,238 @@
+import os
+from custom_logger import get_logger
+
+logger = get_logger(__name__)
+
+'''
+Pipeline Configuration
+
+The values in this script define the tunable settings of the anonymization
+pipeline. Every value can be overridden through an environment variable,
+the same way the directory paths in directory_setup.py are configured.
+
+Settings:
+
+- TROCR_BATCH_SIZE (AGL_ANONYMIZER_TROCR_BATCH_SIZE):
+  - Number of cropped text regions decoded by TrOCR in one generate call.
+
+- TROCR_QUANTIZATION (AGL_ANONYMIZER_TROCR_QUANTIZATION):
+  - Dynamic int8 quantization of TrOCR on the CPU: none, decoder or full (decoder and encoder).
+
+- TROCR_BACKEND (AGL_ANONYMIZER_TROCR_BACKEND):
+  - torch runs TrOCR in PyTorch, onnx exports it once and runs it with ONNX Runtime (requires the onnx extra).
+
+- ONNX_NUM_THREADS (AGL_ANONYMIZER_ONNX_THREADS):
+  - Intra-op threads of the ONNX Runtime sessions. Unset keeps ONNX Runtime's default.
+
+- EAST_BATCH_SIZE (AGL_ANONYMIZER_EAST_BATCH_SIZE):
+  - Number of images or video frames passed through EAST in one forward pass.
+
+- EAST_DNN_BACKEND (AGL_ANONYMIZER_EAST_BACKEND):
+  - OpenCV DNN backend for the EAST network: default, opencv, openvino or cuda.
+
+- EAST_DNN_TARGET (AGL_ANONYMIZER_EAST_TARGET):
+  - OpenCV DNN target for the EAST network: cpu, cpu_fp16, opencl, opencl_fp16, cuda or cuda_fp16.
+
+- OPENCV_NUM_THREADS (AGL_ANONYMIZER_OPENCV_THREADS):
+  - Number of threads passed to cv2.setNumThreads. Unset keeps OpenCV's default.
+
+- EAST_NMS_OVERLAP_THRESHOLD (AGL_ANONYMIZER_EAST_NMS_OVERLAP):
+  - Suppress EAST candidates covered by more than this fraction by a stronger one. none disables it.
+
+- EAST_NMS_IOU_THRESHOLD (AGL_ANONYMIZER_EAST_NMS_IOU):
+  - Suppress EAST candidates with an IoU above this value. Unset or none disables it.
+
+- EAST_NMS_USE_CV2 (AGL_ANONYMIZER_EAST_NMS_USE_CV2):
+  - Use cv2.dnn.NMSBoxes instead of the built-in suppression.
+
+- DOMINANT_COLOR_METHOD (AGL_ANONYMIZER_DOMINANT_COLOR):
+  - How the dominant color of a region is computed: mean, median or histogram.
+
+- BOX_FUSION_IOU_THRESHOLD (AGL_ANONYMIZER_BOX_FUSION_IOU):
+  - EAST and Tesseract boxes overlapping with an IoU above this value are fused into one box before OCR. none disables fusion.
+
+- TESSERACT_LEVEL (AGL_ANONYMIZER_TESSERACT_LEVEL):
+  - Granularity of the single-pass Tesseract results fed to NER: word or line.
+
+- TESSERACT_ENGINE (AGL_ANONYMIZER_TESSERACT_ENGINE):
+  - auto uses the in-process libtesseract engine if it can be loaded, capi requires it, pytesseract always spawns the tesseract binary.
+
+- TESSERACT_LANG (AGL_ANONYMIZER_TESSERACT_LANG):
+  - Tesseract language(s), e.g. eng or deu+eng.
+
+- TESSERACT_BOX_MODE (AGL_ANONYMIZER_TESSERACT_BOX_MODE):
+  - How ocr.tesseract_on_boxes reads boxes: crop runs Tesseract per box, montage packs the crops into a few images. Only applies to direct callers and the benchmarks, the pipeline (including the cascade) reads Tesseract text from the single page pass and ignores it.
+
+- TESSERACT_MONTAGE_GUTTER (AGL_ANONYMIZER_TESSERACT_MONTAGE_GUTTER):
+  - Padding in pixels around every crop of a montage.
+
+- TESSERACT_MONTAGE_MAX_HEIGHT (AGL_ANONYMIZER_TESSERACT_MONTAGE_MAX_HEIGHT):
+  - Maximum height in pixels of one montage image.
+
+- OCR_MODE (AGL_ANONYMIZER_OCR_MODE):
+  - both runs TrOCR on every box next to the Tesseract page results, cascade reads every box from the Tesseract page results and runs TrOCR only on uncertain boxes.
+
+- CASCADE_MIN_CONFIDENCE (AGL_ANONYMIZER_CASCADE_MIN_CONFIDENCE):
+  - Boxes read by Tesseract with a lower mean word confidence (0-100) are escalated to TrOCR.
+
+- CASCADE_MIN_PLAUSIBLE_RATIO (AGL_ANONYMIZER_CASCADE_MIN_PLAUSIBLE_RATIO):
+  - Minimum share of letters, digits, spaces and common punctuation in a Tesseract text, below it the box is escalated to TrOCR.
+
+- OCR_RECONCILE (AGL_ANONYMIZER_OCR_RECONCILE):
+  - Merge the TrOCR and Tesseract results into one text per box before NER, instead of processing both.
+
+- RECONCILE_MIN_OVERLAP (AGL_ANONYMIZER_RECONCILE_MIN_OVERLAP):
+  - Minimum share of a Tesseract box covered by a TrOCR box to reconcile their texts.
+
+- RECONCILE_AGREEMENT_BONUS (AGL_ANONYMIZER_RECONCILE_AGREEMENT_BONUS):
+  - Score bonus, scaled by text similarity, for an OCR hypothesis the other engine agrees with.
+
+- OCR_CACHE (AGL_ANONYMIZER_OCR_CACHE):
+  - Cache the TrOCR and Tesseract results of every crop, so repeated text regions are read once. The pipeline only reads crops with TrOCR, its Tesseract page pass is not cached.
+
+- OCR_CACHE_SIZE (AGL_ANONYMIZER_OCR_CACHE_SIZE):
+  - Maximum number of crops held in memory, the least recently used ones are evicted.
+
+- OCR_CACHE_HASH (AGL_ANONYMIZER_OCR_CACHE_HASH):
+  - exact only reuses results of identical crops, perceptual also of crops of the same size with a similar difference hash. perceptual can give a crop the text of a near-identical crop, e.g. a name differing in one letter, so it is only safe for overlays whose text repeats exactly.
+
+- OCR_CACHE_TOLERANCE (AGL_ANONYMIZER_OCR_CACHE_TOLERANCE):
+  - Maximum number of differing bits (of 512) between perceptual hashes for a cache hit.
+
+- OCR_CACHE_PATH (AGL_ANONYMIZER_OCR_CACHE_PATH):
+  - Optional SQLite file that keeps the cached results across runs. Unset keeps the cache in memory only.
+
+- SPACY_PROFILE (AGL_ANONYMIZER_SPACY_PROFILE):
+  - ner loads spaCy without the tagger, parser and lemmatizer, full loads the complete pipeline.
+
+- SPACY_BATCH_SIZE (AGL_ANONYMIZER_SPACY_BATCH_SIZE):
+  - Number of phrases per spaCy nlp.pipe batch.
+
+- NAME_PREFILTER (AGL_ANONYMIZER_NAME_PREFILTER):
+  - Which phrases skip spaCy: shape skips phrases without a word shaped token (numbers, dates, device codes, but not names with OCR confused digits like M0LLER), gazetteer also skips phrases without a known name, off runs spaCy on every phrase.
+
+- NAME_GAZETTEER_FALLBACK (AGL_ANONYMIZER_NAME_GAZETTEER_FALLBACK):
+  - Report capitalized, exactly matching names from the gazetteer as PER entities when spaCy finds no person. Off by default, since capitalized German nouns can also be names.
+
+- NAME_GAZETTEER_EXTRA (AGL_ANONYMIZER_NAME_GAZETTEER_EXTRA):
+  - Optional text file with additional names, one per line.
+
+- NAME_GAZETTEER_MAX_DISTANCE (AGL_ANONYMIZER_NAME_GAZETTEER_MAX_DISTANCE):
+  - 1 also matches names with one OCR error (deleted, inserted or substituted character) in the gazetteer prefilter, 0 only exact names. The fallback always matches exactly.
+
+- NER_MEMO (AGL_ANONYMIZER_NER_MEMO):
+  - Reuse the NER results of phrases seen before (compared after folding whitespace and OCR confusables, case is kept). The entities are re-sliced from every phrase.
+
+- NER_MEMO_SIZE (AGL_ANONYMIZER_NER_MEMO_SIZE):
+  - Maximum number of phrases held in memory, the least recently used ones are evicted.
+
+- NER_MEMO_PATH (AGL_ANONYMIZER_NER_MEMO_PATH):
+  - Optional SQLite file that keeps the NER results across runs and processes. Unset keeps the memo in memory only.
+
+- PSEUDONYM_SCOPE (AGL_ANONYMIZER_PSEUDONYM_SCOPE):
+  - Where a real name keeps the same pseudonym: document, study, global or random (a new pseudonym per occurrence).
+
+- PSEUDONYM_SECRET (AGL_ANONYMIZER_PSEUDONYM_SECRET):
+  - Key of the pseudonym hash. Unset generates a random key per process.
+
+- PSEUDONYM_STUDY_ID (AGL_ANONYMIZER_PSEUDONYM_STUDY):
+  - Identifier of the study in the study scope.
+
+- PSEUDONYM_STORE_PATH (AGL_ANONYMIZER_PSEUDONYM_STORE):
+  - Optional SQLite file that keeps the chosen pseudonyms. Unset keeps them in memory only.
+
+- TEXT_PATCH_CACHE_SIZE (AGL_ANONYMIZER_TEXT_PATCH_CACHE_SIZE):
+  - Number of rendered pseudonym patches kept in memory and drawn directly into the frame. 0 renders every patch again.
+'''
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Invalid integer for {name}: {value}. Using default {default}.")
+        return default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    if value.strip().lower() == "none":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid number for {name}: {value}. Using default {default}.")
+        return default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+TROCR_BATCH_SIZE = _env_int("AGL_ANONYMIZER_TROCR_BATCH_SIZE", 16)
+TROCR_QUANTIZATION = os.getenv("AGL_ANONYMIZER_TROCR_QUANTIZATION", "none")
+TROCR_BACKEND = os.getenv("AGL_ANONYMIZER_TROCR_BACKEND", "torch")
+ONNX_NUM_THREADS = _env_int("AGL_ANONYMIZER_ONNX_THREADS", None)
+
+EAST_BATCH_SIZE = _env_int("AGL_ANONYMIZER_EAST_BATCH_SIZE", 8)
+EAST_DNN_BACKEND = os.getenv("AGL_ANONYMIZER_EAST_BACKEND", "default")
+EAST_DNN_TARGET = os.getenv("AGL_ANONYMIZER_EAST_TARGET", "cpu")
+OPENCV_NUM_THREADS = _env_int("AGL_ANONYMIZER_OPENCV_THREADS", None)
+
+EAST_NMS_OVERLAP_THRESHOLD = _env_float("AGL_ANONYMIZER_EAST_NMS_OVERLAP", 0.3)
+EAST_NMS_IOU_THRESHOLD = _env_float("AGL_ANONYMIZER_EAST_NMS_IOU", None)
+EAST_NMS_USE_CV2 = _env_bool("AGL_ANONYMIZER_EAST_NMS_USE_CV2", False)
+
+DOMINANT_COLOR_METHOD = os.getenv("AGL_ANONYMIZER_DOMINANT_COLOR", "mean")
+
+BOX_FUSION_IOU_THRESHOLD = _env_float("AGL_ANONYMIZER_BOX_FUSION_IOU", 0.3)
+
+TESSERACT_LEVEL = os.getenv("AGL_ANONYMIZER_TESSERACT_LEVEL", "word")
+
+TESSERACT_ENGINE = os.getenv("AGL_ANONYMIZER_TESSERACT_ENGINE", "auto")
+TESSERACT_LANG = os.getenv("AGL_ANONYMIZER_TESSERACT_LANG", "eng")
+
+TESSERACT_BOX_MODE = os.getenv("AGL_ANONYMIZER_TESSERACT_BOX_MODE", "crop")
+TESSERACT_MONTAGE_GUTTER = _env_int("AGL_ANONYMIZER_TESSERACT_MONTAGE_GUTTER", 16)
+TESSERACT_MONTAGE_MAX_HEIGHT = _env_int("AGL_ANONYMIZER_TESSERACT_MONTAGE_MAX_HEIGHT", 4000)
+
+OCR_MODE = os.getenv("AGL_ANONYMIZER_OCR_MODE", "both")
+CASCADE_MIN_CONFIDENCE = _env_float("AGL_ANONYMIZER_CASCADE_MIN_CONFIDENCE", 80.0)
+CASCADE_MIN_PLAUSIBLE_RATIO = _env_float("AGL_ANONYMIZER_CASCADE_MIN_PLAUSIBLE_RATIO", 0.8)
+
+OCR_RECONCILE = _env_bool("AGL_ANONYMIZER_OCR_RECONCILE", True)
+RECONCILE_MIN_OVERLAP = _env_float("AGL_ANONYMIZER_RECONCILE_MIN_OVERLAP", 0.5)
+RECONCILE_AGREEMENT_BONUS = _env_float("AGL_ANONYMIZER_RECONCILE_AGREEMENT_BONUS", 0.2)
+
+OCR_CACHE = _env_bool("AGL_ANONYMIZER_OCR_CACHE", True)
+OCR_CACHE_SIZE = _env_int("AGL_ANONYMIZER_OCR_CACHE_SIZE", 4096)
+OCR_CACHE_HASH = os.getenv("AGL_ANONYMIZER_OCR_CACHE_HASH", "exact")
+OCR_CACHE_TOLERANCE = _env_int("AGL_ANONYMIZER_OCR_CACHE_TOLERANCE", 8)
+OCR_CACHE_PATH = os.getenv("AGL_ANONYMIZER_OCR_CACHE_PATH") or None
+
+SPACY_PROFILE = os.getenv("AGL_ANONYMIZER_SPACY_PROFILE", "ner")
+SPACY_BATCH_SIZE = _env_int("AGL_ANONYMIZER_SPACY_BATCH_SIZE", 64)
+
+NAME_PREFILTER = os.getenv("AGL_ANONYMIZER_NAME_PREFILTER", "shape")
+NAME_GAZETTEER_FALLBACK = _env_bool("AGL_ANONYMIZER_NAME_GAZETTEER_FALLBACK", False)
+NAME_GAZETTEER_EXTRA = os.getenv("AGL_ANONYMIZER_NAME_GAZETTEER_EXTRA") or None
+NAME_GAZETTEER_MAX_DISTANCE = _env_int("AGL_ANONYMIZER_NAME_GAZETTEER_MAX_DISTANCE", 1)
+
+NER_MEMO = _env_bool("AGL_ANONYMIZER_NER_MEMO", True)
+NER_MEMO_SIZE = _env_int("AGL_ANONYMIZER_NER_MEMO_SIZE", 8192)
+NER_MEMO_PATH = os.getenv("AGL_ANONYMIZER_NER_MEMO_PATH") or None
+
+PSEUDONYM_SCOPE = os.getenv("AGL_ANONYMIZER_PSEUDONYM_SCOPE", "document")
+PSEUDONYM_SECRET = os.getenv("AGL_ANONYMIZER_PSEUDONYM_SECRET") or None
+PSEUDONYM_STUDY_ID = os.getenv("AGL_ANONYMIZER_PSEUDONYM_STUDY", "")
+PSEUDONYM_STORE_PATH = os.getenv("AGL_ANONYMIZER_PSEUDONYM_STORE") or None
+
+TEXT_PATCH_CACHE_SIZE = _env_int("AGL_ANONYMIZER_TEXT_PATCH_CACHE_SIZE", 1024)
@@ -0,0 +1,123 @@
+import hashlib
+import hmac
+import secrets
+from custom_logger import get_logger
+from lru_store import LRUStore
+from name_gazetteer import fold_token
+from pipeline_config import PSEUDONYM_SCOPE, PSEUDONYM_SECRET, PSEUDONYM_STUDY_ID, PSEUDONYM_STORE_PATH
+
+logger = get_logger(__name__)
+
+'''
+Pseudonym Mapping
+
+The mapper in this script replaces a real name with the same pseudonym every
+time it occurs within a scope, instead of drawing a new random name per
+occurrence. The 500 frames of one exam then show one consistent pseudonym,
+which names_adder also renders only once.
+
+A pseudonym is chosen from a name pool by a keyed hash (HMAC-SHA256) of the
+normalized real name (see name_gazetteer.fold_token, so OCR variants of a name
+map to the same pseudonym) and the scope:
+
+- document: stable within one file, set with begin_document().
+- study: stable within PSEUDONYM_STUDY_ID.
+- global: stable everywhere the same PSEUDONYM_SECRET is used.
+- random: a new random name per occurrence (the former behavior).
+
+Without PSEUDONYM_SECRET a random secret is generated per process, so study
+and global pseudonyms are only stable within the process. The real name cannot
+be recovered from the pseudonym without the secret.
+
+Chosen pseudonyms are cached in an LRUStore keyed by the hash, never by the
+real name. With PSEUDONYM_STORE_PATH the choices are also kept in an SQLite
+file, so they stay the same if the name pools change.
+'''
+
+SCOPES = ("document", "study", "global", "random")
+
+
+def normalize_name(name):
+    """Normalize a real name for the mapping: folded words (see fold_token), single spaces."""
+    return " ".join(folded for folded in (fold_token(part) for part in name.split()) if folded)
+
+
+class PseudonymMapper:
+    def __init__(self, scope=PSEUDONYM_SCOPE, secret=PSEUDONYM_SECRET, study_id=PSEUDONYM_STUDY_ID,
+                 store_path=PSEUDONYM_STORE_PATH, max_entries=4096):
+        """
+        Parameters:
+        scope: str
+            document, study, global or random.
+        secret: str or bytes
+            HMAC key. Defaults to a random secret per process.
+        study_id: str
+            Identifier of the study in the study scope.
+        store_path: str or Path
+            Optional SQLite file of the chosen pseudonyms.
+        max_entries: int
+            Maximum number of choices held in memory.
+        """
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown pseudonym scope '{scope}', use one of {list(SCOPES)}")
+        if secret is None:
+            if scope in ("study", "global"):
+                logger.warning(f"No pseudonym secret configured, {scope} pseudonyms are only stable within this process")
+            secret = secrets.token_bytes(32)
+        self.scope = scope
+        self.secret = secret.encode() if isinstance(secret, str) else secret
+        self.study_id = study_id
+        self.document_id = ""
+        self.store = LRUStore(max_entries, store_path, table="pseudonyms")
+
+    @property
+    def is_random(self):
+        return self.scope == "random"
+
+    def begin_document(self, document_id):
+        """Set the document of the document scope, e.g. the path of the file being processed."""
+        self.document_id = str(document_id)
+
+    def _scope_id(self):
+        if self.scope == "document":
+            return f"document:{self.document_id}"
+        if self.scope == "study":
+            return f"study:{self.study_id}"
+        return "global"
+
+    def digest(self, real_name, pool_name):
+        """Keyed hash of a normalized real name, the pool and the scope."""
+        message = f"{self._scope_id()}|{pool_name}|{normalize_name(real_name)}".encode()
+        return hmac.new(self.secret, message, hashlib.sha256).digest()
+
+    def choose(self, real_name, pool, pool_name):
+        """
+        Return the pseudonym of real_name in pool.
+
+        Parameters:
+        real_name: str
+            The detected name.
+        pool: tuple
+            The names to choose from.
+        pool_name: str
+            Identifies the pool (e.g. "female_first"), so every pool gets an independent choice.
+
+        Returns:
+        str
+            The same element of pool for every occurrence of real_name within the scope.
+        """
+        digest = self.digest(real_name, pool_name)
+        key = f"{pool_name}|{digest.hex()}"
+        cached = self.store.get(key)
+        if cached is not None:
+            return cached
+        pseudonym = pool[int.from_bytes(digest[:8], "big") % len(pool)]
+        self.store.put(key, pseudonym)
+        return pseudonym
+
+    def stats(self):
+        return self.store.stats()
+
+
+# Process-wide mapper shared by the name generators
+pseudonyms = PseudonymMapper()
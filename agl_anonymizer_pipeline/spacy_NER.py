@@ -1,46 +1,194 @@
+import re
+from bisect import bisect_left
 import spacy
 from custom_logger import get_logger
+from model_registry import registry
+from lru_store import LRUStore
+from name_gazetteer import CONFUSABLES
+from pipeline_config import SPACY_PROFILE, SPACY_BATCH_SIZE, NER_MEMO, NER_MEMO_SIZE, NER_MEMO_PATH
 
 logger = get_logger(__name__)
 
-try:
-    logger.info("Loading spaCy German NER model...")
-    nlp = spacy.load("de_core_news_md")
-    logger.info("spaCy German NER model loaded successfully.")
-except Exception as e:
-    logger.error(f"Failed to load spaCy German NER model: {e}")
-    nlp = None
+'''
+spaCy German NER
 
-def NER_German(text):
-    if not isinstance(text, str):
-        logger.error(f"Expected a string, but got {type(text)}")
+The functions in this script run the German spaCy model (de_core_news_md)
+to find entities in the OCR results.
+
+The model is loaded once per profile through the model registry:
+
+- ner: only the tokenizer and the components the entity recognizer needs.
+  The tagger, morphologizer, parser, lemmatizer and attribute ruler are
+  excluded, since the pipeline only uses entities.
+- full: the complete pipeline.
+
+NER_German_batch runs all phrases of a page through nlp.pipe in batches of
+SPACY_BATCH_SIZE phrases, instead of one nlp call per phrase.
+
+The results are memoized in ner_memo, an LRUStore (optionally backed by the
+SQLite file NER_MEMO_PATH), since the same overlay strings come back on every
+frame and page. The key is the model name, version and profile plus the
+normalized phrase: whitespace collapsed and OCR confusables mapped to letters
+(see name_gazetteer.CONFUSABLES). Case is kept, since spaCy labels depend on it.
+Phrases with the same key are only passed to spaCy once per batch. The memo
+stores the entity labels with character spans in the normalized phrase, which
+are mapped back onto every phrase sharing the key, so the entity text and
+offsets always come from the phrase itself.
+'''
+
+SPACY_MODEL_NAME = "de_core_news_md"
+
+# Components excluded in the ner profile, entities do not depend on them
+NER_EXCLUDED_COMPONENTS = ["tagger", "morphologizer", "parser", "lemmatizer", "attribute_ruler", "senter"]
+
+# Entity labels of persons (PER in the German models, PERSON in the English ones)
+PERSON_LABELS = ("PER", "PERSON")
+
+# Process-wide memo of NER results
+ner_memo = LRUStore(NER_MEMO_SIZE, NER_MEMO_PATH, table="ner")
+
+def _load_spacy_german(profile="full"):
+    try:
+        logger.info(f"Loading spaCy German NER model ({profile} profile)...")
+        exclude = NER_EXCLUDED_COMPONENTS if profile == "ner" else []
+        nlp = spacy.load(SPACY_MODEL_NAME, exclude=exclude)
+        logger.info(f"spaCy German NER model loaded successfully with components {nlp.pipe_names}.")
+        return nlp
+    except Exception as e:
+        logger.error(f"Failed to load spaCy German NER model: {e}")
         return None
 
+registry.register("spacy_de", _load_spacy_german)
+
+def get_nlp(profile=None):
+    """Return the process-wide spaCy German pipeline of a profile, or None if it could not be loaded."""
+    return registry.get("spacy_de", profile or SPACY_PROFILE)
+
+def _doc_entities(doc):
+    return [(ent.text, ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
+
+def _normalize_with_origins(text):
+    """
+    Normalize a phrase and return, for every normalized character, the index of the character of text it comes from.
+    """
+    chars = []
+    origins = []
+    for word in re.finditer(r"\S+", text):
+        if chars:
+            # A run of whitespace becomes a single space
+            chars.append(" ")
+            origins.append(word.start() - 1)
+        chars.extend(word.group().translate(CONFUSABLES))
+        origins.extend(range(word.start(), word.end()))
+    return "".join(chars), origins
+
+def normalize_phrase(text):
+    """Normalize a phrase for the NER memo: single spaces, OCR confusables replaced, case kept."""
+    return _normalize_with_origins(text)[0]
+
+def _memo_key(nlp, profile, text):
+    return f"{nlp.meta.get('lang')}_{nlp.meta.get('name')}-{nlp.meta.get('version')}|{profile}|spans|{normalize_phrase(text)}"
+
+def _to_normalized_spans(entities, origins):
+    """Map (text, start_char, end_char, label) entities of a phrase to (start, end, label) spans of its normalized form."""
+    return [[bisect_left(origins, start), bisect_left(origins, end), label] for (_, start, end, label) in entities]
+
+def _from_normalized_spans(spans, text):
+    """Map (start, end, label) spans of the normalized form back onto text, as (text, start_char, end_char, label) entities."""
+    origins = _normalize_with_origins(text)[1]
+    entities = []
+    for (start, end, label) in spans:
+        if start >= end or end > len(origins):
+            continue
+        (start_char, end_char) = (origins[start], origins[end - 1] + 1)
+        entities.append((text[start_char:end_char], start_char, end_char, label))
+    return entities
+
+def NER_German_batch(texts, batch_size=None, profile=None):
+    """
+    Find the entities of many texts with one nlp.pipe call.
+
+    Parameters:
+    texts: list
+        The texts, e.g. all phrases of a page.
+    batch_size: int
+        Number of texts per spaCy batch. Defaults to SPACY_BATCH_SIZE.
+    profile: str
+        "ner" or "full". Defaults to SPACY_PROFILE.
+
+    Returns:
+    list
+        One list of (text, start_char, end_char, label) tuples per text, or None if the model is not loaded.
+    """
+    profile = profile or SPACY_PROFILE
+    nlp = get_nlp(profile)
     if nlp is None:
         logger.error("NER model is not loaded.")
         return None
 
-    try:
-        doc = nlp(text)
-        entities = [(ent.text, ent.start_char, ent.end_char, ent.label_) for ent in doc.ents]
-        for token in doc:
-            print(token.text, token.pos_, token.dep_)
-
-        if entities:
-            logger.info('The following NER tags are found:')
-            for entity in entities:
-                logger.info(entity)
-
-            per_found = any(ent.label_ == 'PER' or ent.label_ =='PERSON' for ent in doc.ents)
-
-            if per_found:
-                logger.info("A person tag ('PER') was found in the text. Replacing...")
-            else:
-                logger.info("No person tag ('PER') was found in the text.")
-            return entities
+    texts = [text if isinstance(text, str) else "" for text in texts]
+    results = [None] * len(texts)
+
+    # Texts not in the memo, grouped by key so every phrase is only passed to spaCy once
+    pending = {}
+    for idx, text in enumerate(texts):
+        if not NER_MEMO:
+            pending[idx] = [idx]
+            continue
+        key = _memo_key(nlp, profile, text)
+        if key in pending:
+            pending[key].append(idx)
+            continue
+        cached = ner_memo.get(key)
+        if cached is not None:
+            results[idx] = _from_normalized_spans(cached, text)
         else:
-            logger.info("No entities found")
-            return None
+            pending[key] = [idx]
+
+    try:
+        unique_texts = [texts[indices[0]] for indices in pending.values()]
+        docs = nlp.pipe(unique_texts, batch_size=batch_size or SPACY_BATCH_SIZE)
+        for (key, indices), doc in zip(pending.items(), docs):
+            entities = _doc_entities(doc)
+            results[indices[0]] = entities
+            if NER_MEMO:
+                # Other phrases with the same key get the spans re-sliced from their own text
+                spans = _to_normalized_spans(entities, _normalize_with_origins(texts[indices[0]])[1])
+                ner_memo.put(key, spans)
+                for idx in indices[1:]:
+                    results[idx] = _from_normalized_spans(spans, texts[idx])
     except Exception as e:
-        logger.error(f"Error in NER_German: {e}")
+        logger.error(f"Error in NER_German_batch: {e}")
+        return None
+
+    found = sum(len(entities) for entities in results)
+    logger.debug(f"NER found {found} entities in {len(texts)} texts, {len(pending)} passed to spaCy")
+    return results
+
+def person_entities(entities):
+    """Return the (text, label) pairs of the person entities in the output of NER_German or NER_German_batch."""
+    return [(text, label) for (text, _, _, label) in entities or [] if label in PERSON_LABELS]
+
+def NER_German(text):
+    if not isinstance(text, str):
+        logger.error(f"Expected a string, but got {type(text)}")
+        return None
+
+    results = NER_German_batch([text])
+    if results is None:
+        return None
+
+    entities = results[0]
+    if entities:
+        logger.info('The following NER tags are found:')
+        for entity in entities:
+            logger.info(entity)
+
+        if person_entities(entities):
+            logger.info("A person tag ('PER') was found in the text. Replacing...")
+        else:
+            logger.info("No person tag ('PER') was found in the text.")
+        return entities
+    else:
+        logger.info("No entities found")
         return None
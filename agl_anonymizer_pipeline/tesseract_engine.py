@@ -0,0 +1,258 @@
+import ctypes
+import ctypes.util
+import os
+import shlex
+import threading
+import numpy as np
+import pytesseract
+from pytesseract import Output
+from custom_logger import get_logger
+from model_registry import registry
+from pipeline_config import TESSERACT_ENGINE, TESSERACT_LANG
+
+logger = get_logger(__name__)
+
+'''
+Tesseract Engine
+
+pytesseract starts a tesseract process for every call, writes the image to a
+temporary file and loads the language model again. On small crops this costs
+more than the recognition itself.
+
+The TesseractCAPI class in this script binds libtesseract's C API with ctypes
+and keeps one initialized TessBaseAPI per language in the model registry. Images
+are passed as raw buffers, no process or file is involved.
+
+The module functions image_to_data and image_to_string mirror the pytesseract
+functions of the same name (image_to_data returns the Output.DICT format) and
+use the in-process engine when it is available:
+
+- TESSERACT_ENGINE=auto: use libtesseract if it can be loaded, otherwise pytesseract
+- TESSERACT_ENGINE=capi: always use libtesseract, fail if it cannot be loaded
+- TESSERACT_ENGINE=pytesseract: always use pytesseract
+
+Calls with "-c name=value" configuration are passed to pytesseract, the shared
+engine is not reconfigured per call.
+'''
+
+# Library names tried when ctypes.util.find_library does not find libtesseract
+LIBTESSERACT_NAMES = ["libtesseract.so.5", "libtesseract.so.4", "libtesseract.dylib", "tesseract50.dll", "libtesseract-5.dll"]
+
+# Default page segmentation mode of the tesseract command line (PSM_AUTO)
+DEFAULT_PSM = 3
+
+# Columns of the TSV output, as returned by pytesseract.image_to_data
+TSV_COLUMNS = ["level", "page_num", "block_num", "par_num", "line_num", "word_num", "left", "top", "width", "height", "conf", "text"]
+
+
+def _load_libtesseract():
+    path = ctypes.util.find_library("tesseract")
+    candidates = [path] if path else []
+    candidates += LIBTESSERACT_NAMES
+
+    for candidate in candidates:
+        try:
+            lib = ctypes.CDLL(candidate)
+        except OSError:
+            continue
+        logger.debug(f"Loaded libtesseract from {candidate}")
+        break
+    else:
+        raise OSError("libtesseract could not be found")
+
+    handle = ctypes.c_void_p
+    lib.TessVersion.restype = ctypes.c_char_p
+    lib.TessBaseAPICreate.restype = handle
+    lib.TessBaseAPIInit3.argtypes = [handle, ctypes.c_char_p, ctypes.c_char_p]
+    lib.TessBaseAPIInit3.restype = ctypes.c_int
+    lib.TessBaseAPISetPageSegMode.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPISetImage.argtypes = [handle, ctypes.c_void_p, ctypes.c_int, ctypes.c_int, ctypes.c_int, ctypes.c_int]
+    lib.TessBaseAPISetSourceResolution.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPIRecognize.argtypes = [handle, ctypes.c_void_p]
+    lib.TessBaseAPIRecognize.restype = ctypes.c_int
+    # Text results are returned as char* and have to be released with TessDeleteText
+    lib.TessBaseAPIGetUTF8Text.argtypes = [handle]
+    lib.TessBaseAPIGetUTF8Text.restype = ctypes.c_void_p
+    lib.TessBaseAPIGetTsvText.argtypes = [handle, ctypes.c_int]
+    lib.TessBaseAPIGetTsvText.restype = ctypes.c_void_p
+    lib.TessDeleteText.argtypes = [ctypes.c_void_p]
+    lib.TessBaseAPIClear.argtypes = [handle]
+    lib.TessBaseAPIEnd.argtypes = [handle]
+    lib.TessBaseAPIDelete.argtypes = [handle]
+    return lib
+
+
+def _as_image_buffer(image):
+    """Contiguous uint8 array and bytes per pixel for TessBaseAPISetImage. Arrays are read as RGB like in pytesseract."""
+    array = np.ascontiguousarray(np.asarray(image), dtype=np.uint8)
+    if array.ndim == 2:
+        return array, 1
+    if array.ndim == 3 and array.shape[2] in (1, 3, 4):
+        return array, array.shape[2]
+    raise ValueError(f"Unsupported image shape for Tesseract: {array.shape}")
+
+
+def _parse_config(config):
+    """
+    Split a pytesseract config string into the page segmentation mode and the
+    options the shared engine does not support.
+    """
+    psm = DEFAULT_PSM
+    unsupported = []
+    args = shlex.split(config or "")
+    i = 0
+    while i < len(args):
+        if args[i] == "--psm" and i + 1 < len(args):
+            psm = int(args[i + 1])
+            i += 2
+        elif args[i] == "--oem" and i + 1 < len(args):
+            # The engine is initialized with the default OCR engine mode
+            i += 2
+        else:
+            unsupported.append(args[i])
+            i += 1
+    return psm, unsupported
+
+
+def _parse_tsv(tsv):
+    """Parse the TSV output of TessBaseAPIGetTsvText into the pytesseract Output.DICT format."""
+    data = {column: [] for column in TSV_COLUMNS}
+    for line in tsv.splitlines():
+        fields = line.split("\t")
+        if len(fields) < len(TSV_COLUMNS) - 1:
+            continue
+        if len(fields) == len(TSV_COLUMNS) - 1:
+            fields.append("")
+        for column, value in zip(TSV_COLUMNS[:10], fields[:10]):
+            data[column].append(int(value))
+        data["conf"].append(float(fields[10]))
+        data["text"].append(fields[11])
+    return data
+
+
+class TesseractCAPI:
+    """
+    One initialized TessBaseAPI. A TessBaseAPI is not thread-safe, calls are serialized with a lock.
+    """
+
+    def __init__(self, lang="eng", datapath=None, lib=None):
+        self.lang = lang
+        self._lib = lib if lib is not None else _load_libtesseract()
+        self._lock = threading.Lock()
+        self._api = self._lib.TessBaseAPICreate()
+
+        datapath = datapath or os.getenv("TESSDATA_PREFIX")
+        if self._lib.TessBaseAPIInit3(self._api, datapath.encode() if datapath else None, lang.encode()) != 0:
+            self._lib.TessBaseAPIDelete(self._api)
+            self._api = None
+            raise RuntimeError(f"Could not initialize Tesseract with language '{lang}'")
+
+        self.version = self._lib.TessVersion().decode()
+        logger.info(f"Initialized in-process Tesseract {self.version} ({lang})")
+
+    def _take_text(self, pointer):
+        if not pointer:
+            return ""
+        try:
+            return ctypes.string_at(pointer).decode("utf-8", errors="replace")
+        finally:
+            self._lib.TessDeleteText(pointer)
+
+    def _recognize(self, image, psm, result):
+        array, bytes_per_pixel = _as_image_buffer(image)
+        (height, width) = array.shape[:2]
+
+        with self._lock:
+            self._lib.TessBaseAPISetPageSegMode(self._api, psm)
+            self._lib.TessBaseAPISetImage(self._api, array.ctypes.data, width, height, bytes_per_pixel, array.strides[0])
+            # Images without resolution information are read at 70 dpi, like the command line does
+            self._lib.TessBaseAPISetSourceResolution(self._api, 70)
+            try:
+                if self._lib.TessBaseAPIRecognize(self._api, None) != 0:
+                    raise RuntimeError("Tesseract recognition failed")
+                if result == "tsv":
+                    return self._take_text(self._lib.TessBaseAPIGetTsvText(self._api, 0))
+                return self._take_text(self._lib.TessBaseAPIGetUTF8Text(self._api))
+            finally:
+                self._lib.TessBaseAPIClear(self._api)
+
+    def image_to_data(self, image, psm=DEFAULT_PSM):
+        """
+        Returns:
+            dict: Boxes, confidences and text of all levels, in the format of
+            pytesseract.image_to_data(..., output_type=Output.DICT).
+        """
+        return _parse_tsv(self._recognize(image, psm, "tsv"))
+
+    def image_to_string(self, image, psm=DEFAULT_PSM):
+        return self._recognize(image, psm, "text")
+
+    def close(self):
+        if self._api is not None:
+            self._lib.TessBaseAPIEnd(self._api)
+            self._lib.TessBaseAPIDelete(self._api)
+            self._api = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def _load_tesseract_capi(lang):
+    try:
+        return TesseractCAPI(lang)
+    except (OSError, RuntimeError, AttributeError) as e:
+        if TESSERACT_ENGINE == "capi":
+            raise
+        logger.warning(f"In-process Tesseract is not available ({e}), using pytesseract")
+        return None
+
+registry.register("tesseract_capi", _load_tesseract_capi)
+
+
+def get_tesseract_engine(lang=None):
+    """
+    Returns:
+        TesseractCAPI or None: The cached in-process engine for lang, or None if pytesseract should be used.
+    """
+    if TESSERACT_ENGINE == "pytesseract":
+        return None
+    return registry.get("tesseract_capi", lang or TESSERACT_LANG)
+
+
+def image_to_data(image, lang=None, config=""):
+    """
+    Drop-in replacement for pytesseract.image_to_data(image, lang, config, output_type=Output.DICT).
+    """
+    psm, unsupported = _parse_config(config)
+    engine = get_tesseract_engine(lang) if not unsupported else None
+    if engine is None:
+        return pytesseract.image_to_data(image, lang=lang or TESSERACT_LANG, config=config, output_type=Output.DICT)
+    return engine.image_to_data(image, psm)
+
+
+def image_to_string(image, lang=None, config=""):
+    """
+    Drop-in replacement for pytesseract.image_to_string(image, lang, config).
+    """
+    psm, unsupported = _parse_config(config)
+    engine = get_tesseract_engine(lang) if not unsupported else None
+    if engine is None:
+        return pytesseract.image_to_string(image, lang=lang or TESSERACT_LANG, config=config)
+    return engine.image_to_string(image, psm)
+
+
+if __name__ == "__main__":
+    import argparse
+    import cv2
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-i", "--image", type=str, required=True, help="path to input image")
+    ap.add_argument("-l", "--lang", type=str, default=None, help="Tesseract language, e.g. deu+eng")
+    args = vars(ap.parse_args())
+
+    image = cv2.cvtColor(cv2.imread(args["image"]), cv2.COLOR_BGR2RGB)
+    logger.info(f"Engine: {get_tesseract_engine(args['lang'])}")
+    logger.info(image_to_string(image, args["lang"]))
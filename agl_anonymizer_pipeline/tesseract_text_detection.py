@@ -1,20 +1,90 @@
 import cv2
-import pytesseract
-from pytesseract import Output
+import numpy as np
+import tesseract_engine
 import json
 from box_operations import extend_boxes_if_needed
+from box_set import BoxSet, SOURCE_TESSERACT
 from custom_logger import logger
 
+def _confident_entries(results, min_confidence):
+    """Mask of the image_to_data entries above min_confidence. Entries that are not words have a confidence of -1."""
+    confidences = np.asarray(results["conf"], dtype=np.float64)
+    return confidences > min_confidence
+
+def _entry_boxes(results, mask):
+    """BoxSet of the image_to_data entries selected by mask, with their confidences as scores."""
+    boxes = np.stack([results["left"], results["top"], results["width"], results["height"]], axis=1)[mask]
+    boxes[:, 2:] += boxes[:, :2]
+    confidences = np.asarray(results["conf"], dtype=np.float64)[mask]
+    return BoxSet(boxes, confidences, SOURCE_TESSERACT)
+
+def tesseract_page_ocr(image_path, min_confidence=0.5, level="word", config=""):
+    """
+    Detects and recognizes the text of a whole page with a single Tesseract call.
+
+    tesseract_text_detection followed by tesseract_on_boxes runs Tesseract once for the
+    detection and twice more for every box. This function reads boxes, text and
+    confidences from one image_to_data call on the full resolution page instead.
+
+    :param image_path: Path to the input image, or a BGR frame as numpy array.
+    :param min_confidence: Minimum word confidence (0-100) to keep a word.
+    :param level: Granularity of the results, "word" or "line". Lines join their words and average their confidences.
+    :param config: Additional Tesseract configuration, e.g. "--psm 11".
+    :return: BoxSet of the extended text boxes, list of (text, box) tuples in the format of
+             ocr.tesseract_on_boxes, and the list of confidences.
+    """
+    if isinstance(image_path, np.ndarray):
+        image = image_path
+    else:
+        image = cv2.imread(str(image_path))
+    if image is None:
+        raise ValueError("Could not open or find the image.")
+
+    logger.debug("Running single-pass Tesseract OCR on the page")
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    results = tesseract_engine.image_to_data(rgb, config=config)
+
+    texts = np.array([str(text).strip() for text in results["text"]], dtype=object)
+    keep = _confident_entries(results, min_confidence) & (texts != "")
+    boxes = _entry_boxes(results, keep)
+    texts = texts[keep].tolist()
+
+    if level == "line" and len(boxes):
+        # Group the words by their block, paragraph and line number
+        line_keys = np.stack([np.asarray(results[key])[keep] for key in ("block_num", "par_num", "line_num")], axis=1)
+        _, labels = np.unique(line_keys, axis=0, return_inverse=True)
+        labels = labels.reshape(-1)
+        _, first_index = np.unique(labels, return_index=True)
+        line_order = np.argsort(first_index)
+        mean_confidences = np.bincount(labels, weights=boxes.scores) / np.bincount(labels)
+
+        lines = boxes.merge(labels)
+        lines.scores = mean_confidences[line_order].astype(np.float32)
+        line_texts = {}
+        for text, label in zip(texts, labels):
+            line_texts.setdefault(label, []).append(text)
+        texts = [" ".join(line_texts[line]) for line in line_order]
+        boxes = lines
+    elif level != "word":
+        raise ValueError(f"Unsupported level '{level}', use 'word' or 'line'")
+
+    # Extend the boxes like the detected boxes, so the redaction covers the whole text
+    boxes = extend_boxes_if_needed(image, boxes)
+    confidences = boxes.scores.astype(float).tolist()
+    text_with_boxes = list(zip(texts, boxes))
+
+    logger.info(f"Tesseract page OCR found {len(boxes)} {level}s")
+    return boxes, text_with_boxes, confidences
+
 def tesseract_text_detection(image_path, min_confidence=0.5, width=320, height=320):
     """
     Detects text from an image using Tesseract OCR.
-    Draws bounding boxes around detected text regions and displays the image.
     
     :param image_path: Path to the input image.
     :param min_confidence: Minimum confidence value to consider a detection valid.
     :param width: Resized image width for the detection model.
     :param height: Resized image height for the detection model.
-    :return: List of bounding boxes (x, y, w, h) of detected text regions.
+    :return: BoxSet of (startX, startY, endX, endY) boxes of detected text regions, and the confidences in JSON format.
     """
     # Load the input image
     image = cv2.imread(str(image_path))
@@ -22,7 +92,8 @@ def tesseract_text_detection(image_path, min_confidence=0.5, width=320, height=3
     if image is None:
         raise ValueError("Could not open or find the image.")
     
-    orig = image.copy()
+    # Keep the original frame, the detection runs on a resized copy
+    orig = image
     (H, W) = image.shape[:2]
 
     # Resize the image and grab the new image dimensions
@@ -30,51 +101,27 @@ def tesseract_text_detection(image_path, min_confidence=0.5, width=320, height=3
     (rH, rW) = H / float(height), W / float(width)
 
     # Detecting text using Tesseract
-    results = pytesseract.image_to_data(image, output_type=Output.DICT)
-    output_boxes = []
-    output_confidences = []
-
-    # Loop over each of the individual text localizations
-    for i in range(0, len(results["text"])):
-        # Extract the bounding box coordinates and confidence
-        x, y, w, h = (results["left"][i], results["top"][i], 
-                    results["width"][i], results["height"][i])
-        conf = float(results["conf"][i])
-
-        # Filter out weak detections
-        if conf > min_confidence:
-            # Scale the bounding box coordinates back to the original image size
-            (startX, startY, endX, endY) = (int(x * rW), int(y * rH), 
-                                            int((x + w) * rW), int((y + h) * rH))
-            output_boxes.append((startX, startY, endX, endY))
-            
-            output_confidences.append({
-                "startX": startX,
-                "startY": startY,
-                "endX": endX,
-                "endY": endY,
-                "confidence": conf
-            })
-
-            # Draw the bounding box on the original image
-            cv2.rectangle(orig, (startX, startY), (endX, endY), (0, 255, 0), 2)
+    results = tesseract_engine.image_to_data(image)
+
+    # Filter out weak detections and scale the bounding box coordinates back to the original image size
+    keep = _confident_entries(results, min_confidence)
+    output_boxes = _entry_boxes(results, keep).scale(rW, rH)
+
+    output_confidences = [
+        {"startX": startX, "startY": startY, "endX": endX, "endY": endY, "confidence": float(conf)}
+        for (startX, startY, endX, endY), conf in zip(output_boxes, output_boxes.scores)
+    ]
 
     # Sort and extend boxes if needed
-    output_boxes = sort_boxes(output_boxes)
-    output_boxes = extend_boxes_if_needed(orig, output_boxes)
+    output_boxes = extend_boxes_if_needed(orig, output_boxes.sort_by_line())
 
     # Return both the scaled bounding boxes and the confidence scores in JSON format
     logger.info("tesseract text detection complete")
     return output_boxes, json.dumps(output_confidences)
 
 def sort_boxes(boxes):
-    # Define a threshold to consider boxes on the same line
-    vertical_threshold = 10
-
-    # Sort boxes by y coordinate, then by x coordinate if y coordinates are similar
-    boxes.sort(key=lambda b: (round(b[1] / vertical_threshold), b[0]))
-
-    return boxes
+    # Sort boxes by line (y-coordinates within 10 px), then by x-coordinate
+    return BoxSet.from_tuples(boxes).sort_by_line(vertical_threshold=10).tolist()
 
 # if this script is the main script being run, parse command line args and run
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+from pathlib import Path
+import numpy as np
+from transformers import AutoConfig, AutoTokenizer, ViTImageProcessor
+from custom_logger import get_logger
+from directory_setup import create_model_directory
+from model_registry import registry
+from pipeline_config import ONNX_NUM_THREADS
+
+logger = get_logger(__name__)
+
+'''
+TrOCR ONNX Runtime Backend
+
+The functions in this script export the TrOCR model once to ONNX and run it
+with ONNX Runtime instead of eager PyTorch.
+
+The export (optimum's main_export with the image-to-text-with-past task) writes
+three graphs into the models directory created by create_model_directory:
+
+- encoder_model.onnx: pixel values to encoder hidden states
+- decoder_model.onnx: first decoder step, returns the initial key/value cache
+- decoder_with_past_model.onnx: every further step, reusing the cache
+
+TrOCROnnx runs a greedy decoder loop over a batch of crops. The cache outputs
+("present.*") of one step are fed to the inputs of the same name
+("past_key_values.*") of the next step. Texts and confidences have the same
+format as ocr._trocr_generate: the confidence of a crop is the probability of
+the token chosen at the step its sequence ended.
+
+onnxruntime and optimum are optional dependencies (pip install agl_anonymizer_pipeline[onnx]).
+'''
+
+TROCR_MODEL_NAME = "microsoft/trocr-base-str"
+
+ENCODER_FILE = "encoder_model.onnx"
+DECODER_FILE = "decoder_model.onnx"
+DECODER_WITH_PAST_FILE = "decoder_with_past_model.onnx"
+
+
+def default_onnx_dir(model_name=TROCR_MODEL_NAME):
+    return Path(create_model_directory()) / f"{model_name.split('/')[-1]}-onnx"
+
+
+def export_trocr_onnx(model_name=TROCR_MODEL_NAME, output_dir=None, force=False):
+    """
+    Export TrOCR to ONNX as separate encoder, decoder and decoder-with-past graphs.
+
+    The export is skipped if the graphs already exist in output_dir.
+
+    Parameters:
+    model_name: str
+        The Hugging Face model to export.
+    output_dir: str or Path
+        Where to write the graphs. Defaults to a folder in the models directory.
+    force: bool
+        Export again even if the graphs exist.
+
+    Returns:
+    Path
+        The directory containing the exported graphs, config, tokenizer and processor files.
+    """
+    output_dir = Path(output_dir) if output_dir else default_onnx_dir(model_name)
+    files = [output_dir / name for name in (ENCODER_FILE, DECODER_FILE, DECODER_WITH_PAST_FILE)]
+    if not force and all(path.exists() for path in files):
+        logger.debug(f"Using exported TrOCR ONNX graphs in {output_dir}")
+        return output_dir
+
+    try:
+        from optimum.exporters.onnx import main_export
+    except ImportError as e:
+        raise ImportError("Exporting TrOCR to ONNX requires optimum, install agl_anonymizer_pipeline[onnx]") from e
+
+    logger.info(f"Exporting {model_name} to ONNX in {output_dir}...")
+    # no_post_process keeps decoder and decoder-with-past as separate graphs instead of merging them
+    main_export(model_name, output=output_dir, task="image-to-text-with-past", no_post_process=True)
+    logger.info(f"Exported {model_name} to ONNX")
+    return output_dir
+
+
+def _softmax_max(logits):
+    """Index and probability of the most likely token for every row of logits."""
+    logits = logits.astype(np.float32)
+    tokens = logits.argmax(axis=-1)
+    shifted = np.exp(logits - logits.max(axis=-1, keepdims=True))
+    probabilities = shifted[np.arange(len(tokens)), tokens] / shifted.sum(axis=-1)
+    return tokens, probabilities
+
+
+class TrOCROnnx:
+    def __init__(self, model_dir, providers=None, num_threads=None):
+        """
+        Parameters:
+        model_dir: str or Path
+            Directory with the exported graphs.
+        providers: list
+            ONNX Runtime execution providers. Defaults to the CPU provider.
+        num_threads: int
+            Intra-op threads of every session. Defaults to ONNX Runtime's choice.
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The ONNX TrOCR backend requires onnxruntime, install agl_anonymizer_pipeline[onnx]") from e
+
+        model_dir = Path(model_dir)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        providers = providers or ["CPUExecutionProvider"]
+
+        self.encoder = ort.InferenceSession(str(model_dir / ENCODER_FILE), options, providers=providers)
+        self.decoder = ort.InferenceSession(str(model_dir / DECODER_FILE), options, providers=providers)
+        self.decoder_with_past = ort.InferenceSession(str(model_dir / DECODER_WITH_PAST_FILE), options, providers=providers)
+
+        self._decoder_inputs = {node.name for node in self.decoder.get_inputs()}
+        self._decoder_with_past_inputs = {node.name for node in self.decoder_with_past.get_inputs()}
+        self._decoder_outputs = [node.name for node in self.decoder.get_outputs()]
+        self._decoder_with_past_outputs = [node.name for node in self.decoder_with_past.get_outputs()]
+
+        config = AutoConfig.from_pretrained(model_dir)
+        self.decoder_start_token_id = config.decoder_start_token_id
+        self.pad_token_id = config.pad_token_id if config.pad_token_id is not None else config.decoder.pad_token_id
+        eos_token_id = config.eos_token_id if config.eos_token_id is not None else config.decoder.eos_token_id
+        self.eos_token_ids = np.atleast_1d(np.asarray(eos_token_id, dtype=np.int64))
+
+    def _step_feeds(self, input_names, input_ids, encoder_hidden_states, past):
+        feeds = {"input_ids": input_ids, "encoder_hidden_states": encoder_hidden_states}
+        if "encoder_attention_mask" in input_names:
+            feeds["encoder_attention_mask"] = np.ones(encoder_hidden_states.shape[:2], dtype=np.int64)
+        feeds.update(past)
+        return {name: value for name, value in feeds.items() if name in input_names}
+
+    @staticmethod
+    def _update_past(past, output_names, outputs):
+        # Every "present.*" output becomes the "past_key_values.*" input of the next step
+        for name, value in zip(output_names, outputs):
+            if name.startswith("present"):
+                past[name.replace("present", "past_key_values", 1)] = value
+        return past
+
+    def generate(self, pixel_values, tokenizer, max_new_tokens=50):
+        """
+        Greedy decoding of a batch of preprocessed crops.
+
+        Parameters:
+        pixel_values: ndarray
+            (batch, 3, height, width) float32 output of the TrOCR processor.
+        tokenizer: PreTrainedTokenizer
+            Tokenizer used to decode the generated tokens.
+        max_new_tokens: int
+            Maximum number of generated tokens.
+
+        Returns:
+        tuple
+            The decoded texts and one confidence score per crop.
+        """
+        pixel_values = np.ascontiguousarray(pixel_values, dtype=np.float32)
+        batch_size = pixel_values.shape[0]
+        encoder_hidden_states = self.encoder.run(None, {"pixel_values": pixel_values})[0]
+
+        sequences = np.full((batch_size, 1), self.decoder_start_token_id, dtype=np.int64)
+        finished = np.zeros(batch_size, dtype=bool)
+        confidences = np.zeros(batch_size, dtype=np.float64)
+
+        feeds = self._step_feeds(self._decoder_inputs, sequences, encoder_hidden_states, {})
+        outputs = self.decoder.run(None, feeds)
+        past = self._update_past({}, self._decoder_outputs, outputs)
+
+        logits = outputs[self._decoder_outputs.index("logits")]
+        for step in range(max_new_tokens):
+            tokens, probabilities = _softmax_max(logits[:, -1, :])
+            # Finished sequences are padded, like in transformers' generate
+            tokens = np.where(finished, self.pad_token_id, tokens)
+            confidences = np.where(finished, confidences, probabilities)
+            sequences = np.concatenate([sequences, tokens[:, None]], axis=1)
+
+            finished |= np.isin(tokens, self.eos_token_ids)
+            if finished.all():
+                break
+
+            feeds = self._step_feeds(self._decoder_with_past_inputs, tokens[:, None].astype(np.int64), encoder_hidden_states, past)
+            outputs = self.decoder_with_past.run(None, feeds)
+            past = self._update_past(past, self._decoder_with_past_outputs, outputs)
+            logits = outputs[self._decoder_with_past_outputs.index("logits")]
+
+        texts = tokenizer.batch_decode(sequences, skip_special_tokens=True)
+        return texts, confidences.tolist()
+
+
+def _load_trocr_onnx(model_name):
+    model_dir = export_trocr_onnx(model_name)
+    processor = ViTImageProcessor.from_pretrained(model_dir)
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    model = TrOCROnnx(model_dir, num_threads=ONNX_NUM_THREADS)
+    return processor, model, tokenizer
+
+registry.register("trocr_onnx", _load_trocr_onnx)
+
+
+def get_trocr_onnx(model_name=TROCR_MODEL_NAME):
+    """
+    Return the processor, ONNX model and tokenizer, exporting the model on first use.
+    """
+    return registry.get("trocr_onnx", model_name)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-m", "--model", type=str, default=TROCR_MODEL_NAME, help="Hugging Face model to export")
+    ap.add_argument("-o", "--output", type=str, default=None, help="export directory")
+    ap.add_argument("-f", "--force", action="store_true", help="export again even if the graphs exist")
+    args = vars(ap.parse_args())
+
+    logger.info(f"Exported graphs in {export_trocr_onnx(args['model'], args['output'], args['force'])}")
@@ -0,0 +1,6 @@
+import sys
+from pathlib import Path
+
+# The pipeline modules import each other by module name (e.g. "from box_operations import ..."),
+# so the package directory itself has to be importable.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "agl_anonymizer_pipeline"))
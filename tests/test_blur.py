@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+# blur creates its working directories on import, keep them out of the repository
+_tmp_root = tempfile.mkdtemp(prefix="agl-anonymizer-test-")
+os.environ.setdefault("AGL_ANONYMIZER_DEFAULT_MAIN_DIR", os.path.join(_tmp_root, "main"))
+os.environ.setdefault("AGL_ANONYMIZER_DEFAULT_TEMP_DIR", os.path.join(_tmp_root, "temp"))
+
+from blur import RedactionCompositor, _group_overlapping
+from region_detector import expand_roi
+
+
+def make_image(seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 255, size=(240, 320, 3), dtype=np.uint8)
+
+
+def reference_blur(image, box, background_color, expansion=10, blur_strength=(51, 51), rectangle_scale=0.8):
+    # The former blur_function, without the file round trip
+    image = image.copy()
+    (startX, startY, endX, endY) = expand_roi(*box, expansion, image.shape)
+    rect_width = int((endX - startX) * rectangle_scale)
+    rect_height = int((endY - startY) * rectangle_scale)
+    rect_startX = startX + (endX - startX - rect_width) // 2
+    rect_startY = startY + (endY - startY - rect_height) // 2
+    cv2.rectangle(image, (rect_startX, rect_startY), (rect_startX + rect_width, rect_startY + rect_height), background_color, -1)
+    image[startY:endY, startX:endX] = cv2.GaussianBlur(image[startY:endY, startX:endX], blur_strength, 0)
+    return image
+
+
+def test_single_blur_matches_reference():
+    image = make_image()
+    compositor = RedactionCompositor(image)
+    compositor.add_blur((40, 50, 140, 80), (0, 0, 0))
+    np.testing.assert_array_equal(compositor.render(), reference_blur(image, (40, 50, 140, 80), (0, 0, 0)))
+
+
+def test_render_leaves_source_and_unredacted_pixels_untouched():
+    image = make_image(1)
+    original = image.copy()
+    compositor = RedactionCompositor(image)
+    compositor.add_blur((20, 20, 100, 50), (255, 255, 255))
+    compositor.add_blur((90, 40, 200, 70), (255, 255, 255))
+    compositor.add_fill((250, 200, 300, 230), (1, 2, 3))
+    output = compositor.render()
+
+    np.testing.assert_array_equal(image, original)
+    mask = np.zeros(image.shape[:2], dtype=bool)
+    mask[10:60, 10:110] = True
+    mask[30:80, 80:210] = True
+    mask[200:230, 250:300] = True
+    np.testing.assert_array_equal(output[~mask], original[~mask])
+    assert (output[200:230, 250:300] == (1, 2, 3)).all()
+
+
+def test_group_overlapping():
+    groups = _group_overlapping([(0, 0, 10, 10), (5, 5, 20, 20), (19, 19, 30, 30), (100, 100, 110, 110)])
+    assert sorted(bounds for bounds, _ in groups) == [(0, 0, 30, 30), (100, 100, 110, 110)]
+
+
+def test_patches_are_drawn_on_top_and_kept_inside_the_frame():
+    image = make_image()
+    patch = np.full((20, 60, 3), 7, dtype=np.uint8)
+    patch.flags.writeable = False
+    compositor = RedactionCompositor(image)
+    compositor.add_blur((40, 50, 140, 80), (0, 0, 0))
+    compositor.add_patch((40, 50, 140, 80), patch)
+    compositor.add_patch((300, 230, 320, 240), patch)
+    output = compositor.render()
+    assert (output[50:70, 40:100] == 7).all()
+    # Shifted back inside the 320 x 240 frame
+    assert (output[220:240, 260:320] == 7).all()
@@ -0,0 +1,173 @@
+import cv2
+import numpy as np
+import pytest
+
+from box_set import BoxSet, SOURCE_EAST, SOURCE_TESSERACT
+
+from box_operations import (
+    DominantColorEngine,
+    extend_boxes_if_needed,
+    fuse_boxes,
+    get_dominant_color,
+    non_max_suppression,
+)
+
+
+def test_nms_empty_input():
+    keep = non_max_suppression(np.empty((0, 4)), np.empty(0))
+    assert keep.shape == (0,)
+
+
+def test_nms_keeps_strongest_of_overlapping_boxes():
+    boxes = np.array([
+        [10, 10, 50, 30],
+        [12, 11, 52, 31],   # near duplicate of the first box
+        [100, 10, 140, 30],
+    ])
+    scores = np.array([0.6, 0.9, 0.7])
+
+    keep = non_max_suppression(boxes, scores)
+
+    assert keep.tolist() == [1, 2]
+
+
+def test_nms_indices_keep_scores_aligned():
+    rng = np.random.default_rng(0)
+    starts = rng.integers(0, 300, size=(200, 2))
+    boxes = np.hstack([starts, starts + rng.integers(10, 60, size=(200, 2))])
+    scores = rng.random(200)
+
+    keep = non_max_suppression(boxes, scores)
+
+    # Kept boxes come back strongest first, and indexing with them selects matching scores
+    assert np.all(np.diff(scores[keep]) <= 0)
+    assert scores[keep][0] == scores.max()
+
+
+def test_nms_iou_threshold_is_stricter_than_containment():
+    # A small box inside a large one has a low IoU but is fully covered
+    boxes = np.array([[0, 0, 99, 99], [10, 10, 29, 29]])
+    scores = np.array([0.9, 0.8])
+
+    assert non_max_suppression(boxes, scores, iou_threshold=0.5, overlap_threshold=None).tolist() == [0, 1]
+    assert non_max_suppression(boxes, scores, overlap_threshold=0.3).tolist() == [0]
+
+
+def test_nms_cv2_matches_builtin_iou():
+    boxes = np.array([
+        [10, 10, 50, 30],
+        [11, 10, 51, 30],
+        [100, 10, 140, 30],
+        [300, 200, 340, 260],
+    ])
+    scores = np.array([0.8, 0.9, 0.7, 0.95])
+
+    builtin = non_max_suppression(boxes, scores, iou_threshold=0.5, overlap_threshold=None)
+    opencv = non_max_suppression(boxes, scores, iou_threshold=0.5, use_cv2=True)
+
+    assert sorted(builtin.tolist()) == sorted(opencv.tolist()) == [1, 2, 3]
+
+
+def kmeans_dominant_color(image, box):
+    # The former k-means implementation of get_dominant_color, kept as reference
+    (startX, startY, endX, endY) = box
+    region = image[startY:endY, startX:endX]
+    pixels = np.float32(region.reshape(-1, 3))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 200, 0.1)
+    _, labels, palette = cv2.kmeans(pixels, 1, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+    _, counts = np.unique(labels, return_counts=True)
+    return tuple(map(int, palette[np.argmax(counts)]))
+
+
+def kmeans_extend_boxes(image, boxes, extension_margin=10, color_threshold=30):
+    # The former per-box loop of extend_boxes_if_needed, kept as reference
+    extended_boxes = []
+    for (startX, startY, endX, endY) in boxes:
+        dominant_color = np.array(kmeans_dominant_color(image, (startX, startY, endX, endY)))
+        if startY - extension_margin > 0:
+            color = kmeans_dominant_color(image, (startX, startY - extension_margin, endX, startY))
+            if np.linalg.norm(np.array(color) - dominant_color) > color_threshold:
+                startY = max(startY - extension_margin, 0)
+        if endY + extension_margin < image.shape[0]:
+            color = kmeans_dominant_color(image, (startX, endY, endX, endY + extension_margin))
+            if np.linalg.norm(np.array(color) - dominant_color) > color_threshold:
+                endY = min(endY + extension_margin, image.shape[0])
+        if startX - extension_margin > 0:
+            color = kmeans_dominant_color(image, (startX - extension_margin, startY, startX, endY))
+            if np.linalg.norm(np.array(color) - dominant_color) > color_threshold:
+                startX = max(startX - extension_margin, 0)
+        if endX + extension_margin < image.shape[1]:
+            color = kmeans_dominant_color(image, (endX, startY, endX + extension_margin, endY))
+            if np.linalg.norm(np.array(color) - dominant_color) > color_threshold:
+                endX = min(endX + extension_margin, image.shape[1])
+        extended_boxes.append((startX, startY, endX, endY))
+    return extended_boxes
+
+
+@pytest.fixture
+def overlay_frame():
+    # Dark frame with bright text-like blocks, similar to an endoscopy overlay
+    rng = np.random.default_rng(42)
+    image = rng.integers(0, 40, size=(480, 640, 3), dtype=np.uint8)
+    boxes = []
+    for row in range(8):
+        for col in range(5):
+            (x, y) = (20 + col * 120, 20 + row * 55)
+            image[y + 5:y + 25, x + 5:x + 80] = rng.integers(180, 255, size=3)
+            boxes.append((x + 10, y + 8, x + 70, y + 22))
+    return image, boxes
+
+
+def test_mean_engine_matches_kmeans(overlay_frame):
+    image, boxes = overlay_frame
+    engine = DominantColorEngine(image, method="mean")
+
+    colors = engine.colors(boxes)
+    integral_colors = DominantColorEngine(image, method="mean", use_integral=True).colors(boxes)
+
+    assert np.abs(colors - integral_colors).max() <= 1
+    for box, color in zip(boxes, colors):
+        # Both truncate the mean, float32 k-means centers may land one step lower
+        assert np.abs(color - np.array(kmeans_dominant_color(image, box))).max() <= 1
+        assert engine.color(box) == get_dominant_color(image, box, method="mean")
+
+
+def test_extend_boxes_matches_kmeans(overlay_frame):
+    image, boxes = overlay_frame
+
+    assert extend_boxes_if_needed(image, boxes) == kmeans_extend_boxes(image, boxes)
+
+
+def test_engine_methods_on_uniform_region():
+    image = np.full((50, 50, 3), (10, 120, 250), dtype=np.uint8)
+    image[0:5, 0:5] = 0  # a few outliers in the corner
+
+    for method in ("median", "histogram"):
+        assert DominantColorEngine(image, method=method).color((0, 0, 50, 50)) == (10, 120, 250)
+
+
+def test_engine_clips_boxes_outside_the_image():
+    image = np.full((20, 20, 3), 200, dtype=np.uint8)
+    engine = DominantColorEngine(image)
+
+    assert engine.color((-5, -5, 10, 10)) == (200, 200, 200)
+    assert engine.color((30, 30, 40, 40)) == (0, 0, 0)
+
+
+def test_fuse_boxes_merges_duplicates_across_detectors():
+    east = BoxSet([(10, 10, 60, 30), (100, 10, 150, 30)], [0.9, 0.8], SOURCE_EAST)
+    tesseract = BoxSet([(12, 11, 62, 31), (300, 50, 340, 70)], [91.0, 85.0], SOURCE_TESSERACT)
+
+    fused = fuse_boxes(east, tesseract, iou_threshold=0.3)
+
+    assert fused.tolist() == [(10, 10, 62, 31), (100, 10, 150, 30), (300, 50, 340, 70)]
+    assert fused.source_names(0) == ["east", "tesseract"]
+    assert fused.source_names(1) == ["east"]
+    assert fused.source_names(2) == ["tesseract"]
+
+
+def test_fuse_boxes_links_chains_and_can_be_disabled():
+    chain = [(0, 0, 20, 10), (5, 0, 25, 10), (10, 0, 30, 10)]
+    assert fuse_boxes(chain, [], iou_threshold=0.3).tolist() == [(0, 0, 30, 10)]
+    assert len(fuse_boxes(chain, [], iou_threshold=None)) == 3
+
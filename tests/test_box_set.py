@@ -0,0 +1,82 @@
+import numpy as np
+
+from box_operations import extend_boxes_if_needed, non_max_suppression
+from box_set import BoxSet, SOURCE_EAST, SOURCE_TESSERACT
+from region_detector import expand_roi
+
+
+def random_boxes(count, seed=0):
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(-20, 300, size=(count, 2))
+    sizes = rng.integers(5, 80, size=(count, 2))
+    return [tuple(int(v) for v in box) for box in np.concatenate([starts, starts + sizes], axis=1)]
+
+
+def test_behaves_like_a_list_of_tuples():
+    boxes = BoxSet([(1, 2, 3, 4), (5, 6, 7, 8)], [0.5, 0.9], SOURCE_EAST)
+    assert len(boxes) == 2
+    assert list(boxes) == [(1, 2, 3, 4), (5, 6, 7, 8)]
+    assert boxes[1] == (5, 6, 7, 8)
+    assert boxes[np.array([1])].scores.tolist() == [np.float32(0.9)]
+
+
+def test_concatenation_keeps_sources():
+    east = BoxSet([(0, 0, 10, 10)], [0.9], SOURCE_EAST)
+    tesseract = BoxSet([(20, 0, 30, 10)], [80.0], SOURCE_TESSERACT)
+    combined = east + tesseract
+    assert combined.tolist() == [(0, 0, 10, 10), (20, 0, 30, 10)]
+    assert combined.sources.tolist() == [SOURCE_EAST, SOURCE_TESSERACT]
+    assert ([(1, 1, 2, 2)] + east).tolist() == [(1, 1, 2, 2), (0, 0, 10, 10)]
+
+
+def test_expand_matches_expand_roi():
+    boxes = random_boxes(50)
+    shape = (240, 320, 3)
+    expected = [expand_roi(*box, 5, shape) for box in boxes]
+    assert BoxSet.from_tuples(boxes).expand(5, shape).tolist() == expected
+
+
+def test_clip_makes_outside_boxes_empty():
+    clipped = BoxSet([(-5, -5, 10, 10), (400, 10, 420, 20)]).clip((100, 200))
+    assert clipped.tolist() == [(0, 0, 10, 10), (200, 10, 200, 20)]
+
+
+def test_sort_by_line_matches_tuple_sort():
+    boxes = random_boxes(100, seed=1)
+    expected = sorted(boxes, key=lambda b: (round(b[1] / 10), b[0]))
+    assert BoxSet.from_tuples(boxes).sort_by_line().tolist() == expected
+
+
+def test_scale_truncates_like_int():
+    boxes = random_boxes(20, seed=2)
+    expected = [tuple(int(v * r) for v, r in zip(box, (1.7, 0.6, 1.7, 0.6))) for box in boxes]
+    assert BoxSet.from_tuples(boxes).scale(1.7, 0.6).tolist() == expected
+
+
+def test_iou():
+    a = BoxSet([(0, 0, 10, 10)])
+    b = BoxSet([(5, 0, 15, 10), (20, 20, 30, 30), (0, 0, 10, 10)])
+    np.testing.assert_allclose(a.iou(b), [[50 / 150, 0.0, 1.0]])
+
+
+def test_merge_unions_boxes_and_sources():
+    boxes = BoxSet(
+        [(0, 0, 10, 10), (50, 50, 60, 60), (5, 2, 20, 8)],
+        [0.4, 0.7, 0.9],
+        [SOURCE_EAST, SOURCE_EAST, SOURCE_TESSERACT],
+    )
+    merged = boxes.merge([3, 1, 3])
+    assert merged.tolist() == [(0, 0, 20, 10), (50, 50, 60, 60)]
+    assert merged.scores.tolist() == [np.float32(0.9), np.float32(0.7)]
+    assert merged.source_names(0) == ["east", "tesseract"]
+
+
+def test_box_operations_accept_box_sets():
+    image = np.zeros((100, 200, 3), dtype=np.uint8)
+    boxes = BoxSet([(10, 10, 50, 30), (12, 12, 52, 32)], [0.2, 0.8], SOURCE_EAST)
+    assert non_max_suppression(boxes).tolist() == [1]
+
+    extended = extend_boxes_if_needed(image, boxes)
+    assert isinstance(extended, BoxSet)
+    assert extended.scores.tolist() == boxes.scores.tolist()
+    assert extend_boxes_if_needed(image, boxes.tolist()) == extended.tolist()
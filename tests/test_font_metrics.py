@@ -0,0 +1,25 @@
+import random
+import cv2
+from font_metrics import FontMetrics, CHARACTERS
+
+
+def test_text_size_matches_opencv():
+    rng = random.Random(0)
+    for font in (cv2.FONT_HERSHEY_SIMPLEX, cv2.FONT_HERSHEY_DUPLEX):
+        metrics = FontMetrics(font, 2)
+        for _ in range(200):
+            text = "".join(rng.choice(CHARACTERS) for _ in range(rng.randint(1, 20)))
+            scale = rng.choice([0.3, 0.5, 0.7, 1.0, 1.5])
+            assert tuple(metrics.text_size(text, scale)) == tuple(cv2.getTextSize(text, font, scale, 2)[0])
+    # Characters outside the table fall back to OpenCV
+    assert tuple(metrics.text_size("Müller", 0.5)) == tuple(cv2.getTextSize("Müller", font, 0.5, 2)[0])
+
+
+def test_fit_scale_matches_decrement_loop():
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    metrics = FontMetrics(font, 2)
+    for box_height in range(4, 40):
+        font_scale = 1.0
+        while cv2.getTextSize("Name", font, font_scale, 2)[0][1] > box_height and font_scale > 0.1 + 1e-9:
+            font_scale -= 0.1
+        assert metrics.fit_scale(box_height) == round(font_scale, 6)
@@ -0,0 +1,57 @@
+from name_gazetteer import NameGazetteer, get_gazetteer, has_word_token
+
+
+def test_exact_fuzzy_and_confusable_matches():
+    gazetteer = NameGazetteer(["Anna Schmidt", "Klaus-Dieter Müller", "Simba"], max_distance=1)
+
+    assert gazetteer.match("ANNA") == "anna"
+    assert gazetteer.match("Dieter") == "dieter"
+    assert gazetteer.match("Muller") == "muller"
+    # OCR errors: a confused character, a substitution and a missing character
+    assert gazetteer.match("Schm1dt") == "schmidt"
+    assert gazetteer.match("Schmldt") == "schmidt"
+    assert gazetteer.match("Schmdt") == "schmidt"
+    # Two edits away, even though both share a one-character delete
+    assert gazetteer.match("Sigma") is None
+    # Short tokens are only matched exactly
+    assert gazetteer.match("Ann") is None
+
+    assert NameGazetteer(["Anna Schmidt"], max_distance=0).match("Schmldt") is None
+
+
+def test_person_span_and_prefilter():
+    gazetteer = NameGazetteer(["Anna Schmidt", "Koch"], max_distance=1)
+
+    assert gazetteer.person_span("Patient: Anna Schmidt, geb. 12.03.1961") == "Anna Schmidt"
+    # Lower case words that are also names are not persons
+    assert gazetteer.person_span("nach koch. Befund") is None
+    assert gazetteer.has_name("nach koch. Befund")
+
+    for phrase in ["12.03.1961", "14:32:05", "CV-190", "OTV-S7", "40081537"]:
+        assert not has_word_token(phrase)
+    assert has_word_token("Mu5termann")
+
+
+def test_names_dict_gazetteer():
+    gazetteer = get_gazetteer()
+    assert len(gazetteer) > 1000
+    assert gazetteer.has_name("Maximilian Müller")
+
+
+def test_person_span_ignores_medical_nouns():
+    gazetteer = get_gazetteer()
+    # Capitalized German nouns one edit away from a name (Hagen, Parker, Norman, Weber, ...)
+    for noun in ["Magen", "Marker", "Normal", "Leber", "Lunge", "Zange", "Schnitt", "Dauer", "Alter", "Befund", "Biopsie", "Polyp", "Schleimhaut"]:
+        assert gazetteer.person_span(f"{noun} unauffällig") is None
+    assert gazetteer.person_span("Patient: Maximilian Müller") == "Maximilian Müller"
+
+
+def test_prefilter_keeps_capitals_with_confused_digits():
+    gazetteer = get_gazetteer()
+    for name in ["M0LLER", "SCHM1DT", "MU5TERMANN"]:
+        assert has_word_token(name)
+        assert has_word_token(name, gazetteer)
+    assert gazetteer.has_name("M0LLER") and gazetteer.has_name("SCHM1DT")
+    for code in ["CV190", "OTV-S7", "CF-H190L", "1005", "14:32:05"]:
+        assert not has_word_token(code)
+        assert not has_word_token(code, gazetteer)
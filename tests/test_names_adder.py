@@ -0,0 +1,28 @@
+import os
+import tempfile
+
+# names_adder creates its working directories on import, keep them out of the repository
+_tmp_root = tempfile.mkdtemp(prefix="agl-anonymizer-test-")
+os.environ.setdefault("AGL_ANONYMIZER_DEFAULT_MAIN_DIR", os.path.join(_tmp_root, "main"))
+os.environ.setdefault("AGL_ANONYMIZER_DEFAULT_TEMP_DIR", os.path.join(_tmp_root, "temp"))
+
+import cv2
+import numpy as np
+
+import names_adder
+from names_adder import render_full_name, name_patches
+
+
+def test_patches_are_shared_by_name_style_and_box_size():
+    name_patches.clear()
+    first = render_full_name("Anna Weber", (10, 10, 70, 30))
+    # The same box size elsewhere on the frame reuses the patch without drawing it again
+    assert render_full_name("Anna Weber", (200, 100, 260, 120)) is first
+    assert name_patches.stats()['hits'] == 1
+    assert not first.flags.writeable
+    assert render_full_name("Anna Weber", (10, 10, 70, 40)) is not first
+
+    # Writing a PNG is only done on request
+    path = names_adder.add_full_name_to_image("Anna Weber", "female", (10, 10, 70, 30))
+    assert path.exists()
+    assert np.array_equal(cv2.imread(str(path)), first)
@@ -0,0 +1,73 @@
+import numpy as np
+
+from lru_store import LRUStore
+from ocr_cache import OCRCache
+
+
+def test_lru_eviction_and_disk_tier(tmp_path):
+    store = LRUStore(max_entries=2, path=tmp_path / "cache.sqlite")
+    store.put("a", ["Max", 0.9])
+    store.put("b", ["Muster", 0.8])
+    assert store.get("a") == ["Max", 0.9]
+    store.put("c", ["12.03.2021", 0.7])
+
+    # "b" was the least recently used entry, it is only left on disk
+    assert store.keys() == ["a", "c"]
+    assert store.get("b") == ["Muster", 0.8]
+    assert store.get("d") is None
+    assert store.stats()['hits'] == 2
+    assert store.stats()['disk_hits'] == 1
+    assert store.stats()['misses'] == 1
+
+    # A new store on the same file starts with the disk tier
+    store.close()
+    assert LRUStore(path=tmp_path / "cache.sqlite").get("c") == ["12.03.2021", 0.7]
+
+
+def _text_crop(shift=0, noise=0):
+    crop = np.full((24, 120, 3), 255, dtype=np.uint8)
+    crop[6:18, 10 + shift:60 + shift] = 0
+    crop[6:18, 70 + shift:100 + shift] = 0
+    if noise:
+        crop = np.clip(crop.astype(int) + np.random.default_rng(0).integers(-noise, noise, crop.shape), 0, 255).astype(np.uint8)
+    return crop
+
+
+def test_exact_cache_keys_engine_and_pixels():
+    cache = OCRCache(max_entries=8, path=None, hash_mode="exact", enabled=True)
+    key = cache.crop_key("trocr", "torch|none", _text_crop())
+    assert cache.get(key) is None
+    cache.put(key, "Max Muster", 0.9)
+
+    assert cache.get(cache.crop_key("trocr", "torch|none", _text_crop())) == ("Max Muster", 0.9)
+    assert cache.get(cache.crop_key("tesseract", "crop|eng", _text_crop())) is None
+    assert cache.get(cache.crop_key("trocr", "torch|none", _text_crop(noise=3))) is None
+    assert cache.stats()['hits'] == 1
+
+
+def test_perceptual_cache_tolerates_noise():
+    cache = OCRCache(max_entries=8, path=None, hash_mode="perceptual", tolerance=8, enabled=True)
+    cache.put(cache.crop_key("trocr", "torch|none", _text_crop()), "Max Muster", 0.9)
+
+    assert cache.get(cache.crop_key("trocr", "torch|none", _text_crop(noise=3))) == ("Max Muster", 0.9)
+    assert cache.get(cache.crop_key("trocr", "torch|none", _text_crop(shift=12))) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_disabled_cache_never_hits():
+    cache = OCRCache(enabled=False)
+    key = cache.crop_key("trocr", "torch|none", _text_crop())
+    cache.put(key, "Max", 0.9)
+    assert cache.get(key) is None
+
+
+def test_perceptual_lookup_counts_once_and_needs_same_size():
+    cache = OCRCache(max_entries=8, path=None, hash_mode="perceptual", tolerance=8, enabled=True)
+    cache.put(cache.crop_key("trocr", "torch|none", _text_crop()), "Max Muster", 0.9)
+
+    assert cache.get(cache.crop_key("trocr", "torch|none", _text_crop(noise=3))) == ("Max Muster", 0.9)
+    assert cache.stats()['misses'] == 0
+    assert cache.get(cache.crop_key("trocr", "torch|none", _text_crop()[:, :-1])) is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
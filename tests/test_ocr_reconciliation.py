@@ -0,0 +1,52 @@
+from ocr_reconciliation import reconcile_ocr_results, match_tesseract_results, text_similarity
+
+
+def test_text_similarity():
+    assert text_similarity("Max Muster", " max muster ") == 1.0
+    assert text_similarity("", "Max") == 0.0
+    assert 0.0 < text_similarity("Muster", "Mustor") < 1.0
+
+
+def test_one_result_per_box_with_alternatives():
+    trocr_results = [("Max Mustor", (10, 10, 120, 30)), ("", (200, 10, 260, 30))]
+    tesseract_results = [
+        ("Muster", (60, 12, 110, 28)),
+        ("Max", (12, 12, 50, 28)),
+        ("12.03.2021", (200, 12, 258, 28)),
+        ("Olympus", (400, 50, 460, 70)),
+    ]
+    results, confidences, metadata = reconcile_ocr_results(
+        trocr_results, [0.6, 0.0], tesseract_results, [90.0, 80.0, 70.0, 95.0],
+        min_overlap=0.5, agreement_bonus=0.2
+    )
+
+    # Tesseract words are joined in reading order and win on confidence plus agreement
+    assert results == [
+        ("Max Muster", (10, 10, 120, 30)),
+        ("12.03.2021", (200, 10, 260, 30)),
+        ("Olympus", (400, 50, 460, 70)),
+    ]
+    assert confidences == [0.85, 0.7, 0.95]
+    assert metadata[0]["engine"] == "tesseract"
+    assert [alternative["text"] for alternative in metadata[0]["alternatives"]] == ["Max Mustor"]
+    # An empty TrOCR text never wins
+    assert metadata[1]["alternatives"][0]["engine"] == "trocr"
+
+
+def test_agreement_bonus_can_decide():
+    trocr_results = [("Anna", (0, 0, 50, 20))]
+    tesseract_results = [("Anna", (2, 2, 48, 18))]
+    results, confidences, metadata = reconcile_ocr_results(
+        trocr_results, [0.7], tesseract_results, [65.0], min_overlap=0.5, agreement_bonus=0.2
+    )
+    assert results == [("Anna", (0, 0, 50, 20))]
+    assert metadata[0]["engine"] == "trocr"
+    assert metadata[0]["alternatives"][0]["score"] == 0.65 + 0.2
+
+
+def test_match_tesseract_results_per_box():
+    boxes = [(10, 10, 120, 30), (200, 10, 260, 30)]
+    tesseract_results = [("Muster", (60, 12, 110, 28)), ("Max", (12, 12, 50, 28)), ("Olympus", (400, 50, 460, 70))]
+    matched_texts, unmatched = match_tesseract_results(boxes, tesseract_results, [90.0, 80.0, 95.0], min_overlap=0.5)
+    assert matched_texts == [("Max Muster", 85.0), None]
+    assert unmatched == [2]
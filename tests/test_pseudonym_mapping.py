@@ -0,0 +1,40 @@
+from pseudonym_mapping import PseudonymMapper, normalize_name
+
+POOL = tuple(f"Name{i}" for i in range(1000))
+
+
+def test_normalize_name_folds_ocr_variants():
+    assert normalize_name("  MAX   Müller ") == normalize_name("Max Mu11er") == "max muller"
+
+
+def test_document_scope_is_stable_per_document():
+    mapper = PseudonymMapper(scope="document", secret="test")
+    mapper.begin_document("exam_1.mp4")
+    first = mapper.choose("Max Mustermann", POOL, "male_first")
+    assert mapper.choose("MAX  MUSTERMANN", POOL, "male_first") == first
+    # Independent choices per pool
+    assert [mapper.choose("Max Mustermann", POOL, pool) for pool in ("male_first", "male_last", "male_full")] != [first] * 3
+
+    mapper.begin_document("exam_2.mp4")
+    others = {mapper.choose("Max Mustermann", POOL, f"pool{i}") for i in range(10)}
+    mapper.begin_document("exam_1.mp4")
+    assert {mapper.choose("Max Mustermann", POOL, f"pool{i}") for i in range(10)} != others
+
+
+def test_global_scope_depends_only_on_secret(tmp_path):
+    store = tmp_path / "pseudonyms.sqlite"
+    first = PseudonymMapper(scope="global", secret="secret", store_path=store)
+    first.begin_document("a.pdf")
+    second = PseudonymMapper(scope="global", secret="secret")
+    second.begin_document("b.pdf")
+    other_secret = PseudonymMapper(scope="global", secret="other")
+
+    names = [f"Patient {given} {family}" for given in ("Anna", "Max", "Jan", "Eva") for family in ("Weber", "Koch", "Wolf", "Braun", "Klein")]
+    chosen = [first.choose(name, POOL, "neutral_full") for name in names]
+    assert [second.choose(name, POOL, "neutral_full") for name in names] == chosen
+    assert [other_secret.choose(name, POOL, "neutral_full") for name in names] != chosen
+
+    # The store keeps the choices, keyed by the hash and not by the real name
+    first.store.close()
+    assert "Patient" not in store.read_bytes().decode("utf-8", "ignore")
+    assert first.stats()['misses'] == len(names)
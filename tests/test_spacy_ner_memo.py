@@ -0,0 +1,42 @@
+import re
+from types import SimpleNamespace
+import pytest
+
+spacy_NER = pytest.importorskip("spacy_NER")
+
+
+class FakeNLP:
+    """Finds Max Mustermann (with OCR confusables) as PER and counts the texts passed to it."""
+    meta = {"lang": "de", "name": "fake", "version": "0"}
+
+    def __init__(self):
+        self.texts = []
+
+    def pipe(self, texts, batch_size=None):
+        for text in texts:
+            self.texts.append(text)
+            ents = [SimpleNamespace(text=match.group(), start_char=match.start(), end_char=match.end(), label_="PER")
+                    for match in re.finditer(r"Max\s+Mu[s5]termann", text)]
+            yield SimpleNamespace(ents=ents)
+
+
+def test_memo_reslices_entities_of_variants(monkeypatch):
+    nlp = FakeNLP()
+    monkeypatch.setattr(spacy_NER, "get_nlp", lambda profile=None: nlp)
+    spacy_NER.ner_memo.clear()
+
+    # Both variants share one key, extra whitespace and the confusable 5 are normalized
+    first, variant, later = "Patient:  Max Mustermann", "Patient: Max  Mu5termann", "Patient: Max Mu5termann"
+    assert spacy_NER.normalize_phrase(first) == spacy_NER.normalize_phrase(variant) == spacy_NER.normalize_phrase(later)
+
+    results = spacy_NER.NER_German_batch([first, variant])
+    assert nlp.texts == [first]
+    assert results == [[("Max Mustermann", 10, 24, "PER")], [("Max  Mu5termann", 9, 24, "PER")]]
+
+    # A later memo hit is sliced from its own text as well
+    assert spacy_NER.NER_German_batch([later]) == [[("Max Mu5termann", 9, 23, "PER")]]
+    assert nlp.texts == [first]
+
+    # Case is part of the key
+    spacy_NER.NER_German_batch(["PATIENT: MAX MUSTERMANN"])
+    assert nlp.texts == [first, "PATIENT: MAX MUSTERMANN"]